@@ -1,12 +1,21 @@
 import os
 import time
+import asyncio
 import pytz
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Depends, Request, Form
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Depends, Request, Response, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+
+# Respostas JSON serializadas com orjson quando disponível (mais rápido que o json padrão)
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    FastJSONResponse = JSONResponse
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
 import uvicorn
 import logging
@@ -30,11 +39,25 @@ try:
 except Exception as e:
     logger.warning(f"Aviso: Não foi possível carregar o arquivo .env: {str(e)}")
 
-from monitor import monitor_stories, process_story_item
-from database import get_db, Cupom, get_latest_cupons, save_cupom, mark_cupom_sent
-from scrapers import run_all_scrapers
-from coupon_extractor import extract_with_vision
-from webhook import send_to_webhook
+from monitor import (
+    monitor_stories_exclusive, process_story_item_async, get_stories_async, story_poller, stories_fetcher,
+    ADAPTIVE_POLLING_ENABLED, POLL_TICK_SECONDS
+)
+from database import (
+    get_db, get_latest_cupons, save_cupom, mark_cupom_sent, get_known_codes_stats,
+    get_outbox_stats, get_cupom_deliveries, get_webhook_status, list_cupons,
+    data_version, list_perfis, save_perfil, delete_perfil, get_cupom, list_unsent_cupons
+)
+from scrapers import run_all_scrapers, get_scraper_stats
+from response_cache import response_cache, RESPONSE_CACHE_ENABLED, STATUS_CACHE_TTL_SECONDS
+from cupom_stream import cupom_broadcaster
+from leader import SchedulerLeader, run_exclusive
+from http_client import get_http_stats, async_http_client
+from coupon_extractor import extract_with_vision_async, get_prescreen_stats, get_vision_tier_stats
+from webhook import (
+    send_to_webhook_async, send_batch_to_webhook_async, enqueue_cupom, start_outbox_dispatchers, stop_outbox_dispatchers,
+    subscribers, WEBHOOK_OUTBOX_ENABLED
+)
 
 app = FastAPI(
     title="Shopee Cupom Monitor",
@@ -53,59 +76,78 @@ app.add_middleware(
 
 # Fuso horário de Brasília
 BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
+# Maior página de /api/cupons; valores maiores de limit são reduzidos a ele
+CUPONS_MAX_LIMIT = 500
 
-# Criar o scheduler com fuso horário do Brasil
-scheduler = BackgroundScheduler(timezone=BRAZIL_TZ)
+# Criar o scheduler com fuso horário do Brasil. Cada job roda no máximo uma vez por
+# vez e execuções atrasadas acumuladas viram uma só
+scheduler = BackgroundScheduler(
+    timezone=BRAZIL_TZ,
+    job_defaults={"max_instances": 1, "coalesce": True, "misfire_grace_time": 60}
+)
+# Com vários workers, só o processo líder executa os jobs
+scheduler_leader = SchedulerLeader(scheduler)
 
 # Configurar tarefas agendadas
-# Monitora 10min antes e 10min depois de cada hora entre 9h e 0h
-for hour in range(9, 24):
-    # 10 minutos antes de cada hora
+if ADAPTIVE_POLLING_ENABLED:
+    # Um único job verifica periodicamente se já é hora de consultar os stories;
+    # o intervalo se adapta à hora cheia, a stories novos e ao orçamento diário
     scheduler.add_job(
-        monitor_stories,
-        CronTrigger(hour=hour, minute=50, timezone=BRAZIL_TZ),
-        id=f"monitor_pre_{hour}"
+        story_poller.tick,
+        IntervalTrigger(seconds=POLL_TICK_SECONDS, timezone=BRAZIL_TZ),
+        id="monitor_adaptive"
     )
+else:
+    # Monitora 10min antes e 10min depois de cada hora entre 9h e 0h
+    for hour in range(9, 24):
+        # 10 minutos antes de cada hora
+        scheduler.add_job(
+            monitor_stories_exclusive,
+            CronTrigger(hour=hour, minute=50, timezone=BRAZIL_TZ),
+            id=f"monitor_pre_{hour}"
+        )
     
-    # Na hora exata
-    scheduler.add_job(
-        monitor_stories,
-        CronTrigger(hour=hour, minute=0, timezone=BRAZIL_TZ),
-        id=f"monitor_exact_{hour}"
-    )
+        # Na hora exata
+        scheduler.add_job(
+            monitor_stories_exclusive,
+            CronTrigger(hour=hour, minute=0, timezone=BRAZIL_TZ),
+            id=f"monitor_exact_{hour}"
+        )
     
-    # 10 minutos depois de cada hora
+        # 10 minutos depois de cada hora
+        scheduler.add_job(
+            monitor_stories_exclusive,
+            CronTrigger(hour=hour, minute=10, timezone=BRAZIL_TZ),
+            id=f"monitor_post_{hour}"
+        )
+
+    # Adicionar meia-noite
     scheduler.add_job(
-        monitor_stories,
-        CronTrigger(hour=hour, minute=10, timezone=BRAZIL_TZ),
-        id=f"monitor_post_{hour}"
+        monitor_stories_exclusive,
+        CronTrigger(hour=0, minute=0, timezone=BRAZIL_TZ),
+        id="monitor_midnight"
     )
 
-# Adicionar meia-noite
-scheduler.add_job(
-    monitor_stories,
-    CronTrigger(hour=0, minute=0, timezone=BRAZIL_TZ),
-    id="monitor_midnight"
-)
-
-scheduler.add_job(
-    monitor_stories,
-    CronTrigger(hour=0, minute=10, timezone=BRAZIL_TZ),
-    id="monitor_post_midnight"
-)
+    scheduler.add_job(
+        monitor_stories_exclusive,
+        CronTrigger(hour=0, minute=10, timezone=BRAZIL_TZ),
+        id="monitor_post_midnight"
+    )
 
 # Adicionar job para scraping de sites
 # Roda a cada 1 hora durante o dia
 for hour in range(9, 24):
     scheduler.add_job(
-        run_all_scrapers,
+        run_exclusive,
         CronTrigger(hour=hour, minute=30, timezone=BRAZIL_TZ),
+        args=["run_all_scrapers", run_all_scrapers],
         id=f"scraper_{hour}"
     )
 
 # Rodar scrapers na inicialização
 scheduler.add_job(
-    run_all_scrapers,
+    run_exclusive,
+    args=["run_all_scrapers", run_all_scrapers],
     id="initial_scraping",
     trigger="date",
     run_date=datetime.now(BRAZIL_TZ) + timedelta(seconds=30)
@@ -114,15 +156,23 @@ scheduler.add_job(
 # Iniciar o scheduler quando o app iniciar
 @app.on_event("startup")
 def startup_event():
-    scheduler.start()
+    scheduler_leader.start()
+    if WEBHOOK_OUTBOX_ENABLED:
+        start_outbox_dispatchers()
     logger.info(f"Aplicação iniciada e scheduler configurado - Horário Brasil: {datetime.now(BRAZIL_TZ).strftime('%Y-%m-%d %H:%M:%S')}")
 
 # Parar o scheduler quando o app for encerrado
 @app.on_event("shutdown")
 def shutdown_event():
-    scheduler.shutdown()
+    scheduler_leader.stop()
+    if WEBHOOK_OUTBOX_ENABLED:
+        stop_outbox_dispatchers()
     logger.info("Aplicação encerrada e scheduler desligado")
 
+@app.on_event("shutdown")
+async def close_async_http_client():
+    await async_http_client.aclose()
+
 # Endpoints da API
 @app.get("/")
 def read_root():
@@ -142,17 +192,38 @@ def view_cupons():
 @app.post("/monitor")
 def trigger_monitor(background_tasks: BackgroundTasks):
     """Endpoint para iniciar o monitoramento manualmente"""
-    background_tasks.add_task(monitor_stories)
+    # Pelo poller a consulta manual também conta no orçamento diário da API
+    background_tasks.add_task(story_poller.run if ADAPTIVE_POLLING_ENABLED else monitor_stories_exclusive)
     return {"status": "monitoramento iniciado"}
 
 @app.post("/scrape")
 def trigger_scrape(background_tasks: BackgroundTasks):
     """Endpoint para iniciar o scraping manualmente"""
-    background_tasks.add_task(run_all_scrapers)
+    background_tasks.add_task(run_exclusive, "run_all_scrapers", run_all_scrapers)
     return {"status": "scraping iniciado"}
 
+@app.get("/test-stories")
+async def test_stories(username: str = None):
+    """
+    Consulta os stories atuais de um perfil (padrão: o primeiro de INSTAGRAM_USERNAME) sem processá-los
+    
+    A consulta não passa pelo poller, então não conta no orçamento diário da API.
+    """
+    stories = await get_stories_async(username)
+    if stories is None:
+        return {"status": "error", "message": "Erro ao buscar stories"}
+    return {
+        "status": "success",
+        "total": len(stories),
+        "stories": [{
+            "id": item.get("id"),
+            "taken_at": item.get("taken_at"),
+            "media_type": item.get("media_type")
+        } for item in stories]
+    }
+
 @app.post("/test-image-direct")
-def test_image_direct(image_url: str = Form(...)):
+async def test_image_direct(image_url: str = Form(...)):
     """
     Testa a extração de um cupom de uma URL de imagem diretamente,
     simulando um item de story do Instagram
@@ -170,9 +241,10 @@ def test_image_direct(image_url: str = Form(...)):
             "taken_at": int(time.time())
         }
         
-        # Usar a função process_story_item do monitor.py
+        # Usar a função process_story_item_async do monitor.py
         logger.info(f"Testando extração direta com imagem: {image_url}")
-        cupom_data = process_story_item(mock_story)
+        # O histórico de stories é ignorado para permitir testar a mesma imagem várias vezes
+        cupom_data = await process_story_item_async(mock_story, use_ledger=False)
         
         if cupom_data:
             logger.info(f"Cupom encontrado com sucesso: {cupom_data}")
@@ -218,18 +290,52 @@ def add_cupom_manual(
         logger.error(f"Erro ao adicionar cupom manual: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/perfis")
+def get_perfis():
+    """Lista os perfis do Instagram monitorados"""
+    return {"perfis": list_perfis()}
+
+@app.post("/perfis")
+def upsert_perfil(
+    username: str = Form(...),
+    prioridade: int = Form(None),
+    intervalo_minimo: int = Form(None),
+    ativo: bool = Form(None)
+):
+    """Cadastra um perfil para monitorar ou altera prioridade, intervalo mínimo (segundos) e ativação"""
+    try:
+        perfil = save_perfil(
+            username.strip().lstrip("@"),
+            ativo=ativo,
+            prioridade=prioridade,
+            intervalo_minimo=intervalo_minimo
+        )
+        logger.info(f"Perfil salvo: {perfil}")
+        return {"status": "success", "perfil": perfil}
+    except Exception as e:
+        logger.error(f"Erro ao salvar perfil: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@app.delete("/perfis/{username}")
+def remove_perfil(username: str):
+    """Remove um perfil da lista de monitorados"""
+    if not delete_perfil(username):
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return {"status": "success", "message": f"Perfil {username} removido"}
+
 @app.post("/test-vision")
-def test_vision_api(image_url: str = Form(...)):
+async def test_vision_api(image_url: str = Form(...)):
     """Testa a extração de cupom usando a API Vision"""
     try:
         # Usar a função de extração com Vision
-        result = extract_with_vision(image_url)
+        result = await extract_with_vision_async(image_url)
         
         if result.get("success"):
             # Se encontrou um cupom, tentar salvá-lo
             codigo = result.get("codigo")
             if codigo:
-                save_cupom(
+                await asyncio.to_thread(
+                    save_cupom,
                     codigo=codigo,
                     descricao=result.get("descricao"),
                     valor_desconto=result.get("valor_desconto"),
@@ -246,41 +352,123 @@ def test_vision_api(image_url: str = Form(...)):
         logger.error(f"Erro ao testar extração via Vision: {str(e)}")
         return {"status": "error", "message": str(e)}
 
-@app.get("/api/cupons")
-def get_cupons(db=Depends(get_db), origem: str = None, limit: int = 50):
-    """Retorna todos os cupons encontrados como JSON"""
-    query = db.query(Cupom).order_by(Cupom.data_criacao.desc())
+def cached_response(request, build, ttl=None):
+    """
+    Responde a partir do cache de respostas ou monta a resposta com build()
     
-    if origem:
-        query = query.filter(Cupom.origem == origem)
+    A chave é o caminho mais os parâmetros da query. O item vale enquanto a versão
+    dos dados não mudar (e até o ttl, se informado). Com If-None-Match igual ao
+    ETag da resposta atual devolve 304 sem corpo.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return build()
         
-    cupons = query.limit(limit).all()
-    return [cupom.to_dict() for cupom in cupons]
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    # A versão é lida antes de montar a resposta: se houver uma escrita no meio,
+    # o item já nasce desatualizado em vez de servir dados velhos
+    versao = data_version()
+    item = response_cache.get(key, versao)
+    if item is None:
+        response = build()
+        if not isinstance(response, Response) or response.status_code != 200:
+            return response
+        headers = {nome: valor for nome, valor in response.headers.items() if nome.startswith("x-")}
+        item = response_cache.set(key, versao, response.body, response.media_type, headers, ttl)
+        
+    headers = {**item.headers, "ETag": item.etag, "Cache-Control": "no-cache"}
+    if item.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=item.body, media_type=item.media_type, headers=headers)
+
+@app.get("/api/cupons", response_class=FastJSONResponse)
+def get_cupons(
+    request: Request,
+    origem: str = None,
+    enviado: bool = None,
+    limit: int = Query(50, ge=1),
+    after: str = None,
+    before: str = None,
+    fields: str = None
+):
+    """
+    Retorna os cupons encontrados como JSON, do mais recente para o mais antigo
+    
+    A paginação é por cursor: os headers X-Next-Cursor e X-Prev-Cursor trazem os
+    valores a passar em after= (página seguinte) e before= (página anterior).
+    fields= limita os campos devolvidos (ex.: fields=codigo,data_criacao). limit
+    acima de CUPONS_MAX_LIMIT é reduzido a ele; o restante vem nas páginas seguintes.
+    """
+    if after and before:
+        raise HTTPException(status_code=400, detail="Use apenas um de after ou before")
+    limit = min(limit, CUPONS_MAX_LIMIT)
+        
+    return cached_response(request, lambda: _cupons_response(origem, enviado, limit, after, before, fields))
+
+def _cupons_response(origem, enviado, limit, after, before, fields):
+    try:
+        cupons, proximo, anterior = list_cupons(
+            limit=limit, origem=origem, enviado=enviado, after=after, before=before, fields=fields
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+        
+    # As linhas já saem prontas para JSON, então a resposta é montada direto,
+    # sem passar pelo encoder genérico do FastAPI
+    headers = {}
+    if proximo:
+        headers["X-Next-Cursor"] = proximo
+    if anterior:
+        headers["X-Prev-Cursor"] = anterior
+    return FastJSONResponse(content=cupons, headers=headers)
+
+@app.get("/api/cupons/stream")
+async def stream_cupons(request: Request, last_event_id: int = None):
+    """
+    Stream (Server-Sent Events) dos cupons novos, enviados assim que são gravados
+    
+    Cada evento tem o id do cupom. Ao reconectar, o navegador manda o header
+    Last-Event-ID e os cupons gravados nesse meio tempo são reenviados; last_event_id
+    na query faz o mesmo na primeira conexão.
+    """
+    inicio = last_event_id
+    header = request.headers.get("last-event-id")
+    if header:
+        try:
+            inicio = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID inválido")
+            
+    return StreamingResponse(
+        cupom_broadcaster.stream(request, inicio),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/webhook/send-cupom")
-def send_cupom_webhook(codigo: str = Form(...)):
+async def send_cupom_webhook(codigo: str = Form(...)):
     """Envia um cupom específico para o webhook"""
     try:
-        db = get_db()
-        cupom = db.query(Cupom).filter(Cupom.codigo == codigo).first()
+        # Consultas ao banco em uma thread para não bloquear o event loop; cada
+        # chamada abre a própria sessão na thread em que roda e devolve dicts
+        cupom = await asyncio.to_thread(get_cupom, codigo)
         
         if not cupom:
             return {"status": "error", "message": "Cupom não encontrado"}
         
         # Preparar dados para o webhook
         cupom_data = {
-            "codigo": cupom.codigo,
-            "horario": cupom.horario,
-            "imagem_url": cupom.imagem_url
+            "codigo": cupom["codigo"],
+            "horario": cupom["horario"],
+            "imagem_url": cupom["imagem_url"]
         }
         
         # Enviar para o webhook
-        webhook_success = send_to_webhook(cupom_data)
+        webhook_success = await send_to_webhook_async(cupom_data)
         
         if webhook_success:
             # Marcar como enviado no banco de dados
-            mark_cupom_sent(cupom.codigo)
-            return {"status": "success", "message": f"Cupom {cupom.codigo} enviado com sucesso para o webhook"}
+            await asyncio.to_thread(mark_cupom_sent, cupom["codigo"])
+            return {"status": "success", "message": f"Cupom {cupom['codigo']} enviado com sucesso para o webhook"}
         else:
             return {"status": "error", "message": "Erro ao enviar para webhook"}
     
@@ -289,11 +477,10 @@ def send_cupom_webhook(codigo: str = Form(...)):
         return {"status": "error", "message": str(e)}
 
 @app.post("/webhook/send-all")
-def send_all_cupons_webhook():
+async def send_all_cupons_webhook():
     """Envia todos os cupons não enviados para o webhook"""
     try:
-        db = get_db()
-        cupons = db.query(Cupom).filter(Cupom.enviado == False).all()
+        cupons = await asyncio.to_thread(list_unsent_cupons)
         
         if not cupons:
             return {"status": "info", "message": "Não há cupons pendentes para enviar"}
@@ -301,24 +488,28 @@ def send_all_cupons_webhook():
         total = len(cupons)
         success = 0
         
-        for cupom in cupons:
-            # Preparar dados para o webhook
-            cupom_data = {
-                "codigo": cupom.codigo,
-                "horario": cupom.horario,
-                "imagem_url": cupom.imagem_url
+        if WEBHOOK_OUTBOX_ENABLED:
+            # Enfileirar todos; o worker da fila entrega em paralelo e com novas tentativas
+            def enfileirar():
+                return sum(1 for cupom in cupons if enqueue_cupom(cupom))
+            success = await asyncio.to_thread(enfileirar)
+            return {
+                "status": "success",
+                "message": f"{success} de {total} cupons enfileirados para envio ao webhook"
             }
-            
-            # Enviar para o webhook
-            webhook_success = send_to_webhook(cupom_data)
-            
-            if webhook_success:
-                # Marcar como enviado no banco de dados
-                mark_cupom_sent(cupom.codigo)
-                success += 1
-                logger.info(f"Cupom {cupom.codigo} enviado com sucesso para o webhook")
-            else:
-                logger.error(f"Erro ao enviar cupom {cupom.codigo} para webhook")
+        
+        # Preparar dados para o webhook; destinos em modo digest recebem os cupons agrupados
+        cupons_data = [{
+            "codigo": cupom["codigo"],
+            "horario": cupom["horario"],
+            "imagem_url": cupom["imagem_url"]
+        } for cupom in cupons]
+        
+        for codigo in await send_batch_to_webhook_async(cupons_data):
+            # Marcar como enviado no banco de dados
+            await asyncio.to_thread(mark_cupom_sent, codigo)
+            success += 1
+            logger.info(f"Cupom {codigo} enviado com sucesso para o webhook")
         
         return {
             "status": "success", 
@@ -329,37 +520,58 @@ def send_all_cupons_webhook():
         logger.error(f"Erro ao enviar cupons para webhook: {str(e)}")
         return {"status": "error", "message": str(e)}
 
-@app.get("/webhook/status")
-def webhook_status():
-    """Retorna o status de envio dos cupons para o webhook"""
+@app.get("/webhook/status", response_class=FastJSONResponse)
+def webhook_status(
+    request: Request,
+    resumo: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    fields: str = None
+):
+    """
+    Retorna o status de envio dos cupons para o webhook
+    
+    Com resumo=true devolve apenas as contagens; caso contrário inclui os últimos
+    enviados e uma página (limit/offset) dos cupons pendentes, com os campos
+    escolhidos em fields=.
+    """
+    return cached_response(request, lambda: _webhook_status_response(resumo, limit, offset, fields))
+
+def _webhook_status_response(resumo, limit, offset, fields):
+    try:
+        status = get_webhook_status(limit=limit, offset=offset, resumo=resumo, fields=fields)
+        status["destinos"] = [subscriber.nome for subscriber in subscribers]
+        status["fila"] = get_outbox_stats()
+        return FastJSONResponse(content={"status": "success", **status})
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao obter status do webhook: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/webhook/status/{codigo}")
+def webhook_cupom_status(codigo: str):
+    """Retorna o status de entrega de um cupom em cada destino do webhook"""
     try:
-        db = get_db()
-        total_cupons = db.query(Cupom).count()
-        enviados = db.query(Cupom).filter(Cupom.enviado == True).count()
-        pendentes = db.query(Cupom).filter(Cupom.enviado == False).count()
-        
-        # Listar os últimos 5 cupons enviados
-        ultimos_enviados = db.query(Cupom).filter(Cupom.enviado == True).order_by(Cupom.data_criacao.desc()).limit(5).all()
-        
-        # Listar os cupons pendentes de envio
-        cupons_pendentes = db.query(Cupom).filter(Cupom.enviado == False).order_by(Cupom.data_criacao.desc()).all()
-        
         return {
             "status": "success",
-            "total_cupons": total_cupons,
-            "enviados": enviados,
-            "pendentes": pendentes,
-            "ultimos_enviados": [c.to_dict() for c in ultimos_enviados],
-            "cupons_pendentes": [c.to_dict() for c in cupons_pendentes]
+            "codigo": codigo,
+            "entregas": get_cupom_deliveries(codigo)
         }
     
     except Exception as e:
-        logger.error(f"Erro ao obter status do webhook: {str(e)}")
+        logger.error(f"Erro ao obter status de entrega do cupom {codigo}: {str(e)}")
         return {"status": "error", "message": str(e)}
 
-@app.get("/status")
-def get_status():
+@app.get("/status", response_class=FastJSONResponse)
+def get_status(request: Request):
     """Retorna o status do serviço"""
+    # Além do banco, o status depende do scheduler e de contadores em memória,
+    # então o cache também expira por tempo
+    return cached_response(request, _status_response, ttl=STATUS_CACHE_TTL_SECONDS)
+
+def _status_response():
     jobs = scheduler.get_jobs()
     
     # Formatar informações das tarefas agendadas
@@ -371,14 +583,24 @@ def get_status():
             "next_run": next_run
         })
         
-    return {
+    return FastJSONResponse(content={
         "status": "online",
         "scheduler_running": scheduler.running,
         "jobs_count": len(jobs),
         "next_jobs": jobs_info[:5],  # Mostra apenas os próximos 5 jobs
+        "prescreen": get_prescreen_stats(),
+        "vision_tiers": get_vision_tier_stats(),
+        "known_codes": get_known_codes_stats(),
+        "response_cache": response_cache.stats(),
+        "stream_clients": cupom_broadcaster.clientes,
+        "polling": story_poller.stats(),
+        "stories_fetch": stories_fetcher.stats(),
+        "scrapers": get_scraper_stats(),
+        "scheduler_leader": scheduler_leader.stats(),
+        "http": get_http_stats(),
         "current_time": datetime.now(BRAZIL_TZ).isoformat(),
         "timezone": "America/Sao_Paulo (GMT-3)"
-    }
+    })
 
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -1,10 +1,19 @@
 import os
+import io
 import re
 import json
-import requests
+import time
+import asyncio
+import base64
+import hashlib
+import threading
 import openai
+from collections import OrderedDict
+from PIL import Image, ImageChops, ImageFilter
 from dotenv import load_dotenv
 
+from http_client import http_client, async_http_client
+
 # Tentar carregar o arquivo .env, mas não falhar se não existir
 try:
     load_dotenv()
@@ -14,12 +23,401 @@ except Exception as e:
 # Configurar a API key
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def extract_with_vision(image_url):
+# Cache de resultados da Vision API. Cupons encontrados só são reaproveitados para a mesma
+# imagem (hash do conteúdo); o hash perceptual só reaproveita resultados "sem cupom"
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "true").lower() == "true"
+VISION_CACHE_MAX_ITEMS = int(os.getenv("VISION_CACHE_MAX_ITEMS", "256"))
+VISION_CACHE_TTL_HOURS = float(os.getenv("VISION_CACHE_TTL_HOURS", "48"))
+# Distância de Hamming máxima (em bits, de 256) para considerar duas imagens candidatas
+VISION_CACHE_MAX_DISTANCE = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "24"))
+# Diferença média máxima (0-255) permitida em qualquer bloco da miniatura. Nem o hash nem
+# os blocos distinguem artes iguais com códigos diferentes (ex: SHOPEE10 x SHOPEE15), por
+# isso a comparação perceptual nunca devolve um cupom encontrado em outra imagem.
+VISION_CACHE_MAX_BLOCK_DIFF = int(os.getenv("VISION_CACHE_MAX_BLOCK_DIFF", "16"))
+
+# Pré-triagem local: descarta imagens com pouca chance de conter cupom antes da Vision API.
+# Desligada por padrão: a pontuação é heurística e deve ser calibrada com stories reais
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "false").lower() == "true"
+# Pontuação mínima (0 a 1) para a imagem seguir para a Vision API
+PRESCREEN_THRESHOLD = float(os.getenv("PRESCREEN_THRESHOLD", "0.3"))
+
+# Pré-processamento: a imagem é reduzida (e opcionalmente recortada) e enviada em base64
+VISION_INLINE_IMAGES = os.getenv("VISION_INLINE_IMAGES", "true").lower() == "true"
+# Maior lado da imagem enviada para a Vision API, em pixels
+VISION_IMAGE_MAX_SIDE = int(os.getenv("VISION_IMAGE_MAX_SIDE", "768"))
+# Nível de detalhe da Vision API: low, high ou auto
+VISION_IMAGE_DETAIL = os.getenv("VISION_IMAGE_DETAIL", "auto")
+# Recorte opcional da região do cupom em frações da imagem: "esquerda,topo,direita,base"
+VISION_CROP_BOX = os.getenv("VISION_CROP_BOX", "")
+# Diretório e limite de arquivos do cache em disco das imagens
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "images")
+IMAGE_CACHE_MAX_FILES = int(os.getenv("IMAGE_CACHE_MAX_FILES", "500"))
+
+# Quantidade de imagens por requisição em lote para a Vision API (1 = uma por requisição)
+VISION_BATCH_SIZE = int(os.getenv("VISION_BATCH_SIZE", "1"))
+
+# Roteamento em camadas: primeira passada barata, segunda com mais detalhe só quando
+# o código não passa na validação ou o modelo informa baixa confiança
+VISION_TIERED = os.getenv("VISION_TIERED", "true").lower() == "true"
+VISION_TIER1_MODEL = os.getenv("VISION_TIER1_MODEL", "gpt-4o")
+VISION_TIER1_DETAIL = os.getenv("VISION_TIER1_DETAIL", "low")
+VISION_TIER2_MODEL = os.getenv("VISION_TIER2_MODEL", "gpt-4o")
+VISION_TIER2_DETAIL = os.getenv("VISION_TIER2_DETAIL", "high")
+# Confiança mínima (0 a 1) informada pelo modelo para aceitar a primeira passada
+VISION_MIN_CONFIDENCE = float(os.getenv("VISION_MIN_CONFIDENCE", "0.7"))
+
+# Formato esperado dos códigos de cupom da Shopee
+CODIGO_PATTERN = re.compile(r'^[A-Z0-9]{7,12}$')
+
+HASH_SIZE = 16
+THUMBNAIL_SIZE = (90, 160)
+PRESCREEN_SIZE = (180, 320)
+
+class ImageFingerprint:
+    """Hash do conteúdo, hash perceptual (dHash de 256 bits) e miniatura em tons de cinza de uma imagem"""
+    
+    def __init__(self, image_hash, thumbnail, content_hash=None):
+        self.image_hash = image_hash
+        self.thumbnail = thumbnail
+        self.content_hash = content_hash if content_hash is not None else f"{image_hash:064x}"
+        
+    def distance(self, other):
+        return bin(self.image_hash ^ other.image_hash).count("1")
+        
+    def block_difference(self, other):
+        """Maior diferença média entre blocos 5x5 correspondentes das miniaturas"""
+        diff = ImageChops.difference(self.thumbnail, other.thumbnail).reduce(5)
+        return diff.getextrema()[1]
+
+class VisionResultCache:
+    """
+    Cache LRU de resultados de extração indexado pela impressão digital da imagem.
+    
+    A mesma imagem (bytes idênticos, ex: o mesmo story com outra URL) reaproveita
+    qualquer resultado. Imagens só parecidas reaproveitam apenas resultados "sem
+    cupom": artes do mesmo template com códigos diferentes ficam a poucos bits de
+    distância, e devolver o código de uma para a outra perderia o cupom novo.
+    """
+    
+    def __init__(self, max_items, ttl_seconds, max_distance, max_block_diff):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.max_block_diff = max_block_diff
+        self._items = OrderedDict()  # hash do conteúdo -> (fingerprint, resultado, timestamp)
+        self._lock = threading.Lock()
+        
+    def _purge_expired(self, now):
+        expirados = [h for h, (_, _, ts) in self._items.items() if now - ts > self.ttl_seconds]
+        for h in expirados:
+            del self._items[h]
+            
+    def get(self, fingerprint):
+        """Retorna o resultado da mesma imagem ou, se for "sem cupom", de uma quase idêntica"""
+        with self._lock:
+            self._purge_expired(time.time())
+            
+            item = self._items.get(fingerprint.content_hash)
+            if item is not None:
+                self._items.move_to_end(fingerprint.content_hash)
+                return dict(item[1])
+            
+            candidatos = sorted(
+                (fingerprint.distance(fp), h) for h, (fp, result, _) in self._items.items()
+                if result.get("no_coupon")
+            )
+            for distancia, h in candidatos:
+                if distancia > self.max_distance:
+                    break
+                cached_fp, result, _ = self._items[h]
+                if fingerprint.block_difference(cached_fp) <= self.max_block_diff:
+                    self._items.move_to_end(h)
+                    return dict(result)
+            return None
+            
+    def put(self, fingerprint, result):
+        with self._lock:
+            self._items[fingerprint.content_hash] = (fingerprint, dict(result), time.time())
+            self._items.move_to_end(fingerprint.content_hash)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+_vision_cache = VisionResultCache(
+    max_items=VISION_CACHE_MAX_ITEMS,
+    ttl_seconds=VISION_CACHE_TTL_HOURS * 3600,
+    max_distance=VISION_CACHE_MAX_DISTANCE,
+    max_block_diff=VISION_CACHE_MAX_BLOCK_DIFF
+)
+
+def fetch_image_bytes(url):
+    """Baixa uma imagem e retorna seu conteúdo em bytes (ou None em caso de erro)"""
+    try:
+        response = http_client.get(url)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        print(f"Erro ao baixar imagem: {str(e)}")
+        return None
+
+async def fetch_image_bytes_async(url):
+    """Versão assíncrona de fetch_image_bytes"""
+    try:
+        response = await async_http_client.get(url)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        print(f"Erro ao baixar imagem: {str(e)}")
+        return None
+
+def compute_fingerprint(image_bytes):
+    """
+    Calcula a impressão digital perceptual de uma imagem.
+    Pequenas diferenças de compressão ou resolução geram impressões próximas.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            gray = image.convert("L")
+    except Exception as e:
+        print(f"Erro ao calcular hash da imagem: {str(e)}")
+        return None
+        
+    pixels = list(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    image_hash = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            image_hash = (image_hash << 1) | (1 if left > right else 0)
+            
+    thumbnail = gray.resize(THUMBNAIL_SIZE, Image.BILINEAR)
+    return ImageFingerprint(image_hash, thumbnail, hashlib.sha256(image_bytes).hexdigest())
+
+# Contadores da pré-triagem (rejeitadas = chamadas à Vision API economizadas)
+_prescreen_stats = {"analisadas": 0, "aprovadas": 0, "rejeitadas": 0}
+_prescreen_lock = threading.Lock()
+
+def score_coupon_likelihood(image_bytes):
+    """
+    Estima, só com CPU, a chance de uma imagem ser um story de cupom da Shopee.
+    
+    Combina três sinais do template dos cupons:
+    - proporção de pixels no laranja da Shopee
+    - faixas horizontais brancas (a caixa onde fica o código)
+    - densidade de bordas dentro dessas faixas (texto)
+    
+    Returns:
+        float: Pontuação entre 0 e 1 (ou None se a imagem não puder ser lida)
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            rgb = image.convert("RGB").resize(PRESCREEN_SIZE, Image.BILINEAR)
+    except Exception as e:
+        print(f"Erro ao abrir imagem para pré-triagem: {str(e)}")
+        return None
+        
+    width, height = rgb.size
+    pixels = list(rgb.getdata())
+    edges = list(rgb.convert("L").filter(ImageFilter.FIND_EDGES).getdata())
+    
+    orange = 0
+    white_rows = []
+    for y in range(height):
+        white = 0
+        for x in range(width):
+            r, g, b = pixels[y * width + x]
+            if r >= 200 and 40 <= g <= 150 and b <= 110 and r - g >= 80:
+                orange += 1
+            elif r >= 225 and g >= 225 and b >= 225:
+                white += 1
+        if white >= width * 0.5:
+            white_rows.append(y)
+            
+    orange_ratio = orange / float(width * height)
+    box_ratio = len(white_rows) / float(height)
+    
+    text_ratio = 0.0
+    if white_rows:
+        text_pixels = sum(
+            1 for y in white_rows for x in range(width) if edges[y * width + x] > 60
+        )
+        text_ratio = text_pixels / float(len(white_rows) * width)
+        
+    return (
+        0.4 * min(orange_ratio / 0.25, 1.0)
+        + 0.3 * min(box_ratio / 0.08, 1.0)
+        + 0.3 * min(text_ratio / 0.04, 1.0)
+    )
+
+def prescreen_image(image_bytes, threshold=None):
+    """
+    Decide se a imagem deve seguir para a Vision API
+    
+    Returns:
+        tuple: (aprovada, pontuação). Imagens que não puderem ser lidas são aprovadas.
+    """
+    if threshold is None:
+        threshold = PRESCREEN_THRESHOLD
+        
+    score = score_coupon_likelihood(image_bytes)
+    aprovada = score is None or score >= threshold
+    
+    with _prescreen_lock:
+        _prescreen_stats["analisadas"] += 1
+        _prescreen_stats["aprovadas" if aprovada else "rejeitadas"] += 1
+        
+    return aprovada, score
+
+def get_prescreen_stats():
+    """Retorna os contadores da pré-triagem"""
+    with _prescreen_lock:
+        stats = dict(_prescreen_stats)
+    stats["chamadas_economizadas"] = stats["rejeitadas"]
+    stats["threshold"] = PRESCREEN_THRESHOLD
+    stats["enabled"] = PRESCREEN_ENABLED
+    return stats
+
+def _parse_crop_box(value):
+    """Converte "0,0.2,1,0.8" em uma tupla de frações, ou None se não configurado"""
+    if not value:
+        return None
+    try:
+        left, top, right, bottom = [float(v) for v in value.split(",")]
+    except ValueError:
+        print(f"VISION_CROP_BOX inválido, ignorando: {value}")
+        return None
+    if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+        print(f"VISION_CROP_BOX fora do intervalo 0-1, ignorando: {value}")
+        return None
+    return left, top, right, bottom
+
+def _prune_image_cache():
+    """Mantém o cache em disco dentro do limite, removendo os arquivos mais antigos"""
+    try:
+        arquivos = [os.path.join(IMAGE_CACHE_DIR, f) for f in os.listdir(IMAGE_CACHE_DIR)]
+        if len(arquivos) <= IMAGE_CACHE_MAX_FILES:
+            return
+        arquivos.sort(key=os.path.getmtime)
+        for caminho in arquivos[:len(arquivos) - IMAGE_CACHE_MAX_FILES]:
+            os.remove(caminho)
+    except Exception as e:
+        print(f"Erro ao limpar cache de imagens: {str(e)}")
+
+def preprocess_image(image_bytes, max_side=None, crop_box=None):
+    """
+    Recorta e reduz a imagem antes de enviá-la para a Vision API
+    
+    O resultado fica em cache no disco, com nome baseado no hash do conteúdo
+    original e nos parâmetros usados.
+    
+    Args:
+        image_bytes: Conteúdo original da imagem
+        max_side: Maior lado da imagem resultante (padrão: VISION_IMAGE_MAX_SIDE)
+        crop_box: Frações (esquerda, topo, direita, base) a recortar (padrão: VISION_CROP_BOX)
+        
+    Returns:
+        bytes: Imagem JPEG processada (ou None em caso de erro)
+    """
+    if max_side is None:
+        max_side = VISION_IMAGE_MAX_SIDE
+    if crop_box is None:
+        crop_box = _parse_crop_box(VISION_CROP_BOX)
+        
+    chave = hashlib.sha256(image_bytes).hexdigest()[:32]
+    sufixo = f"{max_side}_" + ("_".join(f"{v:g}" for v in crop_box) if crop_box else "full")
+    caminho = os.path.join(IMAGE_CACHE_DIR, f"proc_{chave}_{sufixo}.jpg")
+    
+    if os.path.exists(caminho):
+        with open(caminho, "rb") as file:
+            return file.read()
+    
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = image.convert("RGB")
+            if crop_box:
+                width, height = image.size
+                left, top, right, bottom = crop_box
+                image = image.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=85, optimize=True)
+            processed = output.getvalue()
+    except Exception as e:
+        print(f"Erro ao pré-processar imagem: {str(e)}")
+        return None
+    
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        with open(caminho, "wb") as file:
+            file.write(processed)
+        _prune_image_cache()
+    except Exception as e:
+        print(f"Erro ao salvar imagem no cache: {str(e)}")
+        
+    return processed
+
+def to_data_url(image_bytes):
+    """Codifica uma imagem JPEG como data URL para envio inline"""
+    return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode("ascii")
+
+VISION_SYSTEM_PROMPT = (
+    "Você é um assistente especializado em extrair informações de cupons da Shopee. "
+    "Extraia apenas o código do cupom e, se visível, o horário."
+)
+
+def _prepare_vision_input(image_url, image_bytes=None, fetch=True):
+    """
+    Baixa a imagem (se necessário), consulta o cache perceptual e gera a entrada da Vision API
+    
+    Args:
+        fetch: Baixar a imagem quando image_bytes não for informado
+    
+    Returns:
+        tuple: (entrada para a API, impressão digital, resultado em cache ou None)
+    """
+    if fetch and image_bytes is None and (VISION_CACHE_ENABLED or VISION_INLINE_IMAGES):
+        image_bytes = fetch_image_bytes(image_url)
+        
+    fingerprint = None
+    if VISION_CACHE_ENABLED:
+        if image_bytes:
+            fingerprint = compute_fingerprint(image_bytes)
+            
+        if fingerprint is not None:
+            cached = _vision_cache.get(fingerprint)
+            if cached is not None:
+                print(f"Resultado reaproveitado do cache de imagens (hash {fingerprint.image_hash:064x})")
+                cached["cache_hit"] = True
+                return None, fingerprint, cached
+    
+    # Enviar a imagem reduzida em base64; sem ela, a OpenAI baixa a URL em resolução máxima
+    image_input = image_url
+    if VISION_INLINE_IMAGES and image_bytes:
+        processed = preprocess_image(image_bytes)
+        if processed:
+            image_input = to_data_url(processed)
+            
+    return image_input, fingerprint, None
+
+def _store_vision_result(fingerprint, result):
+    """Guarda apenas resultados definitivos; erros da API devem ser tentados de novo"""
+    if fingerprint is not None and (result.get("success") or result.get("no_coupon")):
+        _vision_cache.put(fingerprint, result)
+
+def extract_with_vision(image_url, image_bytes=None):
     """
     Extrair código de cupom de uma imagem usando OpenAI Vision
     
+    Antes de chamar a API, a imagem é baixada e comparada por hash perceptual com
+    as imagens já analisadas; se for a mesma arte, o resultado anterior é reaproveitado.
+    
     Args:
         image_url: URL da imagem a ser analisada
+        image_bytes: Conteúdo da imagem, se já tiver sido baixado
         
     Returns:
         dict: {
@@ -28,99 +426,396 @@ def extract_with_vision(image_url):
             'success': boolean indicando se a extração foi bem-sucedida
         }
     """
+    image_input, fingerprint, cached = _prepare_vision_input(image_url, image_bytes)
+    if cached is not None:
+        return cached
+    
+    result = _call_vision_tiered(image_input)
+    _store_vision_result(fingerprint, result)
+    return result
+
+async def extract_with_vision_async(image_url, image_bytes=None):
+    """
+    Versão assíncrona de extract_with_vision
+    
+    O download da imagem e a chamada à Vision API não bloqueiam o event loop; o
+    hash perceptual e a redução da imagem (CPU) rodam em uma thread.
+    """
+    if image_bytes is None and (VISION_CACHE_ENABLED or VISION_INLINE_IMAGES):
+        image_bytes = await fetch_image_bytes_async(image_url)
+        
+    image_input, fingerprint, cached = await asyncio.to_thread(_prepare_vision_input, image_url, image_bytes, False)
+    if cached is not None:
+        return cached
+    
+    result = await _call_vision_tiered_async(image_input)
+    _store_vision_result(fingerprint, result)
+    return result
+
+def extract_with_vision_batch(images, batch_size=None):
+    """
+    Extrai cupons de várias imagens enviando até batch_size imagens por requisição
+    
+    Imagens já presentes no cache perceptual não são reenviadas. Se a resposta de um
+    lote não puder ser interpretada, as imagens sem resultado são enviadas
+    individualmente, como em extract_with_vision.
+    
+    Args:
+        images: Lista de tuplas (image_url, image_bytes); image_bytes pode ser None
+        batch_size: Máximo de imagens por requisição (padrão: VISION_BATCH_SIZE)
+        
+    Returns:
+        list: Um resultado no formato de extract_with_vision para cada imagem, na mesma ordem
+    """
+    if batch_size is None:
+        batch_size = VISION_BATCH_SIZE
+    batch_size = max(1, batch_size)
+    
+    results = [None] * len(images)
+    pendentes = []  # (posição, entrada da API, impressão digital)
+    
+    for posicao, (image_url, image_bytes) in enumerate(images):
+        image_input, fingerprint, cached = _prepare_vision_input(image_url, image_bytes)
+        if cached is not None:
+            results[posicao] = cached
+        else:
+            pendentes.append((posicao, image_input, fingerprint))
+            
+    for inicio in range(0, len(pendentes), batch_size):
+        lote = pendentes[inicio:inicio + batch_size]
+        
+        batch_results = None
+        if len(lote) > 1:
+            if VISION_TIERED:
+                tier_model, tier_detail = VISION_TIER1_MODEL, VISION_TIER1_DETAIL
+            else:
+                tier_model, tier_detail = "gpt-4o", VISION_IMAGE_DETAIL
+            inicio_lote = time.time()
+            batch_results = _call_vision_api_batch(
+                [image_input for _, image_input, _ in lote], detail=tier_detail, model=tier_model
+            )
+            # Uma requisição para o lote inteiro: cada imagem responde pela sua parte da latência
+            latencia_imagem = (time.time() - inicio_lote) / len(lote)
+            
+        for indice, (posicao, image_input, fingerprint) in enumerate(lote):
+            result = batch_results.get(indice) if batch_results else None
+            if result is None:
+                # Fallback: chamada individual para a imagem sem resultado no lote
+                result = _call_vision_tiered(image_input)
+            elif VISION_TIERED:
+                # O lote equivale à primeira camada; imagens com resultado duvidoso sobem de camada
+                escalar = _needs_escalation(result)
+                _record_tier_stats(tier_model, tier_detail, latencia_imagem, aceito=not escalar)
+                if escalar:
+                    result, _ = _call_vision_tier(image_input, VISION_TIER2_MODEL, VISION_TIER2_DETAIL, final=True)
+            _store_vision_result(fingerprint, result)
+            results[posicao] = result
+            
+    return results
+
+# Estatísticas por camada: chamadas, aceitas, escalonadas e latência acumulada
+_tier_stats = {}
+_tier_stats_lock = threading.Lock()
+
+def _record_tier_stats(model, detail, latencia, aceito):
+    chave = f"{model}:{detail}"
+    with _tier_stats_lock:
+        stats = _tier_stats.setdefault(chave, {"chamadas": 0, "aceitas": 0, "escalonadas": 0, "latencia_total": 0.0})
+        stats["chamadas"] += 1
+        stats["aceitas" if aceito else "escalonadas"] += 1
+        stats["latencia_total"] += latencia
+
+def get_vision_tier_stats():
+    """Retorna taxa de acerto e latência média de cada camada da Vision API"""
+    with _tier_stats_lock:
+        snapshot = {chave: dict(stats) for chave, stats in _tier_stats.items()}
+    for stats in snapshot.values():
+        chamadas = stats["chamadas"]
+        stats["taxa_acerto"] = round(stats["aceitas"] / chamadas, 3) if chamadas else None
+        stats["latencia_media"] = round(stats["latencia_total"] / chamadas, 3) if chamadas else None
+        stats["latencia_total"] = round(stats["latencia_total"], 3)
+    return {"enabled": VISION_TIERED, "camadas": snapshot}
+
+def _needs_escalation(result):
+    """
+    Decide se o resultado da primeira camada precisa ser refeito com mais detalhe
+    
+    Sobe de camada quando o código não tem o formato esperado ou quando o modelo
+    informa confiança baixa. "Sem cupom" só sobe com confiança baixa: a maioria dos
+    stories não tem cupom e refazê-los todos dobraria as chamadas. Erros da API não
+    sobem de camada (serão tentados na próxima execução).
+    """
+    if not result.get("success") and not result.get("no_coupon"):
+        return False
+        
+    confianca = result.get("confianca")
+    if confianca is not None and confianca < VISION_MIN_CONFIDENCE:
+        return True
+        
+    if result.get("success"):
+        return not CODIGO_PATTERN.match(result.get("codigo") or "")
+        
+    return False
+
+def _call_vision_tier(image_input, model, detail, final=False):
+    """
+    Chama uma camada da Vision API e registra suas estatísticas
+    
+    Returns:
+        tuple: (resultado, se deve subir para a próxima camada)
+    """
+    inicio = time.time()
+    result = _call_vision_api(image_input, detail=detail, model=model)
+    return _finish_vision_tier(result, model, detail, inicio, final)
+
+async def _call_vision_tier_async(image_input, model, detail, final=False):
+    """Versão assíncrona de _call_vision_tier"""
+    inicio = time.time()
+    result = await _call_vision_api_async(image_input, detail=detail, model=model)
+    return _finish_vision_tier(result, model, detail, inicio, final)
+
+def _finish_vision_tier(result, model, detail, inicio, final):
+    escalar = not final and _needs_escalation(result)
+    erro = not result.get("success") and not result.get("no_coupon")
+    _record_tier_stats(model, detail, time.time() - inicio, aceito=not escalar and not erro)
+    result["tier"] = f"{model}:{detail}"
+    return result, escalar
+
+def _call_vision_tiered(image_input):
+    """
+    Extrai o cupom começando pela camada barata e subindo de camada se necessário
+    
+    Com VISION_TIERED desativado, faz uma única chamada com VISION_IMAGE_DETAIL.
+    """
+    if not VISION_TIERED:
+        return _call_vision_api(image_input)
+        
+    result, escalar = _call_vision_tier(image_input, VISION_TIER1_MODEL, VISION_TIER1_DETAIL)
+    if escalar:
+        print(f"Resultado da primeira camada não confiável ({result.get('codigo')}), escalonando")
+        result, _ = _call_vision_tier(image_input, VISION_TIER2_MODEL, VISION_TIER2_DETAIL, final=True)
+    return result
+
+async def _call_vision_tiered_async(image_input):
+    """Versão assíncrona de _call_vision_tiered"""
+    if not VISION_TIERED:
+        return await _call_vision_api_async(image_input)
+        
+    result, escalar = await _call_vision_tier_async(image_input, VISION_TIER1_MODEL, VISION_TIER1_DETAIL)
+    if escalar:
+        print(f"Resultado da primeira camada não confiável ({result.get('codigo')}), escalonando")
+        result, _ = await _call_vision_tier_async(image_input, VISION_TIER2_MODEL, VISION_TIER2_DETAIL, final=True)
+    return result
+
+def _parse_confidence(value):
+    """Converte a confiança informada pelo modelo em float entre 0 e 1 (ou None)"""
+    try:
+        confianca = float(value)
+    except (TypeError, ValueError):
+        return None
+    return min(max(confianca, 0.0), 1.0)
+
+def _build_extraction_result(result, content):
+    """Completa o resultado interpretado com descrição/valor e monta o retorno padrão"""
+    # Adicionar mais informações extraídas se disponíveis
+    descricao_match = re.search(r'(cupom exclusivo|por tempo limitado|frete gr[áa]tis)', content, re.IGNORECASE)
+    valor_match = re.search(r'(R\$\s*\d+|\d+%\s*OFF|\d+\s*REAIS)', content, re.IGNORECASE)
+    
+    result["descricao"] = descricao_match.group(0) if descricao_match else None
+    result["valor_desconto"] = valor_match.group(0) if valor_match else None
+    
+    confianca = _parse_confidence(result.get("confianca"))
+    
+    if result.get("codigo"):
+        return {
+            "codigo": result.get("codigo"),
+            "horario": result.get("horario"),
+            "descricao": result.get("descricao"),
+            "valor_desconto": result.get("valor_desconto"),
+            "confianca": confianca,
+            "success": True
+        }
+    else:
+        # no_coupon diferencia "imagem sem cupom" de falhas temporárias da API
+        return {"success": False, "no_coupon": True, "confianca": confianca, "error": "Código não encontrado na imagem"}
+
+def _vision_request(image_url, detail, model):
+    """Parâmetros da chamada à OpenAI Vision para uma imagem"""
+    return dict(
+        model=model, # gpt-4o por padrão, o modelo atual que suporta visão
+        messages=[
+            {
+                "role": "system",
+                "content": VISION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Analise esta imagem de um cupom da Shopee e extraia: 1) O código do cupom (geralmente em destaque e em caracteres alfanuméricos); 2) O horário de validade do cupom, se estiver visível (ex: '19H'). Responda APENAS com um objeto JSON contendo 'codigo', 'horario' (pode ser null se não estiver visível) e 'confianca' (de 0 a 1, o quanto você tem certeza da resposta: da leitura do código ou, se codigo for null, de que não há cupom na imagem)."},
+                    {"type": "image_url", "image_url": {"url": image_url, "detail": detail}}
+                ]
+            }
+        ],
+        max_tokens=300
+    )
+
+def _parse_vision_content(content):
+    """Interpreta o texto devolvido pela Vision API e monta o retorno padrão"""
+    # Registrar a resposta completa para debug
+    print(f"Resposta da API Vision: {content}")
+    
+    # Tentar encontrar e analisar o JSON na resposta
+    json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
+    if json_match:
+        result = json.loads(json_match.group(1))
+    else:
+        # Tentar extrair o JSON de outra forma
+        try:
+            result = json.loads(content)
+        except:
+            # Análise manual com regex melhorado
+            codigo_match = re.search(r'codigo["\'s:\s]+([A-Z0-9]+)', content, re.IGNORECASE)
+            horario_match = re.search(r'horario["\'s:\s]+([0-9]+H)', content, re.IGNORECASE)
+            
+            # Fallback para caso o regex não encontre mas o texto contenha o código
+            if not codigo_match:
+                # Procurar por sequências que pareçam códigos de cupom (caracteres maiúsculos e números)
+                fallback_codigo = re.search(r'([A-Z0-9]{7,12})', content)
+                if fallback_codigo:
+                    codigo_value = fallback_codigo.group(1)
+                else:
+                    codigo_value = None
+            else:
+                codigo_value = codigo_match.group(1)
+            
+            result = {
+                "codigo": codigo_value,
+                "horario": horario_match.group(1) if horario_match else None
+            }
+    
+    return _build_extraction_result(result, content)
+
+def _call_vision_api(image_url, detail=None, model="gpt-4o"):
+    """
+    Faz a chamada à OpenAI Vision e interpreta a resposta
+    
+    Args:
+        image_url: URL da imagem ou data URL em base64
+        detail: Nível de detalhe (padrão: VISION_IMAGE_DETAIL)
+        model: Modelo da OpenAI com suporte a visão
+    """
+    if detail is None:
+        detail = VISION_IMAGE_DETAIL
+        
     try:
         # Usar a forma compatível com openai==0.28.0
+        response = openai.ChatCompletion.create(**_vision_request(image_url, detail, model))
+        return _parse_vision_content(response.choices[0].message.content)
+    except Exception as e:
+        print(f"Erro na extração com Vision API: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+async def _call_vision_api_async(image_url, detail=None, model="gpt-4o"):
+    """Versão assíncrona de _call_vision_api (acreate do openai==0.28.0, sobre aiohttp)"""
+    if detail is None:
+        detail = VISION_IMAGE_DETAIL
+        
+    try:
+        response = await openai.ChatCompletion.acreate(**_vision_request(image_url, detail, model))
+        return _parse_vision_content(response.choices[0].message.content)
+    except Exception as e:
+        print(f"Erro na extração com Vision API: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def _call_vision_api_batch(image_inputs, detail=None, model="gpt-4o"):
+    """
+    Envia várias imagens em uma única requisição e pede um array JSON de resultados
+    
+    Cada objeto do array traz o 'indice' da imagem, o que permite associar os
+    resultados às imagens mesmo que o modelo mude a ordem ou omita alguma.
+    
+    Args:
+        image_inputs: Lista de URLs ou data URLs das imagens
+        detail: Nível de detalhe (padrão: VISION_IMAGE_DETAIL)
+        model: Modelo da OpenAI com suporte a visão
+        
+    Returns:
+        dict: {indice: resultado no formato de extract_with_vision} com os índices
+              interpretados, ou None se a resposta não puder ser interpretada
+    """
+    if detail is None:
+        detail = VISION_IMAGE_DETAIL
+        
+    total = len(image_inputs)
+    content_parts = [
+        {"type": "text", "text": f"Você receberá {total} imagens de stories da Shopee, numeradas de 0 a {total - 1}. Para CADA imagem, extraia: 1) O código do cupom (geralmente em destaque e em caracteres alfanuméricos), ou null se a imagem não tiver cupom; 2) O horário de validade do cupom, se estiver visível (ex: '19H'). Responda APENAS com um array JSON contendo exatamente um objeto por imagem, cada um com 'indice', 'codigo', 'horario' e 'confianca' (de 0 a 1, o quanto você tem certeza da resposta: da leitura do código ou, se codigo for null, de que não há cupom na imagem)."}
+    ]
+    for indice, image_input in enumerate(image_inputs):
+        content_parts.append({"type": "text", "text": f"Imagem {indice}:"})
+        content_parts.append({"type": "image_url", "image_url": {"url": image_input, "detail": detail}})
+        
+    try:
         response = openai.ChatCompletion.create(
-            model="gpt-4o", # Atualizado para o modelo atual que suporta visão
+            model=model,
             messages=[
-                {
-                    "role": "system",
-                    "content": "Você é um assistente especializado em extrair informações de cupons da Shopee. "
-                               "Extraia apenas o código do cupom e, se visível, o horário."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Analise esta imagem de um cupom da Shopee e extraia: 1) O código do cupom (geralmente em destaque e em caracteres alfanuméricos); 2) O horário de validade do cupom, se estiver visível (ex: '19H'). Responda APENAS com um objeto JSON contendo 'codigo' e 'horario' (pode ser null se não estiver visível)."},
-                        {"type": "image_url", "image_url": {"url": image_url}}
-                    ]
-                }
+                {"role": "system", "content": VISION_SYSTEM_PROMPT},
+                {"role": "user", "content": content_parts}
             ],
-            max_tokens=300
+            max_tokens=100 + 100 * total
         )
         
-        # Extrair a resposta
         content = response.choices[0].message.content
+        print(f"Resposta da API Vision (lote de {total}): {content}")
         
-        # Registrar a resposta completa para debug
-        print(f"Resposta da API Vision: {content}")
-        
-        # Tentar encontrar e analisar o JSON na resposta
-        json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group(1))
-        else:
-            # Tentar extrair o JSON de outra forma
-            try:
-                result = json.loads(content)
-            except:
-                # Análise manual com regex melhorado
-                codigo_match = re.search(r'codigo["\'s:\s]+([A-Z0-9]+)', content, re.IGNORECASE)
-                horario_match = re.search(r'horario["\'s:\s]+([0-9]+H)', content, re.IGNORECASE)
-                
-                # Fallback para caso o regex não encontre mas o texto contenha o código
-                if not codigo_match:
-                    # Procurar por sequências que pareçam códigos de cupom (caracteres maiúsculos e números)
-                    fallback_codigo = re.search(r'([A-Z0-9]{7,12})', content)
-                    if fallback_codigo:
-                        codigo_value = fallback_codigo.group(1)
-                    else:
-                        codigo_value = None
-                else:
-                    codigo_value = codigo_match.group(1)
-                
-                result = {
-                    "codigo": codigo_value,
-                    "horario": horario_match.group(1) if horario_match else None
-                }
-        
-        # Adicionar mais informações extraídas se disponíveis
-        descricao_match = re.search(r'(cupom exclusivo|por tempo limitado|frete gr[áa]tis)', content, re.IGNORECASE)
-        valor_match = re.search(r'(R\$\s*\d+|\d+%\s*OFF|\d+\s*REAIS)', content, re.IGNORECASE)
-        
-        result["descricao"] = descricao_match.group(0) if descricao_match else None
-        result["valor_desconto"] = valor_match.group(0) if valor_match else None
-        
-        if result.get("codigo"):
-            return {
-                "codigo": result.get("codigo"),
-                "horario": result.get("horario"),
-                "descricao": result.get("descricao"),
-                "valor_desconto": result.get("valor_desconto"),
-                "success": True
-            }
-        else:
-            return {"success": False, "error": "Código não encontrado na imagem"}
-            
+        json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', content, re.DOTALL)
+        parsed = json.loads(json_match.group(1) if json_match else content)
     except Exception as e:
-        print(f"Erro na extração com Vision API: {str(e)}")
-        return {"success": False, "error": str(e)}
+        print(f"Erro na extração em lote com Vision API: {str(e)}")
+        return None
+        
+    if not isinstance(parsed, list):
+        print("Resposta em lote não é um array JSON")
+        return None
+        
+    results = {}
+    for entry in parsed:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            indice = int(entry.get("indice"))
+        except (TypeError, ValueError):
+            continue
+        # Índices fora do intervalo ou repetidos tornam a associação ambígua
+        if not 0 <= indice < total or indice in results:
+            print(f"Índice inválido ou repetido na resposta em lote: {entry.get('indice')}")
+            return None
+        codigo = entry.get("codigo")
+        result = {
+            "codigo": str(codigo).strip() if codigo else None,
+            "horario": entry.get("horario"),
+            "confianca": entry.get("confianca")
+        }
+        results[indice] = _build_extraction_result(result, json.dumps(entry, ensure_ascii=False))
+        
+    return results
 
 def download_image(url):
     """Baixa uma imagem de uma URL e retorna o caminho para o arquivo local"""
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
+        image_bytes = fetch_image_bytes(url)
+        if not image_bytes:
+            return None
         
         # Criar diretório para imagens se não existir
-        os.makedirs("images", exist_ok=True)
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
         
-        # Criar um nome de arquivo baseado na URL
-        filename = f"images/img_{hash(url)}.jpg"
+        # Nome baseado no hash do conteúdo: estável entre processos e sem duplicatas
+        filename = os.path.join(IMAGE_CACHE_DIR, f"img_{hashlib.sha256(image_bytes).hexdigest()[:32]}.jpg")
         
-        with open(filename, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
+        if not os.path.exists(filename):
+            with open(filename, 'wb') as file:
+                file.write(image_bytes)
+            _prune_image_cache()
                 
         return filename
     except Exception as e:
@@ -0,0 +1,132 @@
+import os
+import json
+import asyncio
+import threading
+import logging
+from dotenv import load_dotenv
+
+from database import add_cupom_listener, list_cupons_since
+
+logger = logging.getLogger("shopee_monitor")
+
+# Tentar carregar o arquivo .env, mas não falhar se não existir
+try:
+    load_dotenv()
+except Exception as e:
+    logger.warning(f"Aviso: Não foi possível carregar o arquivo .env em cupom_stream.py: {str(e)}")
+
+# Máximo de eventos aguardando envio por cliente; um cliente lento demais é desconectado
+# e, ao reconectar, recupera o que perdeu pelo Last-Event-ID
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+# Intervalo dos comentários de keep-alive, para proxies não fecharem a conexão ociosa
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Máximo de cupons reenviados ao retomar a partir do Last-Event-ID
+SSE_REPLAY_LIMIT = int(os.getenv("SSE_REPLAY_LIMIT", "500"))
+
+_DESCONECTAR = object()
+
+def format_sse(cupom):
+    """Formata um cupom como evento SSE; o id do evento é o id do cupom"""
+    return f"id: {cupom['id']}\nevent: cupom\ndata: {json.dumps(cupom)}\n\n"
+
+class CupomBroadcaster:
+    """
+    Distribui os cupons recém-gravados para os clientes conectados ao stream
+
+    Os cupons chegam pelo listener de commit do banco, em qualquer thread, e são
+    entregues na fila asyncio de cada cliente pelo loop dono dela.
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._clientes = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        fila = asyncio.Queue(maxsize=self.queue_size)
+        cliente = (asyncio.get_running_loop(), fila)
+        with self._lock:
+            self._clientes.add(cliente)
+        return cliente
+
+    def unsubscribe(self, cliente):
+        with self._lock:
+            self._clientes.discard(cliente)
+
+    @staticmethod
+    def _put(cliente, cupom):
+        _, fila = cliente
+        if fila.full():
+            # Cliente não está consumindo: encerra o stream dele
+            while not fila.empty():
+                fila.get_nowait()
+            fila.put_nowait(_DESCONECTAR)
+            return
+        fila.put_nowait(cupom)
+
+    def publish(self, cupons):
+        with self._lock:
+            clientes = list(self._clientes)
+        for cliente in clientes:
+            loop, _ = cliente
+            for cupom in cupons:
+                try:
+                    loop.call_soon_threadsafe(self._put, cliente, cupom)
+                except RuntimeError:
+                    # Loop já encerrado
+                    self.unsubscribe(cliente)
+                    break
+
+    @property
+    def clientes(self):
+        return len(self._clientes)
+
+    async def stream(self, request, last_event_id=None):
+        """
+        Gera os eventos SSE de um cliente
+
+        Com last_event_id, primeiro reenvia do banco os cupons posteriores a ele e
+        depois segue com os novos. A inscrição acontece antes da leitura do banco
+        para não perder cupons gravados no meio; os que chegarem pelas duas vias são
+        descartados pelos ids já reenviados. Os eventos ao vivo não são filtrados por
+        um id máximo, então chegam mesmo que um id menor seja confirmado depois de
+        um maior.
+
+        A retomada pelo Last-Event-ID (cupons com id maior que o informado) supõe que
+        os ids ficam visíveis na ordem dos commits, o que vale no SQLite (um único
+        escritor por vez). Em bancos com escritas concorrentes, um cupom com id menor
+        confirmado depois de um maior pode não ser reenviado a um cliente que caiu
+        nesse intervalo.
+        """
+        cliente = self.subscribe()
+        _, fila = cliente
+        reenviados = set()
+        try:
+            yield "retry: 3000\n\n"
+
+            if last_event_id is not None:
+                perdidos = await asyncio.to_thread(list_cupons_since, last_event_id, SSE_REPLAY_LIMIT)
+                for cupom in perdidos:
+                    reenviados.add(cupom["id"])
+                    yield format_sse(cupom)
+
+            while True:
+                try:
+                    cupom = await asyncio.wait_for(fila.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if cupom is _DESCONECTAR:
+                    logger.warning("Cliente do stream de cupons muito lento, desconectando")
+                    return
+                if cupom["id"] in reenviados:
+                    continue
+                yield format_sse(cupom)
+        finally:
+            self.unsubscribe(cliente)
+
+cupom_broadcaster = CupomBroadcaster(SSE_QUEUE_SIZE)
+add_cupom_listener(cupom_broadcaster.publish)
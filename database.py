@@ -1,9 +1,17 @@
 import os
+import json
+import math
+import base64
+import time
 import sqlite3
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, func, inspect, text, and_, or_, Index, Column, Integer, String, DateTime, Boolean, Text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 import logging
 
@@ -19,25 +27,95 @@ except Exception as e:
     logger.warning(f"Aviso: Não foi possível carregar o arquivo .env em database.py: {str(e)}")
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///cupons.db")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Tempo que um story fica registrado como processado (stories duram 24h)
+STORY_LEDGER_TTL_HOURS = int(os.getenv("STORY_LEDGER_TTL_HOURS", "24"))
+
+# Pool de conexões
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Tamanho máximo de cada INSERT em lote (o SQLite limita a quantidade de parâmetros)
+BULK_INSERT_CHUNK_SIZE = 500
+# Índice em memória dos códigos conhecidos: conjunto exato até KNOWN_CODES_MAX_SET códigos,
+# depois um filtro de Bloom com no máximo KNOWN_CODES_BLOOM_MAX_BYTES
+KNOWN_CODES_MAX_SET = int(os.getenv("KNOWN_CODES_MAX_SET", "100000"))
+KNOWN_CODES_BLOOM_ERROR_RATE = float(os.getenv("KNOWN_CODES_BLOOM_ERROR_RATE", "0.01"))
+KNOWN_CODES_BLOOM_MAX_BYTES = int(os.getenv("KNOWN_CODES_BLOOM_MAX_BYTES", str(8 * 1024 * 1024)))
+# Intervalo para buscar códigos gravados por outros processos
+KNOWN_CODES_REFRESH_SECONDS = int(os.getenv("KNOWN_CODES_REFRESH_SECONDS", "60"))
+# Ajustes do SQLite: mmap em bytes e espera por locks em milissegundos
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+# Espera antes de consultar de novo um perfil cuja consulta falhou: dobra a cada
+# falha seguida, até o máximo (o intervalo mínimo do perfil continua valendo)
+PERFIL_FALHA_BACKOFF_SECONDS = int(os.getenv("PERFIL_FALHA_BACKOFF_SECONDS", "60"))
+PERFIL_FALHA_BACKOFF_MAX_SECONDS = int(os.getenv("PERFIL_FALHA_BACKOFF_MAX_SECONDS", "3600"))
+# Intervalo para reler a versão dos dados gravada no banco (alterações de outros processos)
+DATA_VERSION_CHECK_SECONDS = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "1"))
+
+def _create_engine(database_url):
+    """Cria o engine com pool explícito e, no SQLite, os pragmas de concorrência"""
+    if database_url.startswith("sqlite"):
+        engine = create_engine(
+            database_url,
+            # Sessões circulam entre threads do scheduler e do FastAPI
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True
+        )
+        
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            # WAL permite leituras da API enquanto os jobs do scheduler gravam
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.close()
+            
+        return engine
+        
+    return create_engine(
+        database_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
+engine = _create_engine(DATABASE_URL)
+# expire_on_commit=False: os objetos continuam legíveis depois do commit/fechamento da sessão
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+# Uma sessão por thread (jobs do scheduler, workers do monitor)
+ScopedSession = scoped_session(SessionLocal)
 Base = declarative_base()
 
 class Cupom(Base):
     __tablename__ = "cupons"
+    __table_args__ = (
+        # Listagens ordenadas por data com filtro de origem ou de envio
+        Index("ix_cupons_origem_data_criacao", "origem", "data_criacao"),
+        Index("ix_cupons_enviado_data_criacao", "enviado", "data_criacao"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     codigo = Column(String(20), unique=True, index=True)
     horario = Column(String(10), nullable=True)
     imagem_url = Column(String(500), nullable=True)
     processed_image_url = Column(String(500), nullable=True)
-    data_criacao = Column(DateTime, default=datetime.now)
+    data_criacao = Column(DateTime, default=datetime.now, index=True)
     enviado = Column(Boolean, default=False)
     detalhes = Column(Text, nullable=True)
     origem = Column(String(20), default="instagram")  # instagram, site, manual
     descricao = Column(String(200), nullable=True)
     valor_desconto = Column(String(50), nullable=True)
     valido_ate = Column(DateTime, nullable=True)
+    perfil = Column(String(100), nullable=True, index=True)  # perfil do Instagram de origem
     
     def to_dict(self):
         return {
@@ -52,79 +130,1111 @@ class Cupom(Base):
             "origem": self.origem,
             "descricao": self.descricao,
             "valor_desconto": self.valor_desconto,
-            "valido_ate": self.valido_ate.isoformat() if self.valido_ate else None
+            "valido_ate": self.valido_ate.isoformat() if self.valido_ate else None,
+            "perfil": self.perfil
         }
 
+class PerfilInstagram(Base):
+    """Perfil do Instagram monitorado"""
+    __tablename__ = "perfis_instagram"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(100), unique=True, index=True)
+    ativo = Column(Boolean, default=True)
+    prioridade = Column(Integer, default=0)  # perfis com prioridade maior são consultados primeiro
+    intervalo_minimo = Column(Integer, default=0)  # segundos entre duas consultas do perfil
+    ultima_consulta = Column(DateTime, nullable=True)
+    ultimo_taken_at = Column(Integer, nullable=True)
+    falhas = Column(Integer, default=0)  # consultas seguidas que falharam
+    data_criacao = Column(DateTime, default=datetime.now)
+
+    def intervalo_atual(self):
+        """Segundos entre consultas: o intervalo mínimo ou, depois de falhas, a espera exponencial"""
+        intervalo = self.intervalo_minimo or 0
+        if self.falhas:
+            espera = min(PERFIL_FALHA_BACKOFF_SECONDS * 2 ** (self.falhas - 1), PERFIL_FALHA_BACKOFF_MAX_SECONDS)
+            intervalo = max(intervalo, espera)
+        return intervalo
+
+    def to_dict(self):
+        return {
+            "username": self.username,
+            "ativo": self.ativo,
+            "prioridade": self.prioridade,
+            "intervalo_minimo": self.intervalo_minimo,
+            "ultima_consulta": self.ultima_consulta.isoformat() if self.ultima_consulta else None,
+            "ultimo_taken_at": self.ultimo_taken_at,
+            "falhas": self.falhas or 0
+        }
+
+class StoryProcessado(Base):
+    """Registro dos stories já analisados, com ou sem cupom"""
+    __tablename__ = "stories_processados"
+
+    id = Column(Integer, primary_key=True, index=True)
+    story_id = Column(String(100), unique=True, index=True)
+    resultado = Column(String(20))  # cupom, sem_cupom
+    codigo = Column(String(20), nullable=True)
+    data_processamento = Column(DateTime, default=datetime.now)
+    expira_em = Column(DateTime, index=True)
+
+class WebhookOutbox(Base):
+    """Fila persistente de entregas para o webhook (outbox)"""
+    __tablename__ = "webhook_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    codigo = Column(String(20), index=True)
+    destino = Column(String(50), default="n8n", index=True)
+    payload = Column(Text)
+    idempotency_key = Column(String(64), unique=True, index=True)
+    status = Column(String(20), default="pendente", index=True)  # pendente, enviando, enviado, falhou
+    tentativas = Column(Integer, default=0)
+    proxima_tentativa = Column(DateTime, default=datetime.now, index=True)
+    bloqueado_ate = Column(DateTime, nullable=True)
+    ultimo_erro = Column(Text, nullable=True)
+    data_criacao = Column(DateTime, default=datetime.now)
+    data_envio = Column(DateTime, nullable=True)
+
+class SchedulerLease(Base):
+    """Reserva com prazo de validade (liderança do scheduler, trava de jobs) compartilhada entre processos"""
+    __tablename__ = "scheduler_leases"
+
+    nome = Column(String(100), primary_key=True)
+    dono = Column(String(100))
+    expira_em = Column(DateTime)
+
+class ConsumoDiario(Base):
+    """Chamadas feitas no dia a uma API com orçamento diário, compartilhadas entre processos"""
+    __tablename__ = "consumo_diario"
+
+    nome = Column(String(100), primary_key=True)
+    dia = Column(String(10))  # data (YYYY-MM-DD) a que as chamadas se referem
+    chamadas = Column(Integer, default=0)
+
+class VersaoDados(Base):
+    """Contador único incrementado na mesma transação de cada alteração de cupons ou da fila"""
+    __tablename__ = "versao_dados"
+
+    id = Column(Integer, primary_key=True)
+    versao = Column(Integer, default=0)
+
+def _migrate_schema():
+    """
+    Adiciona em tabelas já existentes as colunas (e seus índices) criadas depois
+    da tabela; o create_all só cria tabelas novas
+    """
+    inspector = inspect(engine)
+    tabelas = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tabelas:
+            continue
+        existentes = {coluna["name"] for coluna in inspector.get_columns(table.name)}
+        for coluna in table.columns:
+            if coluna.name in existentes:
+                continue
+            tipo = coluna.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {coluna.name} {tipo}'))
+                if coluna.default is not None and not callable(coluna.default.arg):
+                    conn.execute(
+                        text(f'UPDATE {table.name} SET {coluna.name} = :valor'),
+                        {"valor": coluna.default.arg}
+                    )
+            logger.info(f"Coluna {table.name}.{coluna.name} adicionada")
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _migrate_schema()
+    try:
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT id FROM versao_dados WHERE id = 1")).first() is None:
+                conn.execute(text("INSERT INTO versao_dados (id, versao) VALUES (1, 0)"))
+    except IntegrityError:
+        # Outro processo criou a linha ao mesmo tempo
+        pass
 
 def get_db():
+    """Dependência do FastAPI: uma sessão por requisição, fechada ao final"""
     db = SessionLocal()
     try:
-        return db
+        yield db
     finally:
         db.close()
 
+_scope_state = threading.local()
+
+@contextmanager
+def session_scope():
+    """
+    Unidade de trabalho transacional usada pelas funções deste módulo
+    
+    Usa a sessão da thread atual (ScopedSession). Escopos aninhados reaproveitam a
+    mesma sessão; só o mais externo faz commit/rollback e devolve a conexão ao pool.
+    """
+    depth = getattr(_scope_state, "depth", 0)
+    db = ScopedSession()
+    _scope_state.depth = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            db.commit()
+    except Exception:
+        if depth == 0:
+            db.rollback()
+        raise
+    finally:
+        _scope_state.depth = depth
+        if depth == 0:
+            ScopedSession.remove()
+
+# Versão dos dados servidos pela API (cupons e fila do webhook). Cada transação que
+# altera esses dados incrementa a tabela versao_dados, o que vale para todos os
+# processos; o contador local avança logo após os commits deste processo, sem
+# esperar a próxima leitura do banco. Caches guardam a versão com que foram montados.
+_data_version = 0
+_data_version_lock = threading.Lock()
+_db_version = None
+_db_version_lida_em = 0.0
+
+def _read_db_version():
+    """Versão gravada no banco, relida no máximo a cada DATA_VERSION_CHECK_SECONDS"""
+    global _db_version, _db_version_lida_em
+    agora = time.monotonic()
+    if _db_version is not None and agora - _db_version_lida_em < DATA_VERSION_CHECK_SECONDS:
+        return _db_version
+    try:
+        with engine.connect() as conn:
+            versao = conn.execute(text("SELECT versao FROM versao_dados WHERE id = 1")).scalar()
+    except Exception as e:
+        logger.error(f"Erro ao ler a versão dos dados: {str(e)}")
+        # Sem a versão do banco nenhuma resposta guardada pode ser confirmada
+        return object()
+    with _data_version_lock:
+        _db_version = versao
+        _db_version_lida_em = agora
+    return versao
+
+def data_version():
+    """Versão atual dos cupons/fila; muda depois de cada commit que os altera, em qualquer processo"""
+    return (_data_version, _read_db_version())
+
+# Funções chamadas com a lista de cupons novos logo depois do commit que os gravou
+_cupom_listeners = []
+
+def add_cupom_listener(callback):
+    """Registra uma função chamada com os dicts dos cupons novos após cada commit"""
+    _cupom_listeners.append(callback)
+
+def _mark_data_changed(db, novos=None):
+    """
+    Marca a sessão para avançar a versão dos dados quando a transação for confirmada
+    
+    Args:
+        db: Sessão atual
+        novos: Dicts dos cupons inseridos, repassados aos listeners após o commit
+    """
+    if not db.info.get("dados_alterados"):
+        # Na mesma transação da alteração: outros processos veem a versão nova junto com os dados
+        db.execute(text("UPDATE versao_dados SET versao = versao + 1 WHERE id = 1"))
+        db.info["dados_alterados"] = True
+    if novos:
+        db.info.setdefault("cupons_novos", []).extend(novos)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_data_version(session):
+    global _data_version
+    if session.info.pop("dados_alterados", False):
+        with _data_version_lock:
+            _data_version += 1
+            
+    novos = session.info.pop("cupons_novos", None)
+    if novos:
+        for callback in _cupom_listeners:
+            try:
+                callback(novos)
+            except Exception as e:
+                logger.error(f"Erro ao notificar cupons novos: {str(e)}")
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_data_changes(session):
+    session.info.pop("dados_alterados", None)
+    session.info.pop("cupons_novos", None)
+
+class BloomFilter:
+    """Filtro de Bloom simples: sem falsos negativos, com taxa de falsos positivos configurável"""
+    
+    def __init__(self, capacity, error_rate, max_bytes=None):
+        bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        if max_bytes:
+            bits = min(bits, max_bytes * 8)
+        self.capacity = capacity
+        self.size = max(bits, 8)
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+        
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+            
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class KnownCodeIndex:
+    """
+    Índice em memória dos códigos da tabela de cupons
+    
+    Responde "com certeza não existe" sem consultar o banco. Uma resposta positiva
+    significa apenas "pode existir" e deve ser confirmada no banco. Começa como um
+    conjunto exato e vira um filtro de Bloom quando passa de max_set_size códigos,
+    mantendo o uso de memória limitado mesmo com anos de cupons.
+    
+    Códigos gravados por outros processos são incorporados a cada refresh_seconds.
+    """
+    
+    def __init__(self, max_set_size, error_rate, max_bloom_bytes, refresh_seconds):
+        self.max_set_size = max_set_size
+        self.error_rate = error_rate
+        self.max_bloom_bytes = max_bloom_bytes
+        self.refresh_seconds = refresh_seconds
+        self._codes = set()
+        self._bloom = None
+        self._count = 0
+        self._max_id = 0
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+        
+    def _add_unlocked(self, codigo):
+        if self._bloom is not None:
+            if codigo not in self._bloom:
+                self._bloom.add(codigo)
+                self._count += 1
+            if self._count > self._bloom.capacity and len(self._bloom.bits) * 2 <= self.max_bloom_bytes:
+                self._rebuild_bloom(self._bloom.capacity * 2)
+            return
+            
+        if codigo not in self._codes:
+            self._codes.add(codigo)
+            self._count += 1
+        if self._count > self.max_set_size:
+            logger.info(f"Índice de códigos passou de {self.max_set_size} itens, convertendo para filtro de Bloom")
+            self._rebuild_bloom(self.max_set_size * 2)
+            
+    def _rebuild_bloom(self, capacity):
+        """Recria o filtro de Bloom com a capacidade informada a partir do banco"""
+        bloom = BloomFilter(capacity, self.error_rate, self.max_bloom_bytes)
+        if self._bloom is None:
+            # Conversão do conjunto exato: os códigos já estão todos em memória
+            for codigo in self._codes:
+                bloom.add(codigo)
+            count = len(self._codes)
+        else:
+            # Um filtro de Bloom não permite listar seus itens; recarregar do banco
+            count = 0
+            with session_scope() as db:
+                for (codigo,) in db.query(Cupom.codigo).filter(Cupom.codigo.isnot(None)).yield_per(10000):
+                    bloom.add(codigo)
+                    count += 1
+        self._codes = set()
+        self._bloom = bloom
+        self._count = count
+        
+    def _load_since(self, min_id):
+        with session_scope() as db:
+            rows = db.query(Cupom.id, Cupom.codigo).filter(Cupom.id > min_id).order_by(Cupom.id).yield_per(10000)
+            for cupom_id, codigo in rows:
+                if codigo:
+                    self._add_unlocked(codigo)
+                self._max_id = max(self._max_id, cupom_id)
+        self._last_refresh = time.time()
+                
+    def load(self):
+        """Carrega todos os códigos da tabela de cupons"""
+        with self._lock:
+            self._codes = set()
+            self._bloom = None
+            self._count = 0
+            self._max_id = 0
+            self._load_since(0)
+            self._loaded = True
+            logger.info(f"Índice de códigos carregado com {self._count} códigos")
+            
+    def _ensure_fresh(self):
+        if not self._loaded:
+            self.load()
+        elif time.time() - self._last_refresh >= self.refresh_seconds:
+            self._load_since(self._max_id)
+            
+    def add(self, codigo):
+        with self._lock:
+            self._add_unlocked(codigo)
+            
+    def might_contain(self, codigo):
+        """False significa que o código com certeza não está no banco"""
+        with self._lock:
+            self._ensure_fresh()
+            if self._bloom is not None:
+                return codigo in self._bloom
+            return codigo in self._codes
+            
+    def stats(self):
+        with self._lock:
+            return {
+                "modo": "bloom" if self._bloom is not None else "conjunto",
+                "codigos": self._count,
+                "bytes_bloom": len(self._bloom.bits) if self._bloom is not None else None
+            }
+
+known_codes = KnownCodeIndex(
+    max_set_size=KNOWN_CODES_MAX_SET,
+    error_rate=KNOWN_CODES_BLOOM_ERROR_RATE,
+    max_bloom_bytes=KNOWN_CODES_BLOOM_MAX_BYTES,
+    refresh_seconds=KNOWN_CODES_REFRESH_SECONDS
+)
+
+def get_known_codes_stats():
+    """Retorna o modo e o tamanho do índice de códigos conhecidos"""
+    return known_codes.stats()
+
+def _confirm_existing_codes(db, codigos):
+    """Consulta no banco quais dos códigos informados realmente existem"""
+    existentes = set()
+    codigos = list(codigos)
+    for inicio in range(0, len(codigos), BULK_INSERT_CHUNK_SIZE):
+        lote = codigos[inicio:inicio + BULK_INSERT_CHUNK_SIZE]
+        existentes.update(codigo for (codigo,) in db.query(Cupom.codigo).filter(Cupom.codigo.in_(lote)))
+    return existentes
+
 def cupom_exists(codigo):
-    """Verifica se o cupom já existe no banco de dados"""
-    db = get_db()
-    return db.query(Cupom).filter(Cupom.codigo == codigo).first() is not None
+    """
+    Verifica se o cupom já existe no banco de dados
+    
+    Códigos ausentes do índice em memória são respondidos sem consultar o banco.
+    """
+    if not known_codes.might_contain(codigo):
+        return False
+    with session_scope() as db:
+        return db.query(Cupom.id).filter(Cupom.codigo == codigo).first() is not None
+
+def _cupom_values(codigo, horario=None, imagem_url=None, detalhes=None, origem="instagram",
+                  descricao=None, valor_desconto=None, valido_ate=None, perfil=None):
+    """Monta a linha a ser inserida na tabela de cupons"""
+    return {
+        "codigo": codigo,
+        "horario": horario,
+        "imagem_url": imagem_url,
+        "detalhes": detalhes,
+        "origem": origem,
+        "descricao": descricao,
+        "valor_desconto": valor_desconto,
+        "valido_ate": valido_ate,
+        "perfil": perfil,
+        "data_criacao": datetime.now(),
+        "enviado": False
+    }
+
+def _insert_ignore_statement(rows):
+    """
+    INSERT ... ON CONFLICT (codigo) DO NOTHING RETURNING, que grava e devolve apenas
+    os cupons novos em uma única ida ao banco. Retorna None em bancos sem suporte.
+    """
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return (
+        insert(Cupom)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=["codigo"])
+        .returning(*Cupom.__table__.columns)
+    )
+
+def _insert_cupons(db, rows):
+    """Insere as linhas ignorando códigos já existentes e retorna os dicts dos cupons novos"""
+    statement = _insert_ignore_statement(rows)
+    if statement is not None:
+        novos = [Cupom(**row._mapping).to_dict() for row in db.execute(statement)]
+        if novos:
+            _mark_data_changed(db, novos)
+        return novos
+    
+    # Bancos sem ON CONFLICT: uma linha por vez, tratando a violação de unicidade
+    novos = []
+    for row in rows:
+        try:
+            with db.begin_nested():
+                cupom = Cupom(**row)
+                db.add(cupom)
+            novos.append(cupom.to_dict())
+        except IntegrityError:
+            pass
+    if novos:
+        _mark_data_changed(db, novos)
+    return novos
 
 def save_cupom(codigo, horario=None, imagem_url=None, detalhes=None, origem="instagram", 
-              descricao=None, valor_desconto=None, valido_ate=None):
-    """Salva um novo cupom no banco de dados"""
+              descricao=None, valor_desconto=None, valido_ate=None, perfil=None):
+    """
+    Salva um novo cupom no banco de dados
+    
+    Returns:
+        dict: Dados do cupom salvo, ou False se o código já existia
+    """
+    # Códigos já conhecidos não chegam a abrir uma transação de escrita
     if cupom_exists(codigo):
         return False
+        
+    row = _cupom_values(codigo, horario, imagem_url, detalhes, origem, descricao, valor_desconto, valido_ate, perfil)
+    with session_scope() as db:
+        novos = _insert_cupons(db, [row])
+    known_codes.add(codigo)
+    return novos[0] if novos else False
+
+def save_cupons_bulk(cupons):
+    """
+    Salva vários cupons com um INSERT por lote, ignorando códigos já existentes
     
-    db = get_db()
-    novo_cupom = Cupom(
-        codigo=codigo,
-        horario=horario,
-        imagem_url=imagem_url,
-        detalhes=detalhes,
-        origem=origem,
-        descricao=descricao,
-        valor_desconto=valor_desconto,
-        valido_ate=valido_ate
-    )
-    db.add(novo_cupom)
-    db.commit()
-    db.refresh(novo_cupom)
-    return novo_cupom.to_dict()
+    Args:
+        cupons: Lista de dicts com os mesmos campos aceitos por save_cupom
+        
+    Returns:
+        list: Dados dos cupons que eram novos, na ordem em que foram informados
+    """
+    rows = []
+    vistos = set()
+    for cupom in cupons:
+        # Códigos repetidos dentro do próprio lote são gravados uma vez só
+        if not cupom.get("codigo") or cupom["codigo"] in vistos:
+            continue
+        vistos.add(cupom["codigo"])
+        rows.append(_cupom_values(**cupom))
+        
+    if not rows:
+        return []
+        
+    novos = {}
+    with session_scope() as db:
+        # Só os códigos que o índice não descarta precisam ser confirmados no banco
+        possiveis = [row["codigo"] for row in rows if known_codes.might_contain(row["codigo"])]
+        if possiveis:
+            existentes = _confirm_existing_codes(db, possiveis)
+            rows = [row for row in rows if row["codigo"] not in existentes]
+            
+        for inicio in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+            for cupom_data in _insert_cupons(db, rows[inicio:inicio + BULK_INSERT_CHUNK_SIZE]):
+                novos[cupom_data["codigo"]] = cupom_data
+                
+    for row in rows:
+        known_codes.add(row["codigo"])
+    return [novos[row["codigo"]] for row in rows if row["codigo"] in novos]
 
 def mark_cupom_sent(codigo):
     """Marca um cupom como enviado"""
-    db = get_db()
-    cupom = db.query(Cupom).filter(Cupom.codigo == codigo).first()
-    if cupom:
-        cupom.enviado = True
-        db.commit()
-        return True
-    return False
+    with session_scope() as db:
+        cupom = db.query(Cupom).filter(Cupom.codigo == codigo).first()
+        if cupom:
+            cupom.enviado = True
+            _mark_data_changed(db)
+            return True
+        return False
 
 def update_processed_image(codigo, processed_image_url):
     """Atualiza a URL da imagem processada"""
-    db = get_db()
-    cupom = db.query(Cupom).filter(Cupom.codigo == codigo).first()
-    if cupom:
-        cupom.processed_image_url = processed_image_url
-        db.commit()
+    with session_scope() as db:
+        cupom = db.query(Cupom).filter(Cupom.codigo == codigo).first()
+        if cupom:
+            cupom.processed_image_url = processed_image_url
+            _mark_data_changed(db)
+            return True
+        return False
+
+def story_already_processed(story_id):
+    """Verifica se o story já foi analisado e o registro ainda não expirou"""
+    with session_scope() as db:
+        registro = db.query(StoryProcessado.id).filter(
+            StoryProcessado.story_id == str(story_id),
+            StoryProcessado.expira_em > datetime.now()
+        ).first()
+        return registro is not None
+
+def mark_story_processed(story_id, resultado, codigo=None, taken_at=None):
+    """
+    Registra o resultado da análise de um story
+    
+    Args:
+        story_id: ID do story no Instagram
+        resultado: "cupom" ou "sem_cupom"
+        codigo: Código do cupom encontrado (se houver)
+        taken_at: Timestamp de publicação do story, usado para calcular a expiração
+    """
+    inicio = datetime.fromtimestamp(taken_at) if taken_at else datetime.now()
+    expira_em = inicio + timedelta(hours=STORY_LEDGER_TTL_HOURS)
+    
+    with session_scope() as db:
+        registro = db.query(StoryProcessado).filter(StoryProcessado.story_id == str(story_id)).first()
+        if registro:
+            registro.resultado = resultado
+            registro.codigo = codigo
+            registro.data_processamento = datetime.now()
+            registro.expira_em = expira_em
+        else:
+            db.add(StoryProcessado(
+                story_id=str(story_id),
+                resultado=resultado,
+                codigo=codigo,
+                expira_em=expira_em
+            ))
+        return True
+
+def seed_perfis(usernames):
+    """Cadastra os perfis informados se ainda não houver nenhum perfil cadastrado"""
+    with session_scope() as db:
+        if db.query(PerfilInstagram.id).first() is not None:
+            return False
+        for username in dict.fromkeys(usernames):
+            db.add(PerfilInstagram(username=username))
         return True
-    return False
+
+def list_perfis():
+    """Todos os perfis cadastrados, dos mais prioritários para os menos"""
+    with session_scope() as db:
+        perfis = db.query(PerfilInstagram).order_by(
+            PerfilInstagram.prioridade.desc(), PerfilInstagram.username
+        ).all()
+        return [perfil.to_dict() for perfil in perfis]
+
+def save_perfil(username, ativo=None, prioridade=None, intervalo_minimo=None):
+    """Cadastra um perfil ou atualiza os campos informados de um perfil existente"""
+    with session_scope() as db:
+        perfil = db.query(PerfilInstagram).filter(PerfilInstagram.username == username).first()
+        if perfil is None:
+            perfil = PerfilInstagram(username=username, ativo=True, prioridade=0, intervalo_minimo=0)
+            db.add(perfil)
+        if ativo is not None:
+            perfil.ativo = ativo
+        if prioridade is not None:
+            perfil.prioridade = prioridade
+        if intervalo_minimo is not None:
+            perfil.intervalo_minimo = intervalo_minimo
+        return perfil.to_dict()
+
+def delete_perfil(username):
+    """Remove um perfil; retorna False se ele não existia"""
+    with session_scope() as db:
+        return db.query(PerfilInstagram).filter(PerfilInstagram.username == username).delete() > 0
+
+def get_perfis_para_consulta(limit=None):
+    """
+    Perfis ativos cujo intervalo mínimo já passou, na ordem em que devem ser consultados
+    
+    A ordem é por prioridade e, entre perfis de mesma prioridade, pelo que está há
+    mais tempo sem consulta; com limit, os perfis que ficaram de fora são os
+    primeiros da próxima execução. Perfis cuja última consulta falhou esperam
+    PERFIL_FALHA_BACKOFF_SECONDS, dobrando a cada falha seguida.
+    """
+    agora = datetime.now()
+    with session_scope() as db:
+        perfis = db.query(PerfilInstagram).filter(PerfilInstagram.ativo == True).all()
+        
+    devidos = [
+        perfil for perfil in perfis
+        if perfil.ultima_consulta is None
+        or perfil.ultima_consulta + timedelta(seconds=perfil.intervalo_atual()) <= agora
+    ]
+    devidos.sort(key=lambda perfil: (-(perfil.prioridade or 0), perfil.ultima_consulta or datetime.min))
+    if limit:
+        devidos = devidos[:limit]
+    return [perfil.to_dict() for perfil in devidos]
+
+def mark_perfis_consultados(resultados, falhas=()):
+    """
+    Registra a consulta dos perfis
+    
+    Args:
+        resultados: Dict username -> maior taken_at encontrado (ou None)
+        falhas: Usernames cuja consulta falhou; entram na espera exponencial
+    """
+    agora = datetime.now()
+    falhas = set(falhas)
+    with session_scope() as db:
+        perfis = db.query(PerfilInstagram).filter(
+            PerfilInstagram.username.in_(list(resultados) + list(falhas))
+        ).all()
+        for perfil in perfis:
+            perfil.ultima_consulta = agora
+            if perfil.username in falhas:
+                perfil.falhas = (perfil.falhas or 0) + 1
+                continue
+            perfil.falhas = 0
+            taken_at = resultados[perfil.username]
+            if taken_at is not None:
+                perfil.ultimo_taken_at = max(taken_at, perfil.ultimo_taken_at or taken_at)
+
+def purge_expired_stories():
+    """Remove os registros de stories expirados e retorna quantos foram removidos"""
+    with session_scope() as db:
+        return db.query(StoryProcessado).filter(StoryProcessado.expira_em <= datetime.now()).delete()
+
+def enqueue_webhook(codigo, destino, payload, idempotency_key):
+    """
+    Coloca uma entrega na fila de um destino do webhook
+    
+    A chave de idempotência é única: entregas já enfileiradas não são duplicadas e
+    entregas que esgotaram as tentativas voltam para a fila.
+    
+    Returns:
+        bool: True se a entrega ficou pendente na fila
+    """
+    try:
+        with session_scope() as db:
+            entrega = db.query(WebhookOutbox).filter(WebhookOutbox.idempotency_key == idempotency_key).first()
+            if entrega is None:
+                db.add(WebhookOutbox(
+                    codigo=codigo,
+                    destino=destino,
+                    payload=json.dumps(payload),
+                    idempotency_key=idempotency_key,
+                    status="pendente",
+                    tentativas=0,
+                    proxima_tentativa=datetime.now()
+                ))
+                _mark_data_changed(db)
+                return True
+            if entrega.status == "falhou":
+                entrega.status = "pendente"
+                entrega.tentativas = 0
+                entrega.proxima_tentativa = datetime.now()
+                _mark_data_changed(db)
+                return True
+            return entrega.status in ("pendente", "enviando")
+    except IntegrityError:
+        # Outro processo enfileirou a mesma entrega ao mesmo tempo
+        return True
+
+def _webhook_disponivel(destino, agora):
+    """Filtro das entregas de um destino prontas para (re)envio"""
+    return and_(
+        WebhookOutbox.destino == destino,
+        or_(
+            and_(WebhookOutbox.status == "pendente", WebhookOutbox.proxima_tentativa <= agora),
+            and_(WebhookOutbox.status == "enviando", WebhookOutbox.bloqueado_ate < agora)
+        )
+    )
+
+def count_ready_webhook_deliveries(destino):
+    """Quantidade de entregas de um destino prontas para envio"""
+    with session_scope() as db:
+        return db.query(func.count(WebhookOutbox.id)).filter(_webhook_disponivel(destino, datetime.now())).scalar()
+
+def claim_webhook_deliveries(destino, limit, lease_seconds):
+    """
+    Reserva entregas de um destino prontas para envio
+    
+    Cada entrega é reservada com um UPDATE condicional, então vários processos podem
+    consumir a mesma fila sem enviar duas vezes. Entregas reservadas por um worker que
+    morreu voltam a ficar disponíveis quando a reserva (lease) expira.
+    
+    Returns:
+        list: Dicts com id, codigo, payload, idempotency_key e tentativas
+    """
+    agora = datetime.now()
+    disponivel = _webhook_disponivel(destino, agora)
+    
+    reservadas = []
+    with session_scope() as db:
+        candidatas = db.query(WebhookOutbox.id).filter(disponivel).order_by(WebhookOutbox.id).limit(limit).all()
+        for (entrega_id,) in candidatas:
+            atualizadas = db.query(WebhookOutbox).filter(WebhookOutbox.id == entrega_id, disponivel).update(
+                {"status": "enviando", "bloqueado_ate": agora + timedelta(seconds=lease_seconds)},
+                synchronize_session=False
+            )
+            if atualizadas:
+                reservadas.append(entrega_id)
+        if reservadas:
+            _mark_data_changed(db)
+                
+        entregas = db.query(WebhookOutbox).filter(WebhookOutbox.id.in_(reservadas)).order_by(WebhookOutbox.id).all() if reservadas else []
+        return [{
+            "id": entrega.id,
+            "codigo": entrega.codigo,
+            "destino": entrega.destino,
+            "payload": json.loads(entrega.payload),
+            "idempotency_key": entrega.idempotency_key,
+            "tentativas": entrega.tentativas
+        } for entrega in entregas]
+
+def mark_webhook_delivered(entrega_id):
+    """
+    Marca a entrega como concluída; o cupom fica como enviado quando todos os
+    destinos para os quais foi enfileirado confirmarem a entrega
+    """
+    with session_scope() as db:
+        entrega = db.query(WebhookOutbox).filter(WebhookOutbox.id == entrega_id).first()
+        if not entrega:
+            return False
+        entrega.status = "enviado"
+        entrega.data_envio = datetime.now()
+        entrega.bloqueado_ate = None
+        entrega.ultimo_erro = None
+        _mark_data_changed(db)
+        db.flush()
+        
+        restantes = db.query(WebhookOutbox.id).filter(
+            WebhookOutbox.codigo == entrega.codigo,
+            WebhookOutbox.status != "enviado"
+        ).first()
+        if restantes is None:
+            db.query(Cupom).filter(Cupom.codigo == entrega.codigo).update({"enviado": True}, synchronize_session=False)
+        return True
+
+def mark_webhook_failed(entrega_id, erro, proxima_tentativa=None):
+    """
+    Registra uma falha de entrega
+    
+    Args:
+        entrega_id: ID da entrega na fila
+        erro: Descrição do erro
+        proxima_tentativa: Quando tentar de novo; None encerra as tentativas (status "falhou")
+    """
+    with session_scope() as db:
+        entrega = db.query(WebhookOutbox).filter(WebhookOutbox.id == entrega_id).first()
+        if not entrega:
+            return False
+        entrega.tentativas = (entrega.tentativas or 0) + 1
+        entrega.ultimo_erro = str(erro)[:1000]
+        _mark_data_changed(db)
+        entrega.bloqueado_ate = None
+        if proxima_tentativa is None:
+            entrega.status = "falhou"
+        else:
+            entrega.status = "pendente"
+            entrega.proxima_tentativa = proxima_tentativa
+        return True
+
+def acquire_lease(nome, dono, ttl_seconds):
+    """
+    Obtém ou renova uma reserva compartilhada entre processos
+    
+    A reserva pertence a um dono até expirar; o próprio dono pode renová-la e
+    qualquer outro pode tomá-la depois que expirar.
+    
+    Returns:
+        bool: True se o dono está com a reserva
+    """
+    agora = datetime.now()
+    expira_em = agora + timedelta(seconds=ttl_seconds)
+    try:
+        with session_scope() as db:
+            atualizadas = db.query(SchedulerLease).filter(
+                SchedulerLease.nome == nome,
+                or_(SchedulerLease.dono == dono, SchedulerLease.expira_em < agora)
+            ).update({"dono": dono, "expira_em": expira_em}, synchronize_session=False)
+            if atualizadas:
+                return True
+            if db.query(SchedulerLease.nome).filter(SchedulerLease.nome == nome).first():
+                return False
+            db.add(SchedulerLease(nome=nome, dono=dono, expira_em=expira_em))
+            db.flush()
+            return True
+    except IntegrityError:
+        # Outro processo criou a reserva ao mesmo tempo
+        return False
+
+def release_lease(nome, dono):
+    """Libera a reserva se ela ainda pertencer ao dono"""
+    with session_scope() as db:
+        return db.query(SchedulerLease).filter(
+            SchedulerLease.nome == nome, SchedulerLease.dono == dono
+        ).delete(synchronize_session=False) > 0
+
+def reserve_daily_calls(nome, dia, quantidade, limite):
+    """
+    Reserva até quantidade chamadas do orçamento diário de uma API
+    
+    O contador fica no banco e é incrementado com um UPDATE condicional
+    (chamadas + reservadas <= limite), então processos diferentes nunca reservam
+    juntos mais que o limite; a contagem recomeça quando o dia muda.
+    
+    Args:
+        nome: Identifica o orçamento (ex.: "stories")
+        dia: Data de referência no formato YYYY-MM-DD
+        quantidade: Chamadas desejadas
+        limite: Máximo de chamadas no dia
+        
+    Returns:
+        int: Chamadas reservadas, de 0 (orçamento esgotado) até quantidade
+    """
+    for _ in range(5):
+        try:
+            with session_scope() as db:
+                db.query(ConsumoDiario).filter(
+                    ConsumoDiario.nome == nome, ConsumoDiario.dia != dia
+                ).update({"dia": dia, "chamadas": 0}, synchronize_session=False)
+                usadas = db.query(ConsumoDiario.chamadas).filter(ConsumoDiario.nome == nome).scalar()
+                if usadas is None:
+                    db.add(ConsumoDiario(nome=nome, dia=dia, chamadas=0))
+                    db.flush()
+                    usadas = 0
+                    
+                reservadas = max(0, min(quantidade, limite - usadas))
+                if not reservadas:
+                    return 0
+                atualizadas = db.query(ConsumoDiario).filter(
+                    ConsumoDiario.nome == nome,
+                    ConsumoDiario.dia == dia,
+                    ConsumoDiario.chamadas + reservadas <= limite
+                ).update({"chamadas": ConsumoDiario.chamadas + reservadas}, synchronize_session=False)
+                if atualizadas:
+                    return reservadas
+        except IntegrityError:
+            # Outro processo criou a linha ao mesmo tempo
+            pass
+        # Outro processo reservou entre a leitura e o UPDATE: tenta de novo com o saldo atual
+    return 0
+
+def get_daily_calls(nome, dia):
+    """Chamadas já reservadas no dia, somando todos os processos"""
+    with session_scope() as db:
+        consumo = db.query(ConsumoDiario).filter(ConsumoDiario.nome == nome).first()
+        return consumo.chamadas if consumo and consumo.dia == dia else 0
+
+def get_outbox_stats():
+    """Quantidade de entregas na fila do webhook por destino e status"""
+    with session_scope() as db:
+        rows = db.query(WebhookOutbox.destino, WebhookOutbox.status, func.count(WebhookOutbox.id)).group_by(
+            WebhookOutbox.destino, WebhookOutbox.status
+        ).all()
+        stats = {}
+        for destino, status, total in rows:
+            stats.setdefault(destino, {})[status] = total
+        return stats
+
+def get_cupom_deliveries(codigo):
+    """Status de entrega de um cupom em cada destino do webhook"""
+    with session_scope() as db:
+        entregas = db.query(WebhookOutbox).filter(WebhookOutbox.codigo == codigo).order_by(WebhookOutbox.destino).all()
+        return [{
+            "destino": entrega.destino,
+            "status": entrega.status,
+            "tentativas": entrega.tentativas,
+            "ultimo_erro": entrega.ultimo_erro,
+            "data_envio": entrega.data_envio.isoformat() if entrega.data_envio else None
+        } for entrega in entregas]
+
+# Colunas devolvidas nas listagens feitas sem carregar objetos do ORM
+CUPOM_COLUMNS = [
+    Cupom.id, Cupom.codigo, Cupom.horario, Cupom.imagem_url, Cupom.processed_image_url,
+    Cupom.data_criacao, Cupom.enviado, Cupom.detalhes, Cupom.origem, Cupom.descricao,
+    Cupom.valor_desconto, Cupom.valido_ate, Cupom.perfil
+]
+
+CUPOM_FIELDS = {coluna.key: coluna for coluna in CUPOM_COLUMNS}
+
+def resolve_cupom_fields(fields=None):
+    """
+    Lê a projeção pedida em fields= (nomes separados por vírgula)
+    
+    Raises:
+        ValueError: Se algum campo não existir
+    """
+    if not fields:
+        return list(CUPOM_FIELDS)
+    campos = list(dict.fromkeys(campo.strip() for campo in fields.split(",") if campo.strip()))
+    desconhecidos = [campo for campo in campos if campo not in CUPOM_FIELDS]
+    if desconhecidos or not campos:
+        raise ValueError(f"Campos inválidos: {', '.join(desconhecidos)}. Disponíveis: {', '.join(CUPOM_FIELDS)}")
+    return campos
+
+def _cupom_query_columns(campos, obrigatorios=()):
+    """Colunas a selecionar: os campos pedidos mais os necessários para ordenar/paginar"""
+    return [CUPOM_FIELDS[campo] for campo in dict.fromkeys([*campos, *obrigatorios])]
+
+def _cupom_row_to_dict(row, campos):
+    """Converte uma linha projetada no mesmo formato de Cupom.to_dict, só com os campos pedidos"""
+    valores = row._mapping
+    cupom = {}
+    for campo in campos:
+        valor = valores[campo]
+        cupom[campo] = valor.isoformat() if isinstance(valor, datetime) else valor
+    return cupom
+
+def get_webhook_status(limit=50, offset=0, resumo=False, fields=None):
+    """
+    Resumo do envio dos cupons ao webhook
+    
+    As contagens saem de uma única consulta agrupada por enviado. As listas são
+    lidas coluna a coluna (sem objetos do ORM) e os pendentes são paginados.
+    
+    Args:
+        limit: Máximo de cupons pendentes devolvidos
+        offset: Quantos cupons pendentes pular
+        resumo: Se True, devolve apenas as contagens
+        fields: Campos dos cupons listados, separados por vírgula (padrão: todos)
+    """
+    campos = resolve_cupom_fields(fields)
+    colunas = _cupom_query_columns(campos)
+    with session_scope() as db:
+        contagens = dict(db.query(Cupom.enviado, func.count(Cupom.id)).group_by(Cupom.enviado).all())
+        enviados = contagens.get(True, 0)
+        total = sum(contagens.values())
+        status = {
+            "total_cupons": total,
+            "enviados": enviados,
+            "pendentes": total - enviados
+        }
+        if resumo:
+            return status
+            
+        ultimos_enviados = db.query(*colunas).filter(Cupom.enviado == True).order_by(
+            Cupom.data_criacao.desc()
+        ).limit(5).all()
+        
+        # Busca um item a mais para saber se existe próxima página
+        pendentes = db.query(*colunas).filter(Cupom.enviado == False).order_by(
+            Cupom.data_criacao.desc(), Cupom.id.desc()
+        ).offset(offset).limit(limit + 1).all()
+        
+        status["ultimos_enviados"] = [_cupom_row_to_dict(row, campos) for row in ultimos_enviados]
+        status["cupons_pendentes"] = [_cupom_row_to_dict(row, campos) for row in pendentes[:limit]]
+        status["paginacao"] = {
+            "limit": limit,
+            "offset": offset,
+            "proximo_offset": offset + limit if len(pendentes) > limit else None
+        }
+        return status
+
+def encode_cupom_cursor(data_criacao, cupom_id):
+    """Cursor opaco de paginação a partir da posição (data_criacao, id) de um cupom"""
+    valor = f"{data_criacao}|{cupom_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(valor).decode("ascii").rstrip("=")
+
+def decode_cupom_cursor(cursor):
+    """
+    Lê um cursor gerado por encode_cupom_cursor
+    
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    try:
+        valor = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        data_criacao, cupom_id = valor.rsplit("|", 1)
+        return datetime.fromisoformat(data_criacao), int(cupom_id)
+    except Exception:
+        raise ValueError(f"Cursor inválido: {cursor}")
+
+def list_cupons(limit=50, origem=None, enviado=None, after=None, before=None, fields=None):
+    """
+    Lista cupons do mais recente para o mais antigo com paginação por cursor (keyset)
+    
+    A posição é dada por (data_criacao, id), então cada página é uma busca no índice
+    e o custo não cresce com a profundidade da página, ao contrário do OFFSET.
+    
+    Args:
+        limit: Tamanho da página
+        origem: Filtrar pela origem do cupom
+        enviado: Filtrar pelo status de envio ao webhook
+        after: Cursor; devolve os cupons seguintes (mais antigos)
+        before: Cursor; devolve os cupons anteriores (mais recentes)
+        fields: Campos devolvidos, separados por vírgula (padrão: todos)
+        
+    Returns:
+        tuple: (lista de dicts, cursor da próxima página ou None, cursor da página anterior ou None)
+    """
+    campos = resolve_cupom_fields(fields)
+    with session_scope() as db:
+        query = db.query(*_cupom_query_columns(campos, ("id", "data_criacao")))
+        if origem:
+            query = query.filter(Cupom.origem == origem)
+        if enviado is not None:
+            query = query.filter(Cupom.enviado == enviado)
+            
+        # O limite simples em data_criacao (>= / <=) é o que permite ao banco começar a
+        # busca no índice a partir do cursor; o OR sozinho faz o SQLite percorrer o
+        # índice desde o início e o custo cresce com a profundidade da página
+        if before:
+            data_criacao, cupom_id = decode_cupom_cursor(before)
+            query = query.filter(
+                Cupom.data_criacao >= data_criacao,
+                or_(
+                    Cupom.data_criacao > data_criacao,
+                    and_(Cupom.data_criacao == data_criacao, Cupom.id > cupom_id)
+                )
+            ).order_by(Cupom.data_criacao.asc(), Cupom.id.asc())
+        else:
+            if after:
+                data_criacao, cupom_id = decode_cupom_cursor(after)
+                query = query.filter(
+                    Cupom.data_criacao <= data_criacao,
+                    or_(
+                        Cupom.data_criacao < data_criacao,
+                        and_(Cupom.data_criacao == data_criacao, Cupom.id < cupom_id)
+                    )
+                )
+            query = query.order_by(Cupom.data_criacao.desc(), Cupom.id.desc())
+            
+        # Busca um item a mais para saber se existe outra página na mesma direção
+        rows = query.limit(limit + 1).all()
+        mais = len(rows) > limit
+        rows = rows[:limit]
+        if before:
+            rows.reverse()
+            
+        if not rows:
+            return [], None, None
+            
+        primeiro, ultimo = rows[0], rows[-1]
+        tem_proxima = bool(before) or mais
+        tem_anterior = mais if before else bool(after)
+        proximo = encode_cupom_cursor(ultimo.data_criacao.isoformat(), ultimo.id) if tem_proxima else None
+        anterior = encode_cupom_cursor(primeiro.data_criacao.isoformat(), primeiro.id) if tem_anterior else None
+        return [_cupom_row_to_dict(row, campos) for row in rows], proximo, anterior
+
+def list_cupons_since(cupom_id, limit=500):
+    """
+    Cupons com id maior que cupom_id, do mais antigo para o mais novo
+    
+    Usado para retomar o stream de cupons a partir do Last-Event-ID.
+    """
+    campos = list(CUPOM_FIELDS)
+    with session_scope() as db:
+        rows = db.query(*CUPOM_COLUMNS).filter(Cupom.id > cupom_id).order_by(Cupom.id.asc()).limit(limit).all()
+        return [_cupom_row_to_dict(row, campos) for row in rows]
+
+def get_cupom(codigo):
+    """Obtém um cupom pelo código, como dict (None se não existir)"""
+    with session_scope() as db:
+        cupom = db.query(Cupom).filter(Cupom.codigo == codigo).first()
+        return cupom.to_dict() if cupom else None
+
+def list_unsent_cupons():
+    """Cupons ainda não enviados ao webhook, como dicts"""
+    with session_scope() as db:
+        return [cupom.to_dict() for cupom in db.query(Cupom).filter(Cupom.enviado == False).all()]
 
 def get_latest_cupons(limit=10, origem=None):
     """Obtém os cupons mais recentes"""
-    db = get_db()
-    query = db.query(Cupom).order_by(Cupom.data_criacao.desc())
-    
-    if origem:
-        query = query.filter(Cupom.origem == origem)
+    with session_scope() as db:
+        query = db.query(Cupom).order_by(Cupom.data_criacao.desc())
         
-    return query.limit(limit).all()
+        if origem:
+            query = query.filter(Cupom.origem == origem)
+            
+        return query.limit(limit).all()
 
 # Inicializar o banco de dados ao importar este módulo
 try:
     init_db()
+    known_codes.load()
     logger.info("Banco de dados inicializado com sucesso")
 except Exception as e:
     logger.error(f"Erro ao inicializar o banco de dados: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,412 @@
+import os
+import time
+import asyncio
+import random
+import threading
+import logging
+from collections import deque
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+logger = logging.getLogger("shopee_monitor")
+
+# Tentar carregar o arquivo .env, mas não falhar se não existir
+try:
+    load_dotenv()
+except Exception as e:
+    logger.warning(f"Aviso: Não foi possível carregar o arquivo .env em http_client.py: {str(e)}")
+
+# Timeouts padrão (em segundos) de conexão e leitura das chamadas HTTP
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+# Conexões mantidas abertas (keep-alive) por host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+# Novas tentativas em erros de conexão/timeout e respostas 429/5xx (só métodos idempotentes por padrão)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE_SECONDS = float(os.getenv("HTTP_BACKOFF_BASE_SECONDS", "0.5"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "10"))
+# Circuit breaker por host: abre após N falhas seguidas e testa de novo depois do intervalo
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "60"))
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+class CircuitOpenError(requests.RequestException):
+    """O circuito do host está aberto: a chamada nem é feita"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um host
+
+    Depois de failure_threshold falhas seguidas o circuito abre e as chamadas
+    falham na hora. Passados reset_seconds, uma chamada de teste é liberada
+    (meio-aberto): se der certo o circuito fecha, se falhar volta a abrir.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._falhas = 0
+        self._aberto_ate = None
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._aberto_ate is None:
+            return "fechado"
+        return "meio-aberto" if time.monotonic() >= self._aberto_ate else "aberto"
+
+    def allow(self):
+        with self._lock:
+            if self._aberto_ate is None:
+                return True
+            if time.monotonic() < self._aberto_ate or self._testando:
+                return False
+            self._testando = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._falhas = 0
+            self._aberto_ate = None
+            self._testando = False
+
+    def record_failure(self):
+        with self._lock:
+            self._falhas += 1
+            if self._testando or self._falhas >= self.failure_threshold:
+                self._aberto_ate = time.monotonic() + self.reset_seconds
+            self._testando = False
+
+    def release(self):
+        """Libera a chamada de teste sem registrar resultado (chamada cancelada ou erro local)"""
+        with self._lock:
+            self._testando = False
+
+class HostStats:
+    """Contadores e latências recentes das chamadas a um host"""
+
+    def __init__(self, janela=200):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self._latencias = deque(maxlen=janela)
+        self._lock = threading.Lock()
+
+    def record(self, latencia, erro=False):
+        with self._lock:
+            self.requests += 1
+            if erro:
+                self.errors += 1
+            self._latencias.append(latencia)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencias = sorted(self._latencias)
+            requests_, errors, retries, rejected = self.requests, self.errors, self.retries, self.rejected
+
+        def percentil(p):
+            if not latencias:
+                return None
+            return round(latencias[min(len(latencias) - 1, int(p * len(latencias)))] * 1000, 1)
+
+        return {
+            "requests": requests_,
+            "errors": errors,
+            "retries": retries,
+            "rejected": rejected,
+            "avg_ms": round(sum(latencias) / len(latencias) * 1000, 1) if latencias else None,
+            "p50_ms": percentil(0.5),
+            "p95_ms": percentil(0.95)
+        }
+
+class RateLimiter:
+    """
+    Limite de chamadas por segundo (token bucket) compartilhado entre threads
+
+    Permite rajadas de até burst chamadas e, depois delas, libera uma chamada a
+    cada 1/rate segundos. Cada acquire reserva sua vez e espera só o necessário,
+    então chamadas simultâneas ficam escalonadas em vez de competirem. Com rate
+    <= 0 não há limite.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1.0, float(burst if burst is not None else rate))
+        self._tokens = self.burst
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+        self.esperas = 0
+
+    def _reservar(self):
+        """Reserva uma chamada e retorna quantos segundos esperar por ela"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (agora - self._atualizado) * self.rate)
+            self._atualizado = agora
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            self.esperas += 1
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        atraso = self._reservar()
+        if atraso > 0:
+            time.sleep(atraso)
+
+    async def acquire_async(self):
+        atraso = self._reservar()
+        if atraso > 0:
+            await asyncio.sleep(atraso)
+
+class HttpClient:
+    """
+    Cliente HTTP compartilhado pelas chamadas externas (RapidAPI, sites, imagens, webhooks)
+
+    Mantém uma sessão com pool de conexões por host, aplica timeouts de conexão e
+    leitura, repete chamadas idempotentes com espera exponencial e jitter, e protege
+    cada host com um circuit breaker.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _host(url):
+        partes = urlsplit(url)
+        return f"{partes.scheme}://{partes.netloc}"
+
+    def _guards(self, host):
+        """Circuit breaker e estatísticas do host, criados no primeiro uso"""
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+                self._stats[host] = HostStats()
+            return self._breakers[host], self._stats[host]
+
+    def _get(self, host):
+        breaker, stats = self._guards(host)
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session, breaker, stats
+
+    @staticmethod
+    def _backoff(tentativa, response=None):
+        """Espera antes da próxima tentativa; respeita Retry-After quando informado"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), HTTP_BACKOFF_MAX_SECONDS)
+        atraso = min(HTTP_BACKOFF_BASE_SECONDS * (2 ** tentativa), HTTP_BACKOFF_MAX_SECONDS)
+        return atraso * random.uniform(0.5, 1.5)
+
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """
+        Faz uma chamada HTTP
+
+        Args:
+            method: Método HTTP
+            url: URL completa
+            timeout: (conexão, leitura) em segundos; padrão HTTP_CONNECT_TIMEOUT/HTTP_READ_TIMEOUT
+            retries: Novas tentativas; padrão HTTP_MAX_RETRIES para métodos idempotentes e 0 para os demais
+            **kwargs: Repassados ao requests (params, headers, json, data...)
+
+        Returns:
+            requests.Response: A última resposta recebida (inclusive de erro)
+
+        Raises:
+            CircuitOpenError: Se o circuito do host estiver aberto
+            requests.RequestException: Se a última tentativa falhar sem resposta
+        """
+        method = method.upper()
+        host = self._host(url)
+        session, breaker, stats = self._get(host)
+        if timeout is None:
+            timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        if retries is None:
+            retries = HTTP_MAX_RETRIES if method in IDEMPOTENT_METHODS else 0
+
+        tentativa = 0
+        while True:
+            if not breaker.allow():
+                stats.record_rejected()
+                raise CircuitOpenError(f"Circuito aberto para {host}")
+
+            inicio = time.perf_counter()
+            response = None
+            erro = None
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                erro = e
+            except BaseException:
+                # Cancelamentos e erros inesperados não podem deixar a chamada de
+                # teste do circuito pendente, o que bloquearia o host para sempre
+                breaker.release()
+                raise
+            latencia = time.perf_counter() - inicio
+
+            falhou = erro is not None or response.status_code in RETRY_STATUS
+            stats.record(latencia, erro=falhou)
+            if falhou:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if not falhou or tentativa >= retries:
+                if erro is not None:
+                    raise erro
+                return response
+
+            tentativa += 1
+            stats.record_retry()
+            atraso = self._backoff(tentativa - 1, response)
+            motivo = str(erro) if erro is not None else f"status {response.status_code}"
+            logger.warning(f"Falha em {method} {host} ({motivo}), tentativa {tentativa} de {retries} em {atraso:.1f}s")
+            time.sleep(atraso)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Latência, erros e estado do circuito por host"""
+        with self._lock:
+            hosts = list(self._stats.items())
+        return {
+            host: {**stats.snapshot(), "circuit": self._breakers[host].state}
+            for host, stats in hosts
+        }
+
+class AsyncHttpClient:
+    """
+    Versão assíncrona do HttpClient, sobre httpx.AsyncClient
+
+    Usada pelos endpoints assíncronos: enquanto uma chamada externa espera a
+    resposta, o mesmo worker atende outras requisições. Timeouts, novas tentativas
+    e respostas seguem as mesmas regras do cliente síncrono, e o circuit breaker e
+    as estatísticas de cada host são compartilhados com ele.
+    """
+
+    def __init__(self, sync_client):
+        self._sync = sync_client
+        self._client = None
+        self._loop = None
+
+    def _get_client(self):
+        # O pool de conexões do httpx pertence ao event loop em que foi criado
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=HTTP_POOL_SIZE)
+            self._client = httpx.AsyncClient(limits=limits)
+            self._loop = loop
+        return self._client
+
+    async def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """
+        Faz uma chamada HTTP sem bloquear o event loop
+
+        Mesmos argumentos de HttpClient.request; **kwargs são repassados ao httpx
+        (params, headers, json, content...).
+
+        Returns:
+            httpx.Response: A última resposta recebida (inclusive de erro)
+
+        Raises:
+            CircuitOpenError: Se o circuito do host estiver aberto
+            httpx.HTTPError: Se a última tentativa falhar sem resposta
+        """
+        method = method.upper()
+        host = HttpClient._host(url)
+        breaker, stats = self._sync._guards(host)
+        client = self._get_client()
+        if timeout is None:
+            timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        if retries is None:
+            retries = HTTP_MAX_RETRIES if method in IDEMPOTENT_METHODS else 0
+
+        tentativa = 0
+        while True:
+            if not breaker.allow():
+                stats.record_rejected()
+                raise CircuitOpenError(f"Circuito aberto para {host}")
+
+            inicio = time.perf_counter()
+            response = None
+            erro = None
+            try:
+                response = await client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.HTTPError as e:
+                erro = e
+            except BaseException:
+                # Inclui asyncio.CancelledError (cliente desconectou, wait_for expirou)
+                breaker.release()
+                raise
+            latencia = time.perf_counter() - inicio
+
+            falhou = erro is not None or response.status_code in RETRY_STATUS
+            stats.record(latencia, erro=falhou)
+            if falhou:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if not falhou or tentativa >= retries:
+                if erro is not None:
+                    raise erro
+                return response
+
+            tentativa += 1
+            stats.record_retry()
+            atraso = HttpClient._backoff(tentativa - 1, response)
+            motivo = (str(erro) or type(erro).__name__) if erro is not None else f"status {response.status_code}"
+            logger.warning(f"Falha em {method} {host} ({motivo}), tentativa {tentativa} de {retries} em {atraso:.1f}s")
+            await asyncio.sleep(atraso)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+http_client = HttpClient()
+async_http_client = AsyncHttpClient(http_client)
+
+def get_http_stats():
+    return http_client.stats()
@@ -0,0 +1,137 @@
+import os
+import uuid
+import socket
+import threading
+import logging
+from dotenv import load_dotenv
+
+from database import acquire_lease, release_lease
+
+logger = logging.getLogger("shopee_monitor")
+
+# Tentar carregar o arquivo .env, mas não falhar se não existir
+try:
+    load_dotenv()
+except Exception as e:
+    logger.warning(f"Aviso: Não foi possível carregar o arquivo .env em leader.py: {str(e)}")
+
+# Validade da liderança do scheduler; o líder renova a cada um terço desse tempo
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "30"))
+# Validade da trava de um job em execução; renovada a cada um terço desse tempo enquanto
+# o job roda, então só determina quanto tempo a trava de um processo que caiu bloqueia o job
+JOB_LOCK_TTL_SECONDS = int(os.getenv("JOB_LOCK_TTL_SECONDS", "90"))
+
+# Identifica este processo nas reservas
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def run_exclusive(nome, func, *args, ttl=None, **kwargs):
+    """
+    Executa func só se nenhuma outra execução do mesmo job estiver em andamento
+
+    A trava fica no banco, então vale entre processos (vários workers do uvicorn,
+    execução manual pela API e pelo scheduler ao mesmo tempo). Tem validade curta e
+    é renovada por uma thread enquanto func roda: se o processo cair no meio da
+    execução, outro worker pode rodar o job assim que ela expirar.
+
+    Returns:
+        O retorno de func, ou None se o job já estava em execução
+    """
+    chave = f"job:{nome}"
+    # Dono próprio por execução: o mesmo processo também não pode rodar o job duas vezes
+    dono = f"{INSTANCE_ID}:{uuid.uuid4().hex[:8]}"
+    ttl = ttl or JOB_LOCK_TTL_SECONDS
+    try:
+        travado = acquire_lease(chave, dono, ttl)
+    except Exception as e:
+        logger.error(f"Erro ao obter trava do job {nome}: {str(e)}")
+        return None
+    if not travado:
+        logger.info(f"Job {nome} já está em execução, pulando")
+        return None
+
+    parar = threading.Event()
+    
+    def renovar():
+        while not parar.wait(max(1, ttl / 3)):
+            try:
+                if not acquire_lease(chave, dono, ttl):
+                    logger.warning(f"Trava do job {nome} foi perdida durante a execução")
+                    return
+            except Exception as e:
+                logger.error(f"Erro ao renovar trava do job {nome}: {str(e)}")
+                
+    heartbeat = threading.Thread(target=renovar, name=f"job-lock-{nome}", daemon=True)
+    heartbeat.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        parar.set()
+        heartbeat.join(timeout=10)
+        try:
+            release_lease(chave, dono)
+        except Exception as e:
+            logger.error(f"Erro ao liberar trava do job {nome}: {str(e)}")
+
+class SchedulerLeader:
+    """
+    Garante que só um processo rode os jobs agendados
+
+    Todos os processos iniciam o scheduler pausado e disputam uma reserva no banco;
+    quem a obtém retoma o scheduler e a renova periodicamente. Se o líder cair, a
+    reserva expira e outro processo assume. Sem acesso ao banco o processo deixa de
+    se considerar líder e pausa o scheduler.
+    """
+
+    def __init__(self, scheduler, nome="scheduler", ttl_seconds=LEADER_LEASE_SECONDS, dono=None):
+        self.scheduler = scheduler
+        self.nome = nome
+        self.ttl_seconds = ttl_seconds
+        # Identificação deste processo na reserva (padrão: INSTANCE_ID)
+        self.dono = dono or INSTANCE_ID
+        self.lider = False
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.scheduler.start(paused=True)
+        self._stop_event.clear()
+        self._verificar()
+        self._thread = threading.Thread(target=self._run, name="scheduler-leader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.scheduler.shutdown()
+        if self.lider:
+            try:
+                release_lease(self.nome, self.dono)
+            except Exception as e:
+                logger.error(f"Erro ao liberar liderança do scheduler: {str(e)}")
+            self.lider = False
+
+    def _run(self):
+        while not self._stop_event.wait(max(1, self.ttl_seconds / 3)):
+            self._verificar()
+
+    def _verificar(self):
+        try:
+            lider = acquire_lease(self.nome, self.dono, self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Erro ao renovar liderança do scheduler: {str(e)}")
+            lider = False
+
+        if lider and not self.lider:
+            self.scheduler.resume()
+            logger.info(f"Processo {self.dono} assumiu o scheduler")
+        elif not lider and self.lider:
+            self.scheduler.pause()
+            logger.warning(f"Processo {self.dono} perdeu a liderança, scheduler pausado")
+        self.lider = lider
+
+    def stats(self):
+        return {
+            "instance": self.dono,
+            "leader": self.lider
+        }
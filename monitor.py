@@ -1,15 +1,30 @@
 import os
 import time
 import json
-import requests
+import asyncio
 import logging
+import threading
 import pytz
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
-from coupon_extractor import extract_with_vision
-from database import save_cupom, cupom_exists, mark_cupom_sent
-from webhook import send_to_webhook
+from coupon_extractor import (
+    extract_with_vision, extract_with_vision_async, extract_with_vision_batch,
+    fetch_image_bytes, fetch_image_bytes_async, prescreen_image, PRESCREEN_ENABLED, VISION_BATCH_SIZE
+)
+from database import (
+    save_cupom, mark_cupom_sent,
+    story_already_processed, mark_story_processed, purge_expired_stories,
+    seed_perfis, get_perfis_para_consulta, mark_perfis_consultados,
+    reserve_daily_calls, get_daily_calls
+)
+from webhook import (
+    send_to_webhook, send_batch_to_webhook, enqueue_cupom, drain_outbox, has_digest_subscribers,
+    WEBHOOK_OUTBOX_ENABLED
+)
+from leader import run_exclusive
+from http_client import http_client, async_http_client, RateLimiter
 
 # Tentar carregar o arquivo .env, mas não falhar se não existir
 try:
@@ -31,8 +46,47 @@ logger = logging.getLogger("shopee_monitor")
 # Variáveis de configuração
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY", "dafe59802dmshe73b7630abf21b8p174a10jsn5bb61c1ca516")
 RAPIDAPI_HOST = os.getenv("RAPIDAPI_HOST", "mediafy-api.p.rapidapi.com")
+# Perfis iniciais, separados por vírgula; depois de cadastrados, os perfis são geridos
+# no banco (endpoints /perfis)
 INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME", "shopee_br")
+INSTAGRAM_USERNAMES = [username.strip() for username in INSTAGRAM_USERNAME.split(",") if username.strip()]
 URL_EMBED_SAFE = os.getenv("URL_EMBED_SAFE", "true")
+# Quantidade máxima de stories processados em paralelo (1 = sequencial)
+MONITOR_MAX_WORKERS = int(os.getenv("MONITOR_MAX_WORKERS", "4"))
+# Perfis consultados em paralelo na API de stories
+MONITOR_PROFILE_WORKERS = int(os.getenv("MONITOR_PROFILE_WORKERS", "8"))
+# Máximo de perfis consultados por execução (0 = todos cujo intervalo mínimo já passou)
+MONITOR_PROFILES_PER_RUN = int(os.getenv("MONITOR_PROFILES_PER_RUN", "0"))
+# Limite global de consultas por segundo à API de stories, somando todos os perfis (0 = sem limite)
+STORIES_RATE_LIMIT_PER_SECOND = float(os.getenv("STORIES_RATE_LIMIT_PER_SECOND", "5"))
+
+# Polling adaptativo dos stories (substitui os horários fixos do scheduler)
+ADAPTIVE_POLLING_ENABLED = os.getenv("ADAPTIVE_POLLING_ENABLED", "true").lower() == "true"
+# Frequência com que o scheduler pergunta ao poller se já é hora de consultar a API
+POLL_TICK_SECONDS = int(os.getenv("POLL_TICK_SECONDS", "30"))
+# Intervalo perto da hora cheia e logo depois de aparecer um story novo
+POLL_HOT_INTERVAL_SECONDS = int(os.getenv("POLL_HOT_INTERVAL_SECONDS", "120"))
+# Intervalo inicial fora da janela quente; dobra a cada consulta sem novidade até o máximo
+POLL_MIN_INTERVAL_SECONDS = int(os.getenv("POLL_MIN_INTERVAL_SECONDS", "300"))
+POLL_MAX_INTERVAL_SECONDS = int(os.getenv("POLL_MAX_INTERVAL_SECONDS", "1800"))
+# Minutos antes/depois da hora cheia tratados como janela quente
+POLL_HOT_MINUTES_BEFORE = int(os.getenv("POLL_HOT_MINUTES_BEFORE", "10"))
+POLL_HOT_MINUTES_AFTER = int(os.getenv("POLL_HOT_MINUTES_AFTER", "10"))
+# Por quanto tempo manter o intervalo curto depois de um story novo
+POLL_BOOST_SECONDS = int(os.getenv("POLL_BOOST_SECONDS", "600"))
+# Horário de monitoramento (horas cheias de início e fim, horário de Brasília)
+POLL_ACTIVE_START_HOUR = int(os.getenv("POLL_ACTIVE_START_HOUR", "9"))
+POLL_ACTIVE_END_HOUR = int(os.getenv("POLL_ACTIVE_END_HOUR", "24"))
+# Intervalo fora do horário de monitoramento (0 = não consulta)
+POLL_IDLE_INTERVAL_SECONDS = int(os.getenv("POLL_IDLE_INTERVAL_SECONDS", "0"))
+# Máximo de consultas à API de stories por dia (cada perfil consultado conta uma). O
+# contador fica no banco e vale para todos os processos e execuções manuais
+POLL_DAILY_BUDGET = int(os.getenv("POLL_DAILY_BUDGET", "300"))
+# Nome do orçamento diário da API de stories na tabela de consumo
+STORIES_BUDGET = "stories"
+
+# Por quanto tempo o último resultado da API de stories é reaproveitado (0 = sempre consulta)
+STORIES_CACHE_TTL_SECONDS = float(os.getenv("STORIES_CACHE_TTL_SECONDS", "30"))
 
 # Fuso horário de Brasília
 BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
@@ -55,17 +109,12 @@ def check_is_monitoring_time():
     minutes = now.minute
     return minutes >= 50 or minutes <= 10
 
-def get_stories():
-    """
-    Busca os stories do perfil configurado
-    
-    Returns:
-        list: Lista de itens de stories ou None em caso de erro
-    """
+def _stories_request(username=None):
+    """URL, headers e parâmetros da consulta de stories de um perfil na RapidAPI"""
     url = f"https://mediafy-api.p.rapidapi.com/v1/stories"
     
     querystring = {
-        "username_or_id_or_url": INSTAGRAM_USERNAME,
+        "username_or_id_or_url": username or INSTAGRAM_USERNAMES[0],
         "url_embed_safe": URL_EMBED_SAFE
     }
     
@@ -74,139 +123,516 @@ def get_stories():
         "x-rapidapi-key": RAPIDAPI_KEY
     }
     
+    return url, headers, querystring
+
+def _parse_stories_response(response):
+    """Interpreta a resposta da RapidAPI e retorna os itens de stories (ou None)"""
+    logger.info(f"Status code da resposta: {response.status_code}")
+    
+    # Registrar os headers para debug
+    logger.info(f"Headers usados: Host={RAPIDAPI_HOST}, Key={RAPIDAPI_KEY[:8]}...")
+    
+    # Tentar exibir a resposta em caso de erro
+    if response.status_code != 200:
+        logger.error(f"Erro na resposta: {response.text[:500]}")
+        
+    response.raise_for_status()
+    
+    # Verificar se a resposta é um JSON válido
     try:
-        logger.info(f"Fazendo requisição para a API RapidAPI: {url}")
-        logger.info(f"Username: {INSTAGRAM_USERNAME}")
-        logger.info(f"URL embed safe: {URL_EMBED_SAFE}")
+        data = response.json()
+        logger.info("Resposta recebida e convertida para JSON com sucesso")
+    except ValueError:
+        logger.error(f"Resposta não é um JSON válido: {response.text[:200]}")
+        return None
+    
+    # Logging para debug da estrutura da resposta
+    if "data" in data:
+        logger.info("Campo 'data' encontrado na resposta")
+        if "items" in data["data"]:
+            logger.info(f"Encontrados {len(data['data']['items'])} stories")
+            
+            # Log da primeira imagem para debug
+            if len(data["data"]["items"]) > 0:
+                sample_item = data["data"]["items"][0]
+                logger.info(f"Exemplo de item: id={sample_item.get('id')}, tipo={sample_item.get('media_type')}")
+                
+                # Ver se há imagens
+                if "image_versions" in sample_item and "items" in sample_item["image_versions"]:
+                    image_url = sample_item["image_versions"]["items"][0].get("url")
+                    logger.info(f"URL da primeira imagem: {image_url}")
+                else:
+                    logger.warning("Estrutura de imagem não encontrada no primeiro item")
+            
+            return data["data"]["items"]
+        else:
+            logger.error("Campo 'items' não encontrado dentro de 'data'")
+            logger.debug(f"Conteúdo de 'data': {json.dumps(data['data'])[:500]}")
+    else:
+        logger.error(f"Estrutura de resposta inesperada: {json.dumps(data)[:500]}")
+        
+    return None
+
+class StoriesFetcher:
+    """
+    Consulta a API de stories sem repetir chamadas desnecessárias
+    
+    - Single-flight: quem pede os stories enquanto já existe uma consulta em
+      andamento (scheduler, /monitor, /test-stories) espera e recebe o mesmo resultado.
+    - Cache: o último resultado é reaproveitado por ttl_seconds.
+    - Requisição condicional: se a API devolver ETag/Last-Modified, a próxima
+      consulta os envia e um 304 renova o resultado em cache.
+    - Limite global: as consultas que chegam à API passam pelo rate_limiter.
+    
+    Chamadas síncronas e assíncronas compartilham o mesmo estado: a consulta em
+    andamento é um Future que threads aguardam com result() e corrotinas com await.
+    """
+    
+    def __init__(self, ttl_seconds, rate_limiter=None):
+        self.ttl_seconds = ttl_seconds
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+        self._cache = {}
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        self.api_calls = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.not_modified = 0
         
-        response = requests.get(url, headers=headers, params=querystring)
-        logger.info(f"Status code da resposta: {response.status_code}")
+    @staticmethod
+    def _chave(url, querystring):
+        return url, tuple(sorted(querystring.items()))
         
-        # Registrar os headers para debug
-        logger.info(f"Headers usados: Host={RAPIDAPI_HOST}, Key={RAPIDAPI_KEY[:8]}...")
+    def _reservar(self, chave):
+        """
+        Decide como atender um pedido
         
-        # Tentar exibir a resposta em caso de erro
-        if response.status_code != 200:
-            logger.error(f"Erro na resposta: {response.text[:500]}")
+        Returns:
+            tuple: ("cache", itens), ("aguardar", future) ou ("consultar", future, headers condicionais)
+        """
+        with self._lock:
+            entrada = self._cache.get(chave)
+            if entrada and time.monotonic() - entrada["obtido_em"] < self.ttl_seconds:
+                self.cache_hits += 1
+                return "cache", entrada["items"]
+                
+            future = self._em_andamento.get(chave)
+            if future is not None:
+                self.coalesced += 1
+                return "aguardar", future
+                
+            future = Future()
+            self._em_andamento[chave] = future
+            self.api_calls += 1
+            return "consultar", future, dict(entrada["validadores"]) if entrada else {}
             
-        response.raise_for_status()
+    def _interpretar(self, chave, response):
+        if response.status_code == 304:
+            with self._lock:
+                entrada = self._cache.get(chave)
+                if entrada:
+                    entrada["obtido_em"] = time.monotonic()
+                    self.not_modified += 1
+                    logger.info("Stories não mudaram desde a última consulta (304)")
+                    return entrada["items"]
+                    
+        items = _parse_stories_response(response)
+        if items is not None:
+            validadores = {}
+            if response.headers.get("ETag"):
+                validadores["If-None-Match"] = response.headers["ETag"]
+            if response.headers.get("Last-Modified"):
+                validadores["If-Modified-Since"] = response.headers["Last-Modified"]
+            with self._lock:
+                self._cache[chave] = {"items": items, "obtido_em": time.monotonic(), "validadores": validadores}
+        return items
+        
+    def _liberar(self, chave, future, items):
+        with self._lock:
+            self._em_andamento.pop(chave, None)
+        future.set_result(items)
         
-        # Verificar se a resposta é um JSON válido
+    @staticmethod
+    def _log_consulta(url, querystring):
+        logger.info(f"Fazendo requisição para a API RapidAPI: {url}")
+        logger.info(f"Username: {querystring['username_or_id_or_url']}")
+        logger.info(f"URL embed safe: {URL_EMBED_SAFE}")
+        
+    def get(self, username=None):
+        url, headers, querystring = _stories_request(username)
+        chave = self._chave(url, querystring)
+        acao, valor, *condicionais = self._reservar(chave)
+        if acao == "cache":
+            logger.info("Stories reaproveitados da última consulta à API")
+            return valor
+        if acao == "aguardar":
+            logger.info("Consulta de stories já em andamento, aguardando o resultado")
+            return valor.result()
+            
+        items = None
         try:
-            data = response.json()
-            logger.info("Resposta recebida e convertida para JSON com sucesso")
-        except ValueError:
-            logger.error(f"Resposta não é um JSON válido: {response.text[:200]}")
-            return None
+            self.rate_limiter.acquire()
+            self._log_consulta(url, querystring)
+            response = http_client.get(url, headers={**headers, **condicionais[0]}, params=querystring)
+            items = self._interpretar(chave, response)
+        except Exception as e:
+            logger.error(f"Erro ao buscar stories: {str(e)}")
+        finally:
+            self._liberar(chave, valor, items)
+        return items
         
-        # Logging para debug da estrutura da resposta
-        if "data" in data:
-            logger.info("Campo 'data' encontrado na resposta")
-            if "items" in data["data"]:
-                logger.info(f"Encontrados {len(data['data']['items'])} stories")
-                
-                # Log da primeira imagem para debug
-                if len(data["data"]["items"]) > 0:
-                    sample_item = data["data"]["items"][0]
-                    logger.info(f"Exemplo de item: id={sample_item.get('id')}, tipo={sample_item.get('media_type')}")
-                    
-                    # Ver se há imagens
-                    if "image_versions" in sample_item and "items" in sample_item["image_versions"]:
-                        image_url = sample_item["image_versions"]["items"][0].get("url")
-                        logger.info(f"URL da primeira imagem: {image_url}")
-                    else:
-                        logger.warning("Estrutura de imagem não encontrada no primeiro item")
-                
-                return data["data"]["items"]
-            else:
-                logger.error("Campo 'items' não encontrado dentro de 'data'")
-                logger.debug(f"Conteúdo de 'data': {json.dumps(data['data'])[:500]}")
-        else:
-            logger.error(f"Estrutura de resposta inesperada: {json.dumps(data)[:500]}")
+    async def get_async(self, username=None):
+        url, headers, querystring = _stories_request(username)
+        chave = self._chave(url, querystring)
+        acao, valor, *condicionais = self._reservar(chave)
+        if acao == "cache":
+            logger.info("Stories reaproveitados da última consulta à API")
+            return valor
+        if acao == "aguardar":
+            logger.info("Consulta de stories já em andamento, aguardando o resultado")
+            return await asyncio.wrap_future(valor)
             
+        items = None
+        try:
+            await self.rate_limiter.acquire_async()
+            self._log_consulta(url, querystring)
+            response = await async_http_client.get(url, headers={**headers, **condicionais[0]}, params=querystring)
+            items = self._interpretar(chave, response)
+        except Exception as e:
+            logger.error(f"Erro ao buscar stories: {str(e)}")
+        finally:
+            self._liberar(chave, valor, items)
+        return items
+        
+    def stats(self):
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "api_calls": self.api_calls,
+                "cache_hits": self.cache_hits,
+                "coalesced": self.coalesced,
+                "not_modified": self.not_modified,
+                # Consultas que não chegaram à RapidAPI (um 304 ainda conta na cota)
+                "calls_avoided": self.cache_hits + self.coalesced
+            }
+
+stories_rate_limiter = RateLimiter(STORIES_RATE_LIMIT_PER_SECOND)
+stories_fetcher = StoriesFetcher(STORIES_CACHE_TTL_SECONDS, stories_rate_limiter)
+
+def get_stories(username=None):
+    """
+    Busca os stories de um perfil (padrão: o primeiro de INSTAGRAM_USERNAME)
+    
+    Chamadas simultâneas compartilham uma única consulta à API e o resultado é
+    reaproveitado por STORIES_CACHE_TTL_SECONDS (ver StoriesFetcher).
+    
+    Returns:
+        list: Lista de itens de stories ou None em caso de erro
+    """
+    return stories_fetcher.get(username)
+
+async def get_stories_async(username=None):
+    """Versão assíncrona de get_stories"""
+    return await stories_fetcher.get_async(username)
+
+def fetch_profiles_stories(usernames):
+    """
+    Busca os stories de vários perfis em paralelo
+    
+    O paralelismo é limitado por MONITOR_PROFILE_WORKERS e o ritmo das chamadas
+    pelo limite global da API (STORIES_RATE_LIMIT_PER_SECOND).
+    
+    Returns:
+        list: Pares (username, itens de stories ou None em caso de erro), na ordem informada
+    """
+    workers = max(1, min(MONITOR_PROFILE_WORKERS, len(usernames)))
+    if workers == 1:
+        return [(username, get_stories(username)) for username in usernames]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="perfil") as executor:
+        return list(zip(usernames, executor.map(get_stories, usernames)))
+
+def prepare_story_item(item, use_ledger=True, fetch=True, perfil=None):
+    """
+    Filtra um item de story e prepara a imagem para a extração
+    
+    Descarta vídeos, stories já analisados e imagens reprovadas na pré-triagem.
+    
+    Args:
+        item: Item do story do Instagram
+        use_ledger: Consultar/registrar o story no histórico de stories processados
+        fetch: Baixar a imagem e aplicar a pré-triagem; sem isso image_bytes fica None
+               e quem chama faz as duas etapas (ver process_story_item_async)
+        perfil: Perfil do Instagram que publicou o story
+        
+    Returns:
+        dict: Contexto do story (item, story_id, image_url, image_bytes, use_ledger, perfil)
+              ou None se o story não precisar ser enviado para a Vision API
+    """
+    # Verificar se é uma imagem (não vídeo)
+    if item.get("is_video") or item.get("media_type") != 1:
+        logger.info(f"Item ignorado: não é uma imagem, media_type={item.get('media_type')}")
         return None
-            
-    except Exception as e:
-        logger.error(f"Erro ao buscar stories: {str(e)}")
+    
+    # Obter URL da imagem de melhor qualidade
+    image_url = None
+    if "image_versions" in item and "items" in item["image_versions"] and item["image_versions"]["items"]:
+        # Pegar a versão de maior resolução
+        image_url = item["image_versions"]["items"][0].get("url")
+        logger.info(f"URL da imagem encontrada: {image_url}")
+    else:
+        logger.warning(f"Estrutura de imagem não encontrada no item: {json.dumps(item)[:200]}")
+        return None
+    
+    if not image_url:
+        logger.warning("URL da imagem não encontrada após parsing")
         return None
+    
+    story_id = item.get("id")
+    use_ledger = use_ledger and story_id is not None
+    
+    # Stories já analisados (com ou sem cupom) não voltam para a Vision API
+    if use_ledger and story_already_processed(story_id):
+        logger.info(f"Story {story_id} já analisado anteriormente, pulando")
+        return None
+        
+    story = {
+        "item": item,
+        "story_id": story_id,
+        "image_url": image_url,
+        "image_bytes": None,
+        "use_ledger": use_ledger,
+        "perfil": perfil
+    }
+    if not fetch:
+        return story
+        
+    # Baixar a imagem uma única vez para a pré-triagem e para a extração
+    story["image_bytes"] = fetch_image_bytes(image_url)
+    return story if prescreen_story(story) else None
 
-def process_story_item(item):
+def prescreen_story(story):
+    """
+    Pré-triagem local: descarta stories que claramente não são cupons
+    
+    O descarte não vai para o registro de stories processados: a pontuação é só
+    uma estimativa, então o story volta a ser avaliado nas próximas execuções (a
+    pré-triagem é barata) e passa a ir para a Vision API se o limite for ajustado.
+    
+    Returns:
+        bool: True se o story deve seguir para a Vision API
+    """
+    if not PRESCREEN_ENABLED or not story["image_bytes"]:
+        return True
+        
+    aprovada, score = prescreen_image(story["image_bytes"])
+    if not aprovada:
+        logger.info(f"Story {story['story_id']} descartado na pré-triagem (pontuação {score:.2f})")
+    return aprovada
+
+def finalize_story_item(story, extraction_result):
+    """
+    Registra o resultado da extração de um story e salva o cupom, se for novo
+    
+    Args:
+        story: Contexto retornado por prepare_story_item
+        extraction_result: Resultado de extract_with_vision para a imagem do story
+        
+    Returns:
+        dict: Informações do cupom encontrado ou None se não houver cupom novo
+    """
+    item = story["item"]
+    story_id = story["story_id"]
+    use_ledger = story["use_ledger"]
+    
+    logger.info(f"Resultado da extração: {json.dumps(extraction_result)}")
+    
+    if not extraction_result.get("success"):
+        logger.info(f"Nenhum cupom encontrado na imagem ou erro na extração: {extraction_result.get('error')}")
+        # Só registramos o resultado negativo quando a imagem não tem cupom;
+        # falhas da API serão tentadas novamente na próxima execução
+        if use_ledger and extraction_result.get("no_coupon"):
+            mark_story_processed(story_id, "sem_cupom", taken_at=item.get("taken_at"))
+        return None
+        
+    # Obter o código e horário do cupom
+    codigo = extraction_result.get("codigo")
+    horario = extraction_result.get("horario")
+    descricao = extraction_result.get("descricao")
+    valor_desconto = extraction_result.get("valor_desconto")
+    
+    if not codigo:
+        logger.info("Código do cupom não encontrado na imagem")
+        if use_ledger:
+            mark_story_processed(story_id, "sem_cupom", taken_at=item.get("taken_at"))
+        return None
+        
+    # Salvar o novo cupom no banco de dados. O INSERT ignora códigos já existentes,
+    # inclusive quando dois stories com o mesmo cupom são processados em paralelo
+    cupom_data = save_cupom(
+        codigo=codigo,
+        descricao=descricao,
+        valor_desconto=valor_desconto,
+        horario=horario,
+        imagem_url=story["image_url"],
+        detalhes=json.dumps({"story_id": story_id, "taken_at": item.get("taken_at"), "perfil": story.get("perfil")}),
+        origem="instagram",
+        perfil=story.get("perfil")
+    )
+    
+    if use_ledger:
+        mark_story_processed(story_id, "cupom", codigo=codigo, taken_at=item.get("taken_at"))
+    
+    if cupom_data:
+        logger.info(f"Novo cupom encontrado e salvo: {codigo}")
+        return cupom_data
+    else:
+        logger.info(f"Cupom {codigo} já processado anteriormente")
+        return None
+
+def process_story_item(item, use_ledger=True, perfil=None):
     """
     Processa um item de story para extrair o cupom
     
     Args:
         item: Item do story do Instagram
+        use_ledger: Consultar/registrar o story no histórico de stories processados
+        perfil: Perfil do Instagram que publicou o story
         
     Returns:
         dict: Informações do cupom encontrado ou None se não houver cupom
     """
     try:
-        # Verificar se é uma imagem (não vídeo)
-        if item.get("is_video") or item.get("media_type") != 1:
-            logger.info(f"Item ignorado: não é uma imagem, media_type={item.get('media_type')}")
-            return None
-        
-        # Obter URL da imagem de melhor qualidade
-        image_url = None
-        if "image_versions" in item and "items" in item["image_versions"] and item["image_versions"]["items"]:
-            # Pegar a versão de maior resolução
-            image_url = item["image_versions"]["items"][0].get("url")
-            logger.info(f"URL da imagem encontrada: {image_url}")
-        else:
-            logger.warning(f"Estrutura de imagem não encontrada no item: {json.dumps(item)[:200]}")
-            return None
-        
-        if not image_url:
-            logger.warning("URL da imagem não encontrada após parsing")
+        story = prepare_story_item(item, use_ledger=use_ledger, perfil=perfil)
+        if not story:
             return None
             
         # Extrair o código do cupom da imagem usando Vision
-        logger.info(f"Enviando imagem para análise com Vision API: {image_url}")
-        extraction_result = extract_with_vision(image_url)
-        
-        logger.info(f"Resultado da extração: {json.dumps(extraction_result)}")
+        logger.info(f"Enviando imagem para análise com Vision API: {story['image_url']}")
+        extraction_result = extract_with_vision(story["image_url"], image_bytes=story["image_bytes"])
         
-        if not extraction_result.get("success"):
-            logger.info(f"Nenhum cupom encontrado na imagem ou erro na extração: {extraction_result.get('error')}")
-            return None
+        return finalize_story_item(story, extraction_result)
             
-        # Obter o código e horário do cupom
-        codigo = extraction_result.get("codigo")
-        horario = extraction_result.get("horario")
-        descricao = extraction_result.get("descricao")
-        valor_desconto = extraction_result.get("valor_desconto")
-        
-        if not codigo:
-            logger.info("Código do cupom não encontrado na imagem")
+    except Exception as e:
+        logger.error(f"Erro ao processar item do story: {str(e)}")
+        return None
+
+async def process_story_item_async(item, use_ledger=True, perfil=None):
+    """
+    Versão assíncrona de process_story_item
+    
+    Download da imagem e Vision API são aguardados sem bloquear o event loop;
+    banco e pré-triagem (CPU) rodam em uma thread.
+    """
+    try:
+        story = await asyncio.to_thread(prepare_story_item, item, use_ledger, False, perfil)
+        if not story:
             return None
             
-        # Verificar se o cupom já existe no banco de dados
-        if cupom_exists(codigo):
-            logger.info(f"Cupom {codigo} já processado anteriormente")
+        story["image_bytes"] = await fetch_image_bytes_async(story["image_url"])
+        if not await asyncio.to_thread(prescreen_story, story):
             return None
             
-        # Salvar o novo cupom no banco de dados
-        cupom_data = save_cupom(
-            codigo=codigo,
-            descricao=descricao,
-            valor_desconto=valor_desconto,
-            horario=horario,
-            imagem_url=image_url,
-            detalhes=json.dumps({"story_id": item.get("id"), "taken_at": item.get("taken_at")}),
-            origem="instagram"
-        )
+        logger.info(f"Enviando imagem para análise com Vision API: {story['image_url']}")
+        extraction_result = await extract_with_vision_async(story["image_url"], image_bytes=story["image_bytes"])
         
-        if cupom_data:
-            logger.info(f"Novo cupom encontrado e salvo: {codigo}")
-            return cupom_data
-        else:
-            logger.warning(f"Erro ao salvar o cupom {codigo}")
-            return None
+        return await asyncio.to_thread(finalize_story_item, story, extraction_result)
             
     except Exception as e:
         logger.error(f"Erro ao processar item do story: {str(e)}")
         return None
 
+def _safe_prepare_story_item(item, perfil=None):
+    """prepare_story_item que registra o erro e descarta o story em vez de propagar"""
+    try:
+        return prepare_story_item(item, perfil=perfil)
+    except Exception as e:
+        logger.error(f"Erro ao preparar item do story: {str(e)}")
+        return None
+
+def _safe_finalize_story_item(story, extraction_result):
+    """finalize_story_item que registra o erro em vez de propagar"""
+    try:
+        return finalize_story_item(story, extraction_result)
+    except Exception as e:
+        logger.error(f"Erro ao processar item do story: {str(e)}")
+        return None
+
+def process_stories_batched(stories, executor=None, perfis=None):
+    """
+    Processa os stories agrupando as imagens em requisições em lote para a Vision API
+    
+    Args:
+        stories: Lista de itens de stories
+        executor: Executor opcional para preparar os stories em paralelo
+        perfis: Perfil de cada story, na mesma ordem
+        
+    Returns:
+        list: Cupons novos salvos, na ordem original dos stories
+    """
+    perfis = perfis or [None] * len(stories)
+    if executor:
+        preparados = list(executor.map(_safe_prepare_story_item, stories, perfis))
+    else:
+        preparados = [_safe_prepare_story_item(item, perfil) for item, perfil in zip(stories, perfis)]
+    candidatos = [story for story in preparados if story]
+    
+    if not candidatos:
+        return []
+        
+    logger.info(f"Enviando {len(candidatos)} imagens para a Vision API em lotes de até {VISION_BATCH_SIZE}")
+    resultados = extract_with_vision_batch(
+        [(story["image_url"], story["image_bytes"]) for story in candidatos],
+        batch_size=VISION_BATCH_SIZE
+    )
+    
+    cupons = []
+    for story, extraction_result in zip(candidatos, resultados):
+        cupom_data = _safe_finalize_story_item(story, extraction_result)
+        if cupom_data:
+            cupons.append(cupom_data)
+    return cupons
+
+def deliver_cupom(cupom_data):
+    """
+    Envia um cupom recém-salvo para o webhook e marca como enviado
+    
+    Com a fila do webhook ativa, o cupom é enfileirado e entregue em segundo plano,
+    com novas tentativas em caso de falha.
+    
+    Args:
+        cupom_data: Dicionário retornado por process_story_item (ou None)
+    """
+    if not cupom_data:
+        return
+    
+    if WEBHOOK_OUTBOX_ENABLED:
+        if enqueue_cupom(cupom_data):
+            logger.info(f"Cupom {cupom_data['codigo']} enfileirado para o webhook")
+        else:
+            logger.error(f"Falha ao enfileirar cupom {cupom_data['codigo']} para o webhook")
+        return
+    
+    # Enviar para webhook
+    webhook_success = send_to_webhook(cupom_data)
+    
+    if webhook_success:
+        mark_cupom_sent(cupom_data["codigo"])
+        logger.info(f"Cupom {cupom_data['codigo']} enviado com sucesso para webhook")
+    else:
+        logger.error(f"Falha ao enviar cupom {cupom_data['codigo']} para webhook")
+
+def deliver_cupons_digest(cupons):
+    """
+    Envia diretamente (sem a fila) os cupons encontrados em uma execução
+    
+    Usado quando a fila do webhook está desativada e há destinos em modo digest:
+    esses destinos recebem a rajada da execução em POSTs com até digest_max_itens
+    cupons; os demais recebem um POST por cupom.
+    """
+    for codigo in send_batch_to_webhook(cupons):
+        mark_cupom_sent(codigo)
+        logger.info(f"Cupom {codigo} enviado com sucesso para webhook")
+
 def monitor_stories():
     """
     Função principal para monitorar stories e processar cupons
@@ -220,30 +646,288 @@ def monitor_stories():
     #     logger.info("Fora do horário de monitoramento, pulando verificação")
     #     return
     
-    # Buscar stories recentes
-    stories = get_stories()
+    # Limpar registros de stories que já expiraram
+    try:
+        removidos = purge_expired_stories()
+        if removidos:
+            logger.info(f"{removidos} stories expirados removidos do histórico")
+    except Exception as e:
+        logger.error(f"Erro ao limpar histórico de stories: {str(e)}")
+    
+    # Perfis cujo intervalo mínimo já passou, dos mais prioritários para os menos
+    usernames = _perfis_da_execucao()
+    if not usernames:
+        logger.info("Nenhum perfil ativo aguardando consulta")
+        return {"stories": 0, "ultimo_taken_at": None, "perfis": 0}
+    
+    # Cada perfil consultado gasta uma chamada do orçamento diário, reservada no banco
+    # antes da consulta (vale também para /monitor em qualquer worker)
+    hoje = datetime.now(BRAZIL_TZ).date().isoformat()
+    reservadas = reserve_daily_calls(STORIES_BUDGET, hoje, len(usernames), POLL_DAILY_BUDGET)
+    if reservadas < len(usernames):
+        logger.warning(f"Orçamento diário da API de stories esgotado: {reservadas} de {len(usernames)} perfis serão consultados")
+        usernames = usernames[:reservadas]
+        if not usernames:
+            return {"stories": 0, "ultimo_taken_at": None, "perfis": 0}
+    
+    # Buscar stories recentes de todos os perfis em paralelo
+    logger.info(f"Consultando stories de {len(usernames)} perfis")
+    stories = []
+    perfis = []
+    consultados = {}
+    falhas = []
+    for username, items in fetch_profiles_stories(usernames):
+        if items is None:
+            # Erro na API: o perfil é consultado de novo depois de uma espera que
+            # cresce a cada falha, em vez de gastar o orçamento de toda execução
+            falhas.append(username)
+            continue
+        taken = [item.get("taken_at") for item in items if isinstance(item.get("taken_at"), (int, float))]
+        consultados[username] = int(max(taken)) if taken else None
+        stories.extend(items)
+        perfis.extend([username] * len(items))
+        
+    if consultados or falhas:
+        try:
+            mark_perfis_consultados(consultados, falhas)
+        except Exception as e:
+            logger.error(f"Erro ao registrar consulta dos perfis: {str(e)}")
     
     if not stories:
         logger.warning("Nenhum story encontrado ou erro na API")
-        return
+        return {"stories": 0, "ultimo_taken_at": None, "perfis": len(usernames)}
     
     logger.info(f"Encontrados {len(stories)} stories para analisar")
+    taken_ats = [item.get("taken_at") for item in stories if isinstance(item.get("taken_at"), (int, float))]
     
-    # Processar cada story
-    for item in stories:
-        cupom_data = process_story_item(item)
-        
-        if cupom_data:
-            # Enviar para webhook
-            webhook_success = send_to_webhook(cupom_data)
-            
-            if webhook_success:
-                mark_cupom_sent(cupom_data["codigo"])
-                logger.info(f"Cupom {cupom_data['codigo']} enviado com sucesso para webhook")
-            else:
-                logger.error(f"Falha ao enviar cupom {cupom_data['codigo']} para webhook")
+    max_workers = max(1, min(MONITOR_MAX_WORKERS, len(stories)))
+    
+    # Com a fila, o worker de cada destino já agrupa as rajadas (modo digest). Sem ela,
+    # os cupons da execução são juntados e enviados de uma vez no final
+    agrupar = not WEBHOOK_OUTBOX_ENABLED and has_digest_subscribers()
+    encontrados = []
+    
+    def entregar(cupom_data):
+        if not agrupar:
+            deliver_cupom(cupom_data)
+        elif cupom_data:
+            encontrados.append(cupom_data)
+    
+    if VISION_BATCH_SIZE > 1:
+        # Várias imagens por requisição para a Vision API; a preparação (download e
+        # pré-triagem) continua em paralelo
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="story") as executor:
+                cupons = process_stories_batched(stories, executor=executor, perfis=perfis)
+        else:
+            cupons = process_stories_batched(stories, perfis=perfis)
+        for cupom_data in cupons:
+            entregar(cupom_data)
+    elif max_workers == 1:
+        # Processar cada story sequencialmente
+        for item, perfil in zip(stories, perfis):
+            entregar(process_story_item(item, perfil=perfil))
+    else:
+        # Processar os stories em paralelo. O executor.map devolve os resultados
+        # na ordem original dos stories, então os envios para o webhook mantêm a
+        # ordem enquanto as extrações dos stories seguintes continuam rodando.
+        logger.info(f"Processando stories em paralelo com {max_workers} workers")
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="story") as executor:
+            for cupom_data in executor.map(_process_profile_story, stories, perfis):
+                entregar(cupom_data)
+                
+    if encontrados:
+        deliver_cupons_digest(encontrados)
     
     logger.info("Monitoramento finalizado")
+    return {
+        "stories": len(stories),
+        "ultimo_taken_at": max(taken_ats) if taken_ats else None,
+        "perfis": len(usernames)
+    }
+
+def _process_profile_story(item, perfil):
+    return process_story_item(item, perfil=perfil)
+
+def _perfis_da_execucao():
+    """Usernames a consultar nesta execução; na primeira vez cadastra os de INSTAGRAM_USERNAME"""
+    try:
+        seed_perfis(INSTAGRAM_USERNAMES)
+        perfis = get_perfis_para_consulta(limit=MONITOR_PROFILES_PER_RUN or None)
+    except Exception as e:
+        logger.error(f"Erro ao carregar perfis do banco, usando INSTAGRAM_USERNAME: {str(e)}")
+        return INSTAGRAM_USERNAMES
+    return [perfil["username"] for perfil in perfis]
+
+class AdaptiveStoryPoller:
+    """
+    Decide quando consultar a API de stories
+    
+    O scheduler chama tick() a cada POLL_TICK_SECONDS e a consulta só acontece quando
+    o intervalo atual venceu:
+    - perto da hora cheia e logo após um story novo (taken_at maior que o último
+      visto) o intervalo é curto (POLL_HOT_INTERVAL_SECONDS);
+    - fora disso começa em POLL_MIN_INTERVAL_SECONDS e dobra a cada consulta sem
+      novidade, até POLL_MAX_INTERVAL_SECONDS;
+    - fora da janela quente o intervalo nunca é menor que o ritmo que cabe no que
+      resta do orçamento diário, e nada é consultado depois de esgotá-lo.
+    
+    Cada perfil consultado gasta uma consulta do orçamento, reservada no banco por
+    monitor_stories (o contador sobrevive a reinícios e troca de líder e inclui as
+    execuções manuais); o ritmo considera a quantidade de perfis da última execução.
+    Execuções em que nenhum perfil estava devido não contam como consulta.
+    """
+    
+    def __init__(self, monitor=None):
+        self.monitor = monitor or monitor_stories
+        self._lock = threading.Lock()
+        self._ultima_consulta = None
+        self._ultimo_taken_at = None
+        self._boost_ate = None
+        self._sem_novidade = 0
+        self._perfis_por_execucao = 1
+        
+    def _janela_quente(self, agora):
+        """Perto de uma hora cheia dentro do horário de monitoramento (ex.: 8h50 até 0h10)"""
+        horas = {hora % 24 for hora in range(POLL_ACTIVE_START_HOUR, POLL_ACTIVE_END_HOUR + 1)}
+        minuto = agora.minute + agora.second / 60
+        if minuto >= 60 - POLL_HOT_MINUTES_BEFORE:
+            return (agora.hour + 1) % 24 in horas
+        return minuto <= POLL_HOT_MINUTES_AFTER and agora.hour in horas
+        
+    def _segundos_quentes_restantes(self, agora):
+        """Quanto ainda resta, a partir de agora, das janelas quentes do dia"""
+        meia_noite = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+        total = 0.0
+        for hora in range(POLL_ACTIVE_START_HOUR, POLL_ACTIVE_END_HOUR + 1):
+            virada = meia_noite + timedelta(hours=hora)
+            inicio = max(virada - timedelta(minutes=POLL_HOT_MINUTES_BEFORE), agora)
+            fim = virada + timedelta(minutes=POLL_HOT_MINUTES_AFTER)
+            if fim > inicio:
+                total += (fim - inicio).total_seconds()
+        return total
+        
+    def _horario_ativo(self, agora):
+        return POLL_ACTIVE_START_HOUR <= agora.hour < POLL_ACTIVE_END_HOUR or self._janela_quente(agora)
+        
+    def _consultas_hoje(self, agora):
+        """Consultas do dia feitas por qualquer processo (contador no banco)"""
+        try:
+            return get_daily_calls(STORIES_BUDGET, agora.date().isoformat())
+        except Exception as e:
+            logger.error(f"Erro ao ler o consumo diário da API de stories: {str(e)}")
+            return 0
+            
+    def next_interval(self, agora=None):
+        """
+        Intervalo atual entre consultas, em segundos
+        
+        Returns:
+            float ou None: None quando não deve haver consulta agora (fora do horário
+            ou orçamento esgotado)
+        """
+        agora = agora or datetime.now(BRAZIL_TZ)
+        # Execuções que ainda cabem no orçamento
+        restantes = (POLL_DAILY_BUDGET - self._consultas_hoje(agora)) / self._perfis_por_execucao
+        if restantes < 1:
+            return None
+            
+        # Parte do orçamento reservada para as janelas quentes que ainda faltam hoje;
+        # se não couber, as consultas nelas ficam mais espaçadas
+        segundos_quentes = self._segundos_quentes_restantes(agora)
+        reservadas = segundos_quentes / POLL_HOT_INTERVAL_SECONDS
+        
+        if self._janela_quente(agora) or (self._boost_ate and agora < self._boost_ate):
+            return max(POLL_HOT_INTERVAL_SECONDS, segundos_quentes / restantes)
+            
+        if self._horario_ativo(agora):
+            intervalo = min(POLL_MIN_INTERVAL_SECONDS * (2 ** self._sem_novidade), POLL_MAX_INTERVAL_SECONDS)
+        elif POLL_IDLE_INTERVAL_SECONDS > 0:
+            intervalo = POLL_IDLE_INTERVAL_SECONDS
+        else:
+            return None
+            
+        # Ritmo que faz o orçamento livre durar até o fim do dia
+        livres = restantes - reservadas
+        if livres < 1:
+            return None
+        fim_do_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        ritmo = (fim_do_dia - agora).total_seconds() / livres
+        return max(intervalo, ritmo)
+        
+    def due(self, agora=None):
+        """Verifica se já é hora de consultar a API"""
+        agora = agora or datetime.now(BRAZIL_TZ)
+        intervalo = self.next_interval(agora)
+        if intervalo is None:
+            return False
+        return self._ultima_consulta is None or (agora - self._ultima_consulta).total_seconds() >= intervalo
+        
+    def run(self):
+        """Consulta os stories agora e ajusta o ritmo conforme o resultado"""
+        with self._lock:
+            agora = datetime.now(BRAZIL_TZ)
+            anterior = self._ultima_consulta
+            self._ultima_consulta = agora
+            
+            resultado = None
+            try:
+                resultado = self.monitor()
+            finally:
+                # None: outra execução estava em andamento (ou houve erro)
+                if resultado is not None:
+                    perfis = resultado.get("perfis", 1)
+                    if perfis:
+                        self._perfis_por_execucao = perfis
+                        self._registrar_resultado(resultado, agora)
+                    else:
+                        # Nenhum perfil devido (ou orçamento esgotado): nenhuma consulta foi
+                        # feita, então nem o intervalo nem a espera sem novidade mudam
+                        self._ultima_consulta = anterior
+            return resultado
+            
+    def _registrar_resultado(self, resultado, agora):
+        taken_at = (resultado or {}).get("ultimo_taken_at")
+        if taken_at is not None and self._ultimo_taken_at is not None and taken_at > self._ultimo_taken_at:
+            logger.info("Story novo encontrado, aumentando a frequência de consultas")
+            self._boost_ate = agora + timedelta(seconds=POLL_BOOST_SECONDS)
+            self._sem_novidade = 0
+        elif self._janela_quente(agora):
+            # A espera recomeça do mínimo quando a janela quente termina
+            self._sem_novidade = 0
+        else:
+            self._sem_novidade = min(self._sem_novidade + 1, 16)
+        if taken_at is not None:
+            self._ultimo_taken_at = max(taken_at, self._ultimo_taken_at or taken_at)
+            
+    def tick(self):
+        """Chamado periodicamente pelo scheduler; consulta a API se o intervalo venceu"""
+        if self._lock.locked() or not self.due():
+            return None
+        return self.run()
+        
+    def stats(self):
+        agora = datetime.now(BRAZIL_TZ)
+        intervalo = self.next_interval(agora)
+        return {
+            "enabled": ADAPTIVE_POLLING_ENABLED,
+            "consultas_hoje": self._consultas_hoje(agora),
+            "orcamento_diario": POLL_DAILY_BUDGET,
+            "perfis_por_execucao": self._perfis_por_execucao,
+            "intervalo_atual": round(intervalo) if intervalo is not None else None,
+            "ultima_consulta": self._ultima_consulta.isoformat() if self._ultima_consulta else None,
+            "ultimo_taken_at": self._ultimo_taken_at,
+            "sem_novidade": self._sem_novidade
+        }
+
+def monitor_stories_exclusive():
+    """monitor_stories sem sobreposição, nem entre processos"""
+    return run_exclusive("monitor_stories", monitor_stories)
+
+story_poller = AdaptiveStoryPoller(monitor=monitor_stories_exclusive)
 
 if __name__ == "__main__":
-    monitor_stories() 
\ No newline at end of file
+    monitor_stories()
+    # Fora do servidor não há worker da fila; entregar o que foi enfileirado
+    if WEBHOOK_OUTBOX_ENABLED:
+        drain_outbox() 
\ No newline at end of file
@@ -0,0 +1,103 @@
+import os
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+logger = logging.getLogger("shopee_monitor")
+
+# Tentar carregar o arquivo .env, mas não falhar se não existir
+try:
+    load_dotenv()
+except Exception as e:
+    logger.warning(f"Aviso: Não foi possível carregar o arquivo .env em response_cache.py: {str(e)}")
+
+# Cache em memória das respostas dos endpoints de leitura
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ITEMS = int(os.getenv("RESPONSE_CACHE_MAX_ITEMS", "256"))
+# Validade da resposta de /status, que também depende de dados fora do banco
+STATUS_CACHE_TTL_SECONDS = float(os.getenv("STATUS_CACHE_TTL_SECONDS", "5"))
+
+class CachedResponse:
+    """Corpo já serializado de uma resposta, com a versão dos dados usada para montá-lo"""
+
+    __slots__ = ("body", "etag", "media_type", "headers", "versao", "expira_em")
+
+    def __init__(self, body, media_type, headers, versao, expira_em):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.media_type = media_type
+        self.headers = headers
+        self.versao = versao
+        self.expira_em = expira_em
+
+    def matches(self, if_none_match):
+        """Verifica se o header If-None-Match do cliente corresponde a esta resposta"""
+        if not if_none_match:
+            return False
+        for etag in if_none_match.split(","):
+            etag = etag.strip()
+            if etag == "*" or etag.removeprefix("W/") == self.etag:
+                return True
+        return False
+
+class ResponseCache:
+    """
+    Cache LRU de respostas, invalidado pela versão dos dados
+
+    Cada item guarda a versão dos dados (database.data_version) lida antes de montar
+    a resposta; quando save_cupom, mark_cupom_sent ou a fila do webhook confirmam
+    uma alteração, neste ou em outro processo, a versão muda e o item deixa de
+    valer. Um TTL opcional cobre respostas que também dependem de dados fora do banco.
+    """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, versao):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item.versao != versao or (item.expira_em and item.expira_em < time.monotonic()):
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def set(self, key, versao, body, media_type, headers=None, ttl=None):
+        item = CachedResponse(
+            body,
+            media_type,
+            headers or {},
+            versao,
+            time.monotonic() + ttl if ttl else None
+        )
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return item
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": RESPONSE_CACHE_ENABLED,
+                "items": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ITEMS)
@@ -1,11 +1,16 @@
 import os
 import re
+import time
+import threading
 import logging
-import requests
+from abc import ABC, abstractmethod
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit
 import pytz
-from database import save_cupom, cupom_exists
+from database import save_cupons_bulk
+from http_client import http_client, RateLimiter, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
 
 # Configurar logging
 logger = logging.getLogger("shopee_scraper")
@@ -13,6 +18,15 @@ logger = logging.getLogger("shopee_scraper")
 # Fuso horário de Brasília
 BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
 
+# Scrapers executados ao mesmo tempo
+SCRAPER_MAX_WORKERS = int(os.getenv("SCRAPER_MAX_WORKERS", "8"))
+# Tempo máximo de cada scraper (download e parsing de todas as suas páginas)
+SCRAPER_TIMEOUT_SECONDS = float(os.getenv("SCRAPER_TIMEOUT_SECONDS", "60"))
+# Requisições por segundo a um mesmo domínio, somando todos os scrapers (0 = sem limite)
+SCRAPER_DOMAIN_RATE_PER_SECOND = float(os.getenv("SCRAPER_DOMAIN_RATE_PER_SECOND", "1"))
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
 def parse_validade(texto):
     """
     Analisa textos como "há 1 dia" ou "há 3 dias" para determinar validade
@@ -35,20 +49,131 @@ def parse_validade(texto):
         logger.error(f"Erro ao analisar validade: {str(e)}")
         return datetime.now(BRAZIL_TZ) + timedelta(days=1)
 
-def scrape_promos_geniais():
+class ScraperTimeout(Exception):
+    """O scraper passou do seu tempo máximo"""
+
+# Limite de requisições por domínio, compartilhado entre os scrapers
+_domain_limiters = {}
+_domain_limiters_lock = threading.Lock()
+
+def _domain_limiter(url):
+    dominio = urlsplit(url).netloc
+    with _domain_limiters_lock:
+        limiter = _domain_limiters.get(dominio)
+        if limiter is None:
+            limiter = RateLimiter(SCRAPER_DOMAIN_RATE_PER_SECOND, burst=1)
+            _domain_limiters[dominio] = limiter
+        return limiter
+
+class Scraper(ABC):
     """
-    Raspa cupons do site PromoGeniais
+    Fonte de cupons executada por run_all_scrapers
+    
+    Cada fonte define nome, origem e as páginas (urls) e implementa parse(), que é
+    abstrato: uma subclasse sem parse() falha já ao ser registrada. O
+    download (com limite por domínio e prazo do scraper) e a normalização são
+    comuns; a gravação é feita por run_all_scrapers, em lote.
+    
+    Para adicionar uma fonte, crie uma subclasse e decore com @register_scraper.
     """
-    try:
-        logger.info("Iniciando scraping do PromoGeniais")
-        cupons_encontrados = []
+    nome = None
+    origem = None
+    urls = ()
+    headers = {"User-Agent": USER_AGENT}
+    # Tempo máximo deste scraper; None usa SCRAPER_TIMEOUT_SECONDS
+    timeout_seconds = None
+    
+    @property
+    def timeout(self):
+        return self.timeout_seconds or SCRAPER_TIMEOUT_SECONDS
         
-        # Fazer requisição para a página de cupons da Shopee
-        response = requests.get("https://promosgeniaisdaju.com.br/lojas/shopee?tab=coupons", 
-                               headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"})
+    def fetch(self, url, prazo):
+        """Baixa uma página respeitando o limite do domínio e o prazo do scraper"""
+        _domain_limiter(url).acquire()
+        restante = prazo - time.monotonic()
+        if restante <= 0:
+            raise ScraperTimeout(f"Prazo esgotado antes de baixar {url}")
+        # A leitura nunca passa do prazo; sem novas tentativas se o prazo não comportar
+        response = http_client.get(
+            url,
+            headers=self.headers,
+            timeout=(min(HTTP_CONNECT_TIMEOUT, restante), min(HTTP_READ_TIMEOUT, restante)),
+            retries=None if restante > HTTP_READ_TIMEOUT else 0
+        )
         response.raise_for_status()
+        return response.text
+        
+    @abstractmethod
+    def parse(self, html, url):
+        """
+        Extrai os cupons de uma página
+        
+        Returns:
+            list: Dicts com codigo e, se houver, descricao, valor_desconto e valido_ate
+        """
         
-        soup = BeautifulSoup(response.text, 'lxml')
+    def normalize(self, cupom):
+        """Padroniza um cupom extraído; retorna None para descartá-lo"""
+        codigo = re.sub(r"\s+", "", cupom.get("codigo") or "")
+        # O código é gravado em uma coluna de até 20 caracteres
+        if not codigo or len(codigo) > 20:
+            return None
+        descricao = (cupom.get("descricao") or "").strip() or None
+        valor_desconto = (cupom.get("valor_desconto") or "").strip() or None
+        return {
+            "codigo": codigo,
+            "descricao": descricao[:200] if descricao else None,
+            "valor_desconto": valor_desconto[:50] if valor_desconto else None,
+            "valido_ate": cupom.get("valido_ate"),
+            "origem": self.origem
+        }
+        
+    def run(self):
+        """
+        Baixa, interpreta e normaliza todas as páginas da fonte
+        
+        Returns:
+            list: Cupons normalizados, prontos para save_cupons_bulk
+        """
+        prazo = time.monotonic() + self.timeout
+        candidatos = []
+        for url in self.urls:
+            html = self.fetch(url, prazo)
+            for cupom in self.parse(html, url):
+                cupom = self.normalize(cupom)
+                if cupom:
+                    candidatos.append(cupom)
+        return candidatos
+
+# Scrapers registrados, por nome
+_scrapers = {}
+
+def register_scraper(cls):
+    """
+    Decorador que registra uma subclasse de Scraper em run_all_scrapers
+    
+    Raises:
+        ValueError: Se a classe não definir nome
+        TypeError: Se a classe não implementar parse()
+    """
+    if not cls.nome:
+        raise ValueError(f"Scraper {cls.__name__} sem nome")
+    _scrapers[cls.nome] = cls()
+    return cls
+
+def get_scrapers():
+    return list(_scrapers.values())
+
+@register_scraper
+class PromosGeniaisScraper(Scraper):
+    """Cupons da Shopee no site PromoGeniais"""
+    nome = "promos_geniais"
+    origem = "site_promos"
+    urls = ("https://promosgeniaisdaju.com.br/lojas/shopee?tab=coupons",)
+    
+    def parse(self, html, url):
+        soup = BeautifulSoup(html, 'lxml')
+        candidatos = []
         
         # Procurar por elementos de cupom
         cupom_divs = soup.select('.sc-ebcb22be-2')
@@ -85,45 +210,106 @@ def scrape_promos_geniais():
                     if codigo_match:
                         codigo = codigo_match.group(0)
                 
-                # Se encontrou um código de cupom, salva no banco
-                if codigo and not cupom_exists(codigo):
-                    cupom_data = save_cupom(
-                        codigo=codigo,
-                        descricao=descricao,
-                        valor_desconto=valor_desconto,
-                        valido_ate=validade,
-                        origem="site_promos"
-                    )
-                    if cupom_data:
-                        logger.info(f"Cupom encontrado e salvo: {codigo}")
-                        cupons_encontrados.append(cupom_data)
+                # Se encontrou um código de cupom, guarda para salvar no banco
+                if codigo:
+                    candidatos.append({
+                        "codigo": codigo,
+                        "descricao": descricao,
+                        "valor_desconto": valor_desconto,
+                        "valido_ate": validade
+                    })
                         
             except Exception as e:
                 logger.error(f"Erro ao processar item de cupom: {str(e)}")
                 continue
                 
-        return cupons_encontrados
-        
-    except Exception as e:
-        logger.error(f"Erro ao fazer scraping: {str(e)}")
-        return []
+        return candidatos
+
+# Resultado da última execução de cada scraper
+_scraper_stats = {}
+
+def get_scraper_stats():
+    """Cupons encontrados, novos, duração e erro da última execução de cada scraper"""
+    return {nome: dict(stats) for nome, stats in _scraper_stats.items()}
 
-def run_all_scrapers():
+def _save_scraper_result(scraper, candidatos, duracao):
+    """Grava os cupons de um scraper em um único INSERT; os já existentes são ignorados"""
+    novos = save_cupons_bulk(candidatos)
+    for cupom_data in novos:
+        logger.info(f"Cupom encontrado e salvo: {cupom_data['codigo']}")
+    logger.info(f"Scraper {scraper.nome}: {len(candidatos)} cupons, {len(novos)} novos em {duracao:.1f}s")
+    _scraper_stats[scraper.nome] = {
+        "cupons": len(candidatos), "novos": len(novos), "duracao": round(duracao, 2), "erro": None
+    }
+    return novos
+
+def run_all_scrapers(nomes=None):
     """
-    Executa todos os scrapers disponíveis
+    Executa todos os scrapers registrados (ou só os informados em nomes) em paralelo
+    
+    Os cupons de cada scraper são gravados assim que ele termina. Um scraper que
+    passa do seu tempo máximo é abandonado e seu resultado descartado, sem atrasar
+    os demais.
+    
+    Returns:
+        list: Cupons novos gravados
     """
+    scrapers = [scraper for scraper in get_scrapers() if nomes is None or scraper.nome in nomes]
+    if not scrapers:
+        logger.warning("Nenhum scraper registrado")
+        return []
+        
     all_results = []
+    inicios = {}
     
-    # PromoGeniais
-    promos_results = scrape_promos_geniais()
-    if promos_results:
-        all_results.extend(promos_results)
+    def executar(scraper):
+        inicios[scraper.nome] = time.monotonic()
+        logger.info(f"Iniciando scraping: {scraper.nome}")
+        return scraper.run()
         
-    # Aqui você pode adicionar mais scrapers no futuro
+    executor = ThreadPoolExecutor(max_workers=max(1, min(SCRAPER_MAX_WORKERS, len(scrapers))), thread_name_prefix="scraper")
+    futures = {executor.submit(executar, scraper): scraper for scraper in scrapers}
+    pendentes = set(futures)
+    try:
+        while pendentes:
+            concluidos, _ = wait(pendentes, timeout=0.5, return_when=FIRST_COMPLETED)
+            agora = time.monotonic()
+            for future in list(pendentes):
+                scraper = futures[future]
+                inicio = inicios.get(scraper.nome)
+                if future in concluidos:
+                    pendentes.discard(future)
+                    try:
+                        candidatos = future.result()
+                    except Exception as e:
+                        logger.error(f"Erro ao fazer scraping de {scraper.nome}: {str(e)}")
+                        _scraper_stats[scraper.nome] = {
+                            "cupons": 0, "novos": 0, "duracao": round(agora - inicio, 2), "erro": str(e)
+                        }
+                        continue
+                    try:
+                        all_results.extend(_save_scraper_result(scraper, candidatos, agora - inicio))
+                    except Exception as e:
+                        logger.error(f"Erro ao salvar cupons de {scraper.nome}: {str(e)}")
+                elif inicio is not None and not future.done() and agora - inicio > scraper.timeout:
+                    # A thread termina sozinha (as chamadas HTTP respeitam o prazo); o resultado é ignorado
+                    pendentes.discard(future)
+                    logger.error(f"Scraper {scraper.nome} excedeu {scraper.timeout:.0f}s, resultado descartado")
+                    _scraper_stats[scraper.nome] = {
+                        "cupons": 0, "novos": 0, "duracao": round(agora - inicio, 2), "erro": "timeout"
+                    }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
     
     logger.info(f"Scraping finalizado. Total de cupons encontrados: {len(all_results)}")
     return all_results
 
+def scrape_promos_geniais():
+    """
+    Raspa cupons do site PromoGeniais
+    """
+    return run_all_scrapers(nomes=["promos_geniais"])
+
 if __name__ == "__main__":
     # Configuração de logging para execução independente
     logging.basicConfig(
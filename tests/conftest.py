@@ -0,0 +1,49 @@
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+# Banco próprio para os testes: database.py cria as tabelas ao ser importado
+_tmp_dir = tempfile.mkdtemp(prefix="shopee-monitor-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SHOPEE_ORANGE = (238, 77, 45)
+
+def render_story(codigo=None, altura_texto=60, fundo=SHOPEE_ORANGE, caixa=(255, 255, 255),
+                 cor_texto=(0, 0, 0), tamanho=(1080, 1920)):
+    """
+    Desenha um story no formato dos cupons: fundo liso, caixa central e o código
+    
+    O texto usa a fonte bitmap padrão do Pillow ampliada até altura_texto pixels,
+    para o resultado não depender das fontes instaladas.
+    """
+    image = Image.new("RGB", tamanho, fundo)
+    draw = ImageDraw.Draw(image)
+    largura, altura = tamanho
+    topo = altura // 2 - 150
+    if caixa is not None:
+        draw.rectangle((80, topo, largura - 80, topo + 300), fill=caixa)
+        
+    if codigo:
+        fonte = ImageFont.load_default()
+        esquerda, cima, direita, baixo = draw.textbbox((0, 0), codigo, font=fonte)
+        texto = Image.new("L", (direita - esquerda, baixo - cima), 0)
+        ImageDraw.Draw(texto).text((-esquerda, -cima), codigo, font=fonte, fill=255)
+        escala = altura_texto / texto.height
+        texto = texto.resize((int(texto.width * escala), altura_texto), Image.NEAREST)
+        posicao = ((largura - texto.width) // 2, topo + (300 - altura_texto) // 2)
+        image.paste(Image.new("RGB", texto.size, cor_texto), posicao, texto)
+        
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+@pytest.fixture
+def story_image():
+    return render_story
@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+import database
+
+@pytest.fixture
+def client():
+    return TestClient(app_module.app)
+
+@pytest.fixture
+def cupons_api():
+    database.save_cupons_bulk([{"codigo": f"APILIST{indice}", "origem": "teste_api"} for indice in range(3)])
+
+def test_limit_acima_do_maximo_e_reduzido(client, monkeypatch, cupons_api):
+    monkeypatch.setattr(app_module, "CUPONS_MAX_LIMIT", 2)
+    response = client.get("/api/cupons", params={"origem": "teste_api", "limit": 1000})
+    
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    assert response.headers["X-Next-Cursor"]
+
+def test_fields_projeta_os_campos_pedidos(client, cupons_api):
+    response = client.get("/api/cupons", params={"origem": "teste_api", "fields": "codigo,origem"})
+    
+    assert response.status_code == 200
+    assert response.json() == [{"codigo": f"APILIST{indice}", "origem": "teste_api"} for indice in (2, 1, 0)]
+
+def test_fields_invalido(client):
+    response = client.get("/api/cupons", params={"fields": "codigo,senha"})
+    assert response.status_code == 400
+    assert "senha" in response.json()["detail"]
+
+def test_resposta_serializada_com_orjson(client, cupons_api):
+    orjson = pytest.importorskip("orjson")
+    assert app_module.FastJSONResponse.__name__ == "ORJSONResponse"
+    
+    response = client.get("/api/cupons", params={"origem": "teste_api", "fields": "codigo,data_criacao"})
+    
+    assert response.headers["content-type"] == "application/json"
+    cupons = orjson.loads(response.content)
+    assert response.content == orjson.dumps(cupons)
+    assert all(isinstance(cupom["data_criacao"], str) for cupom in cupons)
+
+def test_etag_responde_304_ate_um_cupom_novo(client, monkeypatch):
+    monkeypatch.setattr(app_module, "RESPONSE_CACHE_ENABLED", True)
+    params = {"origem": "teste_etag"}
+    database.save_cupom("ETAG001", origem="teste_etag")
+    
+    primeira = client.get("/api/cupons", params=params)
+    etag = primeira.headers["ETag"]
+    assert primeira.status_code == 200
+    assert primeira.headers["Cache-Control"] == "no-cache"
+    
+    repetida = client.get("/api/cupons", params=params, headers={"If-None-Match": etag})
+    assert repetida.status_code == 304
+    assert repetida.content == b""
+    assert repetida.headers["ETag"] == etag
+    
+    database.save_cupom("ETAG002", origem="teste_etag")
+    
+    depois = client.get("/api/cupons", params=params, headers={"If-None-Match": etag})
+    assert depois.status_code == 200
+    assert depois.headers["ETag"] != etag
+    assert [cupom["codigo"] for cupom in depois.json()] == ["ETAG002", "ETAG001"]
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+import database
+from database import decode_cupom_cursor, encode_cupom_cursor, list_cupons, save_cupons_bulk
+
+@pytest.mark.parametrize("data_criacao", [
+    datetime(2026, 10, 18, 12, 30, 15, 123456),
+    datetime(2026, 1, 1, 0, 0, 0),
+])
+def test_cursor_ida_e_volta(data_criacao):
+    cursor = encode_cupom_cursor(data_criacao.isoformat(), 42)
+    assert "=" not in cursor
+    assert decode_cupom_cursor(cursor) == (data_criacao, 42)
+
+@pytest.mark.parametrize("cursor", ["", "nao-e-cursor", encode_cupom_cursor("ontem", 1), encode_cupom_cursor("2026-10-18T12:00:00", "x")])
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError):
+        decode_cupom_cursor(cursor)
+
+def test_paginacao_percorre_todos_os_cupons_nos_dois_sentidos():
+    codigos = [f"CURSOR{indice:03d}" for indice in range(7)]
+    save_cupons_bulk([{"codigo": codigo, "origem": "teste_cursor"} for codigo in codigos])
+    
+    paginas = []
+    proximo = anterior = None
+    while True:
+        cupons, proximo, anterior = list_cupons(limit=3, origem="teste_cursor", after=proximo, fields="codigo")
+        paginas.append([cupom["codigo"] for cupom in cupons])
+        if not proximo:
+            break
+    # Mais recentes primeiro, sem repetir nem pular cupons
+    assert sum(paginas, []) == sorted(codigos, reverse=True)
+    assert [len(pagina) for pagina in paginas] == [3, 3, 1]
+    
+    # Da última página, o cursor anterior devolve a página do meio na mesma ordem
+    cupons, _, _ = list_cupons(limit=3, origem="teste_cursor", before=anterior, fields="codigo")
+    assert [cupom["codigo"] for cupom in cupons] == paginas[1]
+
+def _plano_da_listagem(**kwargs):
+    """Executa list_cupons e devolve o EXPLAIN QUERY PLAN da consulta que ela fez"""
+    consultas = []
+    
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if "FROM cupons" in statement:
+            consultas.append((statement, parameters))
+    event.listen(database.engine, "before_cursor_execute", capturar)
+    try:
+        list_cupons(limit=3, **kwargs)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capturar)
+        
+    statement, parameters = consultas[-1]
+    with database.engine.connect() as conn:
+        return " ".join(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+
+@pytest.mark.parametrize("direcao, limite", [("after", "data_criacao<?"), ("before", "data_criacao>?")])
+@pytest.mark.parametrize("origem", [None, "teste_plano"])
+def test_pagina_profunda_comeca_a_busca_no_cursor(direcao, limite, origem):
+    save_cupons_bulk([{"codigo": f"PLANO{indice:03d}", "origem": "teste_plano"} for indice in range(5)])
+    _, cursor, _ = list_cupons(limit=2, origem=origem)
+    
+    plano = _plano_da_listagem(origem=origem, **{direcao: cursor})
+    # Busca por faixa no índice a partir do cursor, e não uma varredura desde o início
+    assert "SEARCH cupons USING INDEX" in plano
+    assert limite in plano
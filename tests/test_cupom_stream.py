@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+import database
+from cupom_stream import CupomBroadcaster
+
+class _RequestFalso:
+    async def is_disconnected(self):
+        return False
+
+def _evento(texto):
+    linhas = dict(linha.split(": ", 1) for linha in texto.strip().split("\n"))
+    return int(linhas["id"]), json.loads(linhas["data"])["codigo"]
+
+def test_reconexao_recebe_exatamente_os_cupons_perdidos():
+    visto = database.save_cupom("STREAM01", origem="manual")
+    perdidos = [database.save_cupom(codigo, origem="manual") for codigo in ("STREAM02", "STREAM03")]
+    
+    async def cliente():
+        broadcaster = CupomBroadcaster(10)
+        eventos = broadcaster.stream(_RequestFalso(), last_event_id=visto["id"])
+        assert await eventos.__anext__() == "retry: 3000\n\n"
+        recebidos = [_evento(await eventos.__anext__()) for _ in range(2)]
+        
+        # Cupom já reenviado que também chega pelo listener: não se repete
+        novo = database.save_cupom("STREAM04", origem="manual")
+        broadcaster.publish([perdidos[1], novo])
+        recebidos.append(_evento(await asyncio.wait_for(eventos.__anext__(), 1)))
+        
+        # Id menor confirmado depois de um maior (escritas concorrentes): é entregue
+        atrasado = dict(perdidos[0], id=visto["id"], codigo="STREAM05")
+        broadcaster.publish([atrasado])
+        recebidos.append(_evento(await asyncio.wait_for(eventos.__anext__(), 1)))
+        await eventos.aclose()
+        return recebidos
+        
+    recebidos = asyncio.run(cliente())
+    
+    assert [codigo for _, codigo in recebidos] == ["STREAM02", "STREAM03", "STREAM04", "STREAM05"]
+    assert [cupom_id for cupom_id, _ in recebidos[:2]] == [cupom["id"] for cupom in perdidos]
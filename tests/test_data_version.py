@@ -0,0 +1,39 @@
+from sqlalchemy import text
+
+import database
+from response_cache import ResponseCache
+
+def _versao_no_banco():
+    with database.engine.connect() as conn:
+        return conn.execute(text("SELECT versao FROM versao_dados WHERE id = 1")).scalar()
+
+def _commit_de_outro_processo():
+    """Simula outro processo alterando os cupons: só a linha do banco muda"""
+    with database.engine.begin() as conn:
+        conn.execute(text("UPDATE versao_dados SET versao = versao + 1 WHERE id = 1"))
+
+def test_versao_muda_com_commit_de_outro_processo(monkeypatch):
+    monkeypatch.setattr(database, "DATA_VERSION_CHECK_SECONDS", 0)
+    antes = database.data_version()
+    _commit_de_outro_processo()
+    assert database.data_version() != antes
+
+def test_versao_muda_com_commit_deste_processo(monkeypatch):
+    monkeypatch.setattr(database, "DATA_VERSION_CHECK_SECONDS", 3600)
+    database.data_version()
+    antes = database.data_version()
+    versao_no_banco = _versao_no_banco()
+    database.save_cupom("VERSAO01", origem="manual")
+    # Visível para este processo na hora e para os outros pelo banco
+    assert database.data_version() != antes
+    assert _versao_no_banco() == versao_no_banco + 1
+
+def test_resposta_em_cache_invalidada_por_outro_processo(monkeypatch):
+    monkeypatch.setattr(database, "DATA_VERSION_CHECK_SECONDS", 0)
+    cache = ResponseCache(8)
+    chave = ("/api/cupons", ())
+    cache.set(chave, database.data_version(), b"[]", "application/json")
+    assert cache.get(chave, database.data_version()) is not None
+    
+    _commit_de_outro_processo()
+    assert cache.get(chave, database.data_version()) is None
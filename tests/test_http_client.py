@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from http_client import AsyncHttpClient, CircuitBreaker, HttpClient, HostStats
+
+HOST = "https://api.exemplo.com"
+
+def _cliente_com_circuito_meio_aberto():
+    client = HttpClient()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    client._breakers[HOST] = breaker
+    client._stats[HOST] = HostStats()
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "meio-aberto"
+    return client, breaker
+
+class _SessaoComErro:
+    def __init__(self, erro):
+        self.erro = erro
+
+    def request(self, *args, **kwargs):
+        raise self.erro
+
+class _ClienteAsyncComErro:
+    def __init__(self, erro):
+        self.erro = erro
+
+    async def request(self, *args, **kwargs):
+        raise self.erro
+
+def test_erro_inesperado_na_chamada_de_teste_libera_o_circuito():
+    client, breaker = _cliente_com_circuito_meio_aberto()
+    client._sessions[HOST] = _SessaoComErro(RuntimeError("falha local"))
+    
+    with pytest.raises(RuntimeError):
+        client.get(HOST + "/stories", retries=0)
+    assert breaker.allow()
+
+def test_cancelamento_da_chamada_de_teste_async_libera_o_circuito():
+    client, breaker = _cliente_com_circuito_meio_aberto()
+    async_client = AsyncHttpClient(client)
+    async_client._get_client = lambda: _ClienteAsyncComErro(asyncio.CancelledError())
+    
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(async_client.get(HOST + "/stories", retries=0))
+    assert breaker.allow()
+
+def test_chamada_de_teste_pendente_bloqueia_outras():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
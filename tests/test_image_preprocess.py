@@ -0,0 +1,55 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import coupon_extractor
+from coupon_extractor import _prepare_vision_input, preprocess_image, to_data_url
+
+URL = "https://cdn.exemplo.com/story.jpg"
+
+@pytest.fixture(autouse=True)
+def cache_em_tmp(monkeypatch, tmp_path):
+    monkeypatch.setattr(coupon_extractor, "IMAGE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(coupon_extractor, "VISION_CACHE_ENABLED", False)
+
+def _tamanho(image_bytes):
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return image.format, image.size
+
+def test_reduz_mantendo_a_proporcao(story_image):
+    processada = preprocess_image(story_image("SHOPEE10"), max_side=768, crop_box=None)
+    assert _tamanho(processada) == ("JPEG", (432, 768))
+
+def test_recorta_antes_de_reduzir(story_image):
+    processada = preprocess_image(story_image("SHOPEE10"), max_side=768, crop_box=(0, 0.25, 1, 0.75))
+    assert _tamanho(processada) == ("JPEG", (768, 683))
+
+def test_reaproveita_o_cache_em_disco(story_image, tmp_path):
+    original = story_image("SHOPEE10")
+    primeira = preprocess_image(original, max_side=512, crop_box=None)
+    assert len(list(tmp_path.iterdir())) == 1
+    assert preprocess_image(original, max_side=512, crop_box=None) == primeira
+
+def test_imagem_invalida_devolve_none():
+    assert preprocess_image(b"nao e imagem", max_side=512, crop_box=None) is None
+
+def test_imagem_enviada_inline_reduzida(monkeypatch, story_image):
+    monkeypatch.setattr(coupon_extractor, "VISION_INLINE_IMAGES", True)
+    monkeypatch.setattr(coupon_extractor, "VISION_IMAGE_MAX_SIDE", 256)
+    monkeypatch.setattr(coupon_extractor, "VISION_CROP_BOX", "")
+    
+    image_input, _, _ = _prepare_vision_input(URL, image_bytes=story_image("SHOPEE10"))
+    
+    assert image_input.startswith("data:image/jpeg;base64,")
+    assert _tamanho(base64.b64decode(image_input.split(",", 1)[1]))[1] == (144, 256)
+
+def test_sem_inline_envia_a_url(monkeypatch, story_image):
+    monkeypatch.setattr(coupon_extractor, "VISION_INLINE_IMAGES", False)
+    
+    image_input, _, _ = _prepare_vision_input(URL, image_bytes=story_image("SHOPEE10"))
+    assert image_input == URL
+
+def test_data_url():
+    assert to_data_url(b"\xff\xd8") == "data:image/jpeg;base64,/9g="
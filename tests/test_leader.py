@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from database import acquire_lease
+from leader import SchedulerLeader, run_exclusive
+
+def test_trava_renovada_enquanto_o_job_roda():
+    resultado_concorrente = []
+    
+    def job_longo():
+        # Mais que a validade da trava: só continua travado porque foi renovada
+        time.sleep(2.2)
+        outra = threading.Thread(target=lambda: resultado_concorrente.append(run_exclusive("job_longo", lambda: "rodou")))
+        outra.start()
+        outra.join()
+        return "ok"
+        
+    assert run_exclusive("job_longo", job_longo, ttl=1.5) == "ok"
+    assert resultado_concorrente == [None]
+    # Liberada ao terminar
+    assert run_exclusive("job_longo", lambda: "de novo") == "de novo"
+
+def test_trava_de_processo_que_caiu_expira():
+    # Processo que obteve a trava e morreu sem liberá-la nem renová-la
+    assert acquire_lease("job:job_orfao", "processo-morto", 0)
+    assert run_exclusive("job_orfao", lambda: "assumiu") == "assumiu"
+
+def test_trava_liberada_quando_o_job_falha():
+    def job_com_erro():
+        raise RuntimeError("falhou")
+        
+    with pytest.raises(RuntimeError):
+        run_exclusive("job_com_erro", job_com_erro)
+    assert run_exclusive("job_com_erro", lambda: "ok") == "ok"
+
+class _SchedulerFalso:
+    """Registra as chamadas que o SchedulerLeader faz ao scheduler"""
+    
+    def __init__(self):
+        self.rodando = False
+        self.chamadas = []
+        
+    def start(self, paused=False):
+        self.chamadas.append("start")
+        
+    def pause(self):
+        self.rodando = False
+        self.chamadas.append("pause")
+        
+    def resume(self):
+        self.rodando = True
+        self.chamadas.append("resume")
+        
+    def shutdown(self):
+        self.rodando = False
+        self.chamadas.append("shutdown")
+
+def _lideres(nome, ttl_a=30, ttl_b=30):
+    a = SchedulerLeader(_SchedulerFalso(), nome=nome, ttl_seconds=ttl_a, dono="worker-a")
+    b = SchedulerLeader(_SchedulerFalso(), nome=nome, ttl_seconds=ttl_b, dono="worker-b")
+    return a, b
+
+def test_so_um_processo_assume_o_scheduler():
+    a, b = _lideres("lider_unico")
+    a._verificar()
+    b._verificar()
+    assert a.lider and a.scheduler.rodando
+    assert not b.lider and not b.scheduler.rodando
+    
+    # Renovação: o líder continua líder e o outro continua de fora
+    a._verificar()
+    b._verificar()
+    assert a.lider and not b.lider
+    assert a.scheduler.chamadas == ["resume"]
+
+def test_lider_que_sai_libera_a_reserva():
+    a, b = _lideres("lider_sai")
+    a._verificar()
+    a.stop()
+    assert not a.lider
+    
+    b._verificar()
+    assert b.lider and b.scheduler.rodando
+
+def test_outro_processo_assume_quando_a_reserva_expira():
+    # ttl 0: a reserva de a expira na hora, como se a tivesse parado de renovar
+    a, b = _lideres("lider_expira", ttl_a=0)
+    a._verificar()
+    assert a.lider
+    
+    b._verificar()
+    assert b.lider and b.scheduler.rodando
+    
+    # O antigo líder percebe na próxima verificação e pausa o scheduler
+    a._verificar()
+    assert not a.lider
+    assert a.scheduler.chamadas == ["resume", "pause"]
@@ -0,0 +1,36 @@
+import threading
+import time
+
+import monitor
+
+def test_stories_processados_em_paralelo_e_entregues_em_ordem(monkeypatch):
+    ativos = []
+    pico = []
+    lock = threading.Lock()
+    
+    def processar(item, perfil=None):
+        with lock:
+            ativos.append(item["id"])
+            pico.append(len(ativos))
+        # Os primeiros stories terminam por último
+        time.sleep(0.05 * (4 - int(item["id"][-1])))
+        with lock:
+            ativos.remove(item["id"])
+        return {"codigo": item["id"]}
+    entregues = []
+    monkeypatch.setattr(monitor, "STORIES_BUDGET", "orcamento_paralelo")
+    monkeypatch.setattr(monitor, "MONITOR_MAX_WORKERS", 4)
+    monkeypatch.setattr(monitor, "VISION_BATCH_SIZE", 1)
+    monkeypatch.setattr(monitor, "has_digest_subscribers", lambda: False)
+    monkeypatch.setattr(monitor, "_perfis_da_execucao", lambda: ["perfil_paralelo"])
+    stories = [{"id": f"PARALELO0{indice}", "taken_at": 1700000000 + indice} for indice in range(4)]
+    monkeypatch.setattr(monitor, "fetch_profiles_stories", lambda usernames: [("perfil_paralelo", stories)])
+    monkeypatch.setattr(monitor, "process_story_item", processar)
+    monkeypatch.setattr(monitor, "deliver_cupom", lambda cupom: entregues.append(cupom["codigo"]))
+    
+    resultado = monitor.monitor_stories()
+    
+    assert max(pico) > 1
+    assert entregues == [story["id"] for story in stories]
+    assert resultado["stories"] == 4
+    assert resultado["ultimo_taken_at"] == 1700000003
@@ -0,0 +1,56 @@
+import asyncio
+
+import database
+import monitor
+from database import get_perfis_para_consulta, mark_perfis_consultados, save_perfil
+
+def _devidos():
+    return {perfil["username"] for perfil in get_perfis_para_consulta()}
+
+def _perfil(username):
+    return next(perfil for perfil in database.list_perfis() if perfil["username"] == username)
+
+def test_falha_na_consulta_adia_o_perfil(monkeypatch):
+    save_perfil("perfil_com_falha")
+    assert "perfil_com_falha" in _devidos()
+    
+    mark_perfis_consultados({}, falhas=["perfil_com_falha"])
+    assert _perfil("perfil_com_falha")["falhas"] == 1
+    assert "perfil_com_falha" not in _devidos()
+    
+    # Passada a espera, o perfil volta a ser consultado
+    monkeypatch.setattr(database, "PERFIL_FALHA_BACKOFF_SECONDS", 0)
+    assert "perfil_com_falha" in _devidos()
+
+def test_espera_dobra_a_cada_falha_e_zera_com_sucesso():
+    save_perfil("perfil_instavel")
+    for _ in range(3):
+        mark_perfis_consultados({}, falhas=["perfil_instavel"])
+    perfil = database.PerfilInstagram(intervalo_minimo=0, falhas=_perfil("perfil_instavel")["falhas"])
+    assert perfil.intervalo_atual() == 4 * database.PERFIL_FALHA_BACKOFF_SECONDS
+    
+    mark_perfis_consultados({"perfil_instavel": 1700000000})
+    assert _perfil("perfil_instavel")["falhas"] == 0
+    assert _perfil("perfil_instavel")["ultimo_taken_at"] == 1700000000
+
+def test_monitor_registra_perfil_que_falhou(monkeypatch):
+    save_perfil("perfil_fora_do_ar")
+    monkeypatch.setattr(monitor, "_perfis_da_execucao", lambda: ["perfil_fora_do_ar"])
+    monkeypatch.setattr(monitor, "fetch_profiles_stories", lambda usernames: [(username, None) for username in usernames])
+    
+    resultado = monitor.monitor_stories()
+    
+    assert resultado["stories"] == 0
+    assert _perfil("perfil_fora_do_ar")["falhas"] == 1
+    assert "perfil_fora_do_ar" not in _devidos()
+
+def test_process_story_item_async_repassa_o_perfil(monkeypatch):
+    chamadas = []
+    
+    def prepare(item, use_ledger=True, fetch=True, perfil=None):
+        chamadas.append(perfil)
+        return None
+    monkeypatch.setattr(monitor, "prepare_story_item", prepare)
+    
+    asyncio.run(monitor.process_story_item_async({"id": "1"}, perfil="shopee_br"))
+    assert chamadas == ["shopee_br"]
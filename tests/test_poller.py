@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import monitor
+from database import get_daily_calls, reserve_daily_calls
+from monitor import AdaptiveStoryPoller, BRAZIL_TZ
+
+def test_reserva_nunca_passa_do_limite_do_dia():
+    assert reserve_daily_calls("orcamento_teste", "2026-10-18", 3, 5) == 3
+    # Outro processo pede mais do que resta: recebe só o saldo
+    assert reserve_daily_calls("orcamento_teste", "2026-10-18", 3, 5) == 2
+    assert reserve_daily_calls("orcamento_teste", "2026-10-18", 1, 5) == 0
+    assert get_daily_calls("orcamento_teste", "2026-10-18") == 5
+    
+    # No dia seguinte a contagem recomeça
+    assert get_daily_calls("orcamento_teste", "2026-10-19") == 0
+    assert reserve_daily_calls("orcamento_teste", "2026-10-19", 2, 5) == 2
+    assert get_daily_calls("orcamento_teste", "2026-10-19") == 2
+
+def test_contador_sobrevive_a_reinicio_do_poller(monkeypatch):
+    monkeypatch.setattr(monitor, "STORIES_BUDGET", "orcamento_reinicio")
+    hoje = datetime.now(BRAZIL_TZ).date().isoformat()
+    reserve_daily_calls("orcamento_reinicio", hoje, 7, 100)
+    
+    # Um poller novo (reinício, outro líder) enxerga as consultas já feitas
+    assert AdaptiveStoryPoller(monitor=lambda: None).stats()["consultas_hoje"] == 7
+
+def test_monitor_respeita_orcamento_compartilhado(monkeypatch):
+    monkeypatch.setattr(monitor, "STORIES_BUDGET", "orcamento_monitor")
+    monkeypatch.setattr(monitor, "POLL_DAILY_BUDGET", 3)
+    monkeypatch.setattr(monitor, "_perfis_da_execucao", lambda: ["perfil_a", "perfil_b"])
+    consultados = []
+    
+    def buscar(usernames):
+        consultados.extend(usernames)
+        return [(username, []) for username in usernames]
+    monkeypatch.setattr(monitor, "fetch_profiles_stories", buscar)
+    
+    assert monitor.monitor_stories()["perfis"] == 2
+    # Só resta uma consulta no dia: só o primeiro perfil é consultado
+    assert monitor.monitor_stories()["perfis"] == 1
+    assert monitor.monitor_stories()["perfis"] == 0
+    assert consultados == ["perfil_a", "perfil_b", "perfil_a"]
+
+def test_execucao_sem_perfil_devido_nao_conta_como_consulta():
+    poller = AdaptiveStoryPoller(monitor=lambda: {"stories": 0, "ultimo_taken_at": None, "perfis": 0})
+    poller.run()
+    poller.run()
+    assert poller._sem_novidade == 0
+    assert poller._ultima_consulta is None
@@ -0,0 +1,51 @@
+import io
+import random
+
+import pytest
+from PIL import Image
+
+import database
+import monitor
+from coupon_extractor import prescreen_image, score_coupon_likelihood, PRESCREEN_THRESHOLD
+
+def _jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+def _foto_ruido():
+    random.seed(42)
+    return _jpeg(Image.frombytes("RGB", (360, 640), random.randbytes(360 * 640 * 3)))
+
+def _foto_escura():
+    return _jpeg(Image.new("RGB", (1080, 1920), (20, 30, 40)))
+
+@pytest.mark.parametrize("codigo, altura_texto", [("SHOPEE10", 60), ("CUPOM15OFF", 40), ("FRETEGRATIS", 80)])
+def test_story_de_cupom_aprovado(story_image, codigo, altura_texto):
+    aprovada, score = prescreen_image(story_image(codigo, altura_texto=altura_texto))
+    assert aprovada
+    assert score >= PRESCREEN_THRESHOLD
+
+@pytest.mark.parametrize("amostra", [_foto_ruido, _foto_escura])
+def test_imagem_sem_cara_de_cupom_rejeitada(amostra):
+    aprovada, score = prescreen_image(amostra())
+    assert not aprovada
+    assert score < PRESCREEN_THRESHOLD
+
+def test_cupom_pontua_mais_que_fundo_laranja_sem_caixa(story_image):
+    assert score_coupon_likelihood(story_image("SHOPEE10")) > score_coupon_likelihood(story_image(caixa=None))
+
+def test_imagem_ilegivel_aprovada():
+    assert prescreen_image(b"nao e uma imagem") == (True, None)
+
+def test_story_rejeitado_nao_vai_para_o_registro(monkeypatch):
+    monkeypatch.setattr(monitor, "PRESCREEN_ENABLED", True)
+    story = {
+        "story_id": "story-prescreen-1",
+        "item": {"taken_at": 1700000000},
+        "image_bytes": _foto_escura(),
+        "use_ledger": True
+    }
+    assert not monitor.prescreen_story(story)
+    # Sem registro, o story é avaliado de novo na próxima execução
+    assert not database.story_already_processed("story-prescreen-1")
@@ -0,0 +1,86 @@
+from sqlalchemy import event, text
+
+import database
+from database import cupom_exists, save_cupom, save_cupons_bulk
+
+def _total(codigo):
+    with database.engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM cupons WHERE codigo = :codigo"), {"codigo": codigo}).scalar()
+
+def _comandos_em_cupons(funcao, *args, **kwargs):
+    """Executa a função e retorna o resultado e os comandos SQL enviados à tabela de cupons"""
+    comandos = []
+    
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if "cupons" in statement:
+            comandos.append(statement.split()[0].upper())
+    event.listen(database.engine, "before_cursor_execute", capturar)
+    try:
+        return funcao(*args, **kwargs), comandos
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capturar)
+
+def test_codigos_repetidos_no_lote_gravados_uma_vez():
+    novos = save_cupons_bulk([
+        {"codigo": "LOTE0001", "origem": "site_teste"},
+        {"codigo": "LOTE0002", "origem": "site_teste"},
+        {"codigo": "LOTE0001", "origem": "site_teste", "descricao": "repetido"},
+        {"codigo": None, "origem": "site_teste"},
+    ])
+    
+    assert [cupom["codigo"] for cupom in novos] == ["LOTE0001", "LOTE0002"]
+    assert novos[0]["descricao"] is None
+    assert _total("LOTE0001") == 1
+    assert cupom_exists("LOTE0002")
+
+def test_codigos_ja_gravados_nao_voltam_como_novos():
+    save_cupom("LOTE0003", origem="manual")
+    
+    novos = save_cupons_bulk([
+        {"codigo": "LOTE0003", "origem": "site_teste"},
+        {"codigo": "LOTE0004", "origem": "site_teste"},
+    ])
+    
+    assert [cupom["codigo"] for cupom in novos] == ["LOTE0004"]
+    assert _total("LOTE0003") == 1
+
+def test_codigo_gravado_por_outro_processo_nao_duplica():
+    # Fora do índice em memória deste processo: só a restrição do banco o detecta
+    with database.engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO cupons (codigo, origem, enviado, data_criacao) VALUES (:codigo, 'site', 0, CURRENT_TIMESTAMP)"),
+            {"codigo": "LOTE0005"}
+        )
+    
+    novos = save_cupons_bulk([{"codigo": "LOTE0005"}, {"codigo": "LOTE0006"}])
+    
+    assert [cupom["codigo"] for cupom in novos] == ["LOTE0006"]
+    assert _total("LOTE0005") == 1
+    assert cupom_exists("LOTE0005")
+
+def test_save_cupom_novo_em_um_unico_insert():
+    cupom, comandos = _comandos_em_cupons(save_cupom, "UPSERT01", horario="19H", origem="site_teste", perfil="shopee_br")
+    
+    assert comandos == ["INSERT"]
+    assert cupom["codigo"] == "UPSERT01"
+    assert cupom["id"]
+    assert (cupom["horario"], cupom["origem"], cupom["perfil"], cupom["enviado"]) == ("19H", "site_teste", "shopee_br", False)
+
+def test_save_cupom_repetido_devolve_false():
+    save_cupom("UPSERT02", origem="site_teste")
+    
+    repetido, comandos = _comandos_em_cupons(save_cupom, "UPSERT02", origem="outra_origem")
+    
+    assert repetido is False
+    assert "INSERT" not in comandos
+    assert _total("UPSERT02") == 1
+
+def test_save_cupom_gravado_por_outro_processo_devolve_false():
+    with database.engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO cupons (codigo, origem, enviado, data_criacao) VALUES (:codigo, 'site', 0, CURRENT_TIMESTAMP)"),
+            {"codigo": "UPSERT03"}
+        )
+    
+    assert save_cupom("UPSERT03", origem="site_teste") is False
+    assert _total("UPSERT03") == 1
@@ -0,0 +1,37 @@
+import pytest
+
+import scrapers
+from scrapers import Scraper, register_scraper
+
+@pytest.fixture(autouse=True)
+def registro_isolado(monkeypatch):
+    monkeypatch.setattr(scrapers, "_scrapers", dict(scrapers._scrapers))
+
+def test_scraper_sem_parse_falha_no_registro():
+    with pytest.raises(TypeError):
+        @register_scraper
+        class SemParse(Scraper):
+            nome = "sem_parse"
+            origem = "site_teste"
+            
+    assert "sem_parse" not in {scraper.nome for scraper in scrapers.get_scrapers()}
+
+def test_scraper_sem_nome_falha_no_registro():
+    with pytest.raises(ValueError):
+        @register_scraper
+        class SemNome(Scraper):
+            def parse(self, html, url):
+                return []
+
+def test_scraper_completo_e_registrado():
+    @register_scraper
+    class Completo(Scraper):
+        nome = "completo"
+        origem = "site_teste"
+        
+        def parse(self, html, url):
+            return [{"codigo": "teste10off"}]
+            
+    registrado = next(scraper for scraper in scrapers.get_scrapers() if scraper.nome == "completo")
+    assert isinstance(registrado, Completo)
+    assert registrado.parse("", "https://exemplo.com") == [{"codigo": "teste10off"}]
@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+
+import database
+from database import Cupom, session_scope
+
+def _existe(codigo):
+    # Conexão própria: só enxerga o que já foi confirmado
+    with database.engine.connect() as conn:
+        return conn.execute(text("SELECT 1 FROM cupons WHERE codigo = :codigo"), {"codigo": codigo}).first() is not None
+
+def test_escopo_aninhado_so_confirma_no_mais_externo():
+    with session_scope() as externa:
+        with session_scope() as interna:
+            assert interna is externa
+            interna.add(Cupom(codigo="SESSAO01", origem="teste_sessao"))
+        interna.flush()
+        assert not _existe("SESSAO01")
+    assert _existe("SESSAO01")
+
+def test_erro_no_escopo_aninhado_desfaz_tudo():
+    with pytest.raises(RuntimeError):
+        with session_scope() as externa:
+            externa.add(Cupom(codigo="SESSAO02", origem="teste_sessao"))
+            with session_scope() as interna:
+                interna.add(Cupom(codigo="SESSAO03", origem="teste_sessao"))
+                raise RuntimeError("falha no meio da transação")
+    assert not _existe("SESSAO02")
+    assert not _existe("SESSAO03")
+    
+    # A thread recebe uma sessão nova depois do rollback
+    with session_scope() as db:
+        assert db.query(Cupom).filter(Cupom.codigo == "SESSAO02").first() is None
+
+def test_cada_thread_tem_a_sua_sessao():
+    sessoes = []
+    
+    def abrir():
+        with session_scope() as db:
+            sessoes.append(db)
+    with session_scope() as db:
+        thread = threading.Thread(target=abrir)
+        thread.start()
+        thread.join()
+        assert sessoes[0] is not db
+
+def test_pragmas_do_sqlite():
+    with database.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
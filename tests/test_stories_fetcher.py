@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import monitor
+from monitor import StoriesFetcher
+
+STORIES = [{"id": "1_1", "media_type": 1}]
+
+class _Resposta:
+    def __init__(self, status_code, corpo=None, headers=None):
+        self.status_code = status_code
+        self._corpo = corpo
+        self.headers = headers or {}
+        self.text = str(corpo)
+
+    def json(self):
+        return self._corpo
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+class _HttpClientFalso:
+    """Responde com as respostas da fila e guarda os headers de cada chamada"""
+    def __init__(self, *respostas, liberar=None):
+        self.respostas = list(respostas)
+        self.liberar = liberar
+        self.chamadas = []
+
+    def get(self, url, headers=None, params=None):
+        self.chamadas.append(headers)
+        if self.liberar is not None:
+            assert self.liberar.wait(5)
+        return self.respostas.pop(0)
+
+@pytest.fixture
+def fetcher():
+    return StoriesFetcher(ttl_seconds=0)
+
+def test_chamadas_concorrentes_fazem_uma_consulta(monkeypatch, fetcher):
+    liberar = threading.Event()
+    cliente = _HttpClientFalso(_Resposta(200, {"data": {"items": STORIES}}), liberar=liberar)
+    monkeypatch.setattr(monitor, "http_client", cliente)
+    
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futuros = [executor.submit(fetcher.get, "perfil_concorrente") for _ in range(5)]
+        # Só responde depois que todos os outros estão esperando a consulta em andamento
+        limite = time.monotonic() + 5
+        while fetcher.coalesced < 4 and time.monotonic() < limite:
+            time.sleep(0.01)
+        liberar.set()
+        resultados = [futuro.result(timeout=5) for futuro in futuros]
+        
+    assert len(cliente.chamadas) == 1
+    assert fetcher.api_calls == 1
+    assert fetcher.coalesced == 4
+    assert resultados == [STORIES] * 5
+
+def test_304_devolve_os_stories_em_cache(monkeypatch, fetcher):
+    cliente = _HttpClientFalso(
+        _Resposta(200, {"data": {"items": STORIES}}, {"ETag": '"v1"'}),
+        _Resposta(304),
+    )
+    monkeypatch.setattr(monitor, "http_client", cliente)
+    
+    assert fetcher.get("perfil_304") == STORIES
+    assert fetcher.get("perfil_304") == STORIES
+    
+    assert "If-None-Match" not in cliente.chamadas[0]
+    assert cliente.chamadas[1]["If-None-Match"] == '"v1"'
+    assert fetcher.api_calls == 2
+    assert fetcher.not_modified == 1
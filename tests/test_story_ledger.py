@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+import database
+import monitor
+from database import mark_story_processed, purge_expired_stories, story_already_processed
+
+def _story(story_id):
+    return {
+        "id": story_id,
+        "media_type": 1,
+        "taken_at": int(time.time()),
+        "image_versions": {"items": [{"url": f"https://cdn.exemplo.com/{story_id}.jpg"}]}
+    }
+
+class _VisionFalsa:
+    """Conta as chamadas à Vision API e devolve sempre o mesmo resultado"""
+    def __init__(self):
+        self.chamadas = []
+        self.resultado = {"success": False, "no_coupon": True}
+
+    def __call__(self, image_url, image_bytes=None):
+        self.chamadas.append(image_url)
+        return self.resultado
+
+@pytest.fixture
+def vision(monkeypatch):
+    vision = _VisionFalsa()
+    monkeypatch.setattr(monitor, "fetch_image_bytes", lambda url: b"imagem")
+    monkeypatch.setattr(monitor, "prescreen_story", lambda story: True)
+    monkeypatch.setattr(monitor, "extract_with_vision", vision)
+    return vision
+
+def test_story_sem_cupom_nao_volta_para_a_vision(vision):
+    item = _story("LEDGER_SEM_CUPOM")
+    
+    assert monitor.process_story_item(item) is None
+    assert monitor.process_story_item(item) is None
+    
+    assert len(vision.chamadas) == 1
+    assert story_already_processed("LEDGER_SEM_CUPOM")
+
+def test_falha_da_api_e_tentada_de_novo(vision):
+    vision.resultado = {"success": False, "error": "timeout"}
+    item = _story("LEDGER_FALHA_API")
+    
+    monitor.process_story_item(item)
+    monitor.process_story_item(item)
+    
+    assert len(vision.chamadas) == 2
+    assert not story_already_processed("LEDGER_FALHA_API")
+
+def test_registro_expirado_e_ignorado_e_removido():
+    antigo = time.time() - (database.STORY_LEDGER_TTL_HOURS + 1) * 3600
+    mark_story_processed("LEDGER_EXPIRADO", "sem_cupom", taken_at=antigo)
+    mark_story_processed("LEDGER_VALIDO", "sem_cupom", taken_at=time.time())
+    
+    assert not story_already_processed("LEDGER_EXPIRADO")
+    assert purge_expired_stories() >= 1
+    assert story_already_processed("LEDGER_VALIDO")
+    with database.session_scope() as db:
+        assert db.query(database.StoryProcessado).filter_by(story_id="LEDGER_EXPIRADO").count() == 0
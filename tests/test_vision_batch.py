@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+import coupon_extractor
+from coupon_extractor import _call_vision_api_batch, extract_with_vision_batch
+
+SEM_CUPOM = {"success": False, "no_coupon": True}
+
+def _imagens(quantidade):
+    return [(f"https://cdn.exemplo.com/lote{indice}.jpg", None) for indice in range(quantidade)]
+
+@pytest.fixture
+def individuais(monkeypatch):
+    """URLs enviadas uma a uma para a Vision API"""
+    chamadas = []
+    
+    def individual(image_input):
+        chamadas.append(image_input)
+        return {"success": True, "codigo": f"INDIVIDUAL{image_input[-5]}"}
+    monkeypatch.setattr(coupon_extractor, "VISION_TIERED", False)
+    monkeypatch.setattr(coupon_extractor, "VISION_CACHE_ENABLED", False)
+    monkeypatch.setattr(coupon_extractor, "VISION_INLINE_IMAGES", False)
+    monkeypatch.setattr(coupon_extractor, "_call_vision_tiered", individual)
+    return chamadas
+
+def test_imagem_sem_resultado_no_lote_vai_sozinha(monkeypatch, individuais):
+    lotes = []
+    
+    def lote(image_inputs, detail, model):
+        lotes.append(len(image_inputs))
+        return {0: SEM_CUPOM, 2: SEM_CUPOM}
+    monkeypatch.setattr(coupon_extractor, "_call_vision_api_batch", lote)
+    
+    results = extract_with_vision_batch(_imagens(3), batch_size=3)
+    
+    assert lotes == [3]
+    assert individuais == ["https://cdn.exemplo.com/lote1.jpg"]
+    assert results == [SEM_CUPOM, {"success": True, "codigo": "INDIVIDUAL1"}, SEM_CUPOM]
+
+def test_lotes_respeitam_o_tamanho_e_a_sobra_vai_sozinha(monkeypatch, individuais):
+    lotes = []
+    
+    def lote(image_inputs, detail, model):
+        lotes.append(len(image_inputs))
+        return {indice: SEM_CUPOM for indice in range(len(image_inputs))}
+    monkeypatch.setattr(coupon_extractor, "_call_vision_api_batch", lote)
+    
+    results = extract_with_vision_batch(_imagens(5), batch_size=2)
+    
+    assert lotes == [2, 2]
+    assert individuais == ["https://cdn.exemplo.com/lote4.jpg"]
+    assert len(results) == 5
+
+def test_lote_ilegivel_envia_todas_individualmente(monkeypatch, individuais):
+    monkeypatch.setattr(coupon_extractor, "_call_vision_api_batch", lambda image_inputs, detail, model: None)
+    
+    results = extract_with_vision_batch(_imagens(2), batch_size=2)
+    
+    assert len(individuais) == 2
+    assert [result["codigo"] for result in results] == ["INDIVIDUAL0", "INDIVIDUAL1"]
+
+def _responder(monkeypatch, content):
+    resposta = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    monkeypatch.setattr(coupon_extractor.openai.ChatCompletion, "create", lambda **kwargs: resposta)
+
+def test_resposta_em_lote_associada_pelo_indice(monkeypatch):
+    _responder(monkeypatch, '```json\n[{"indice": 1, "codigo": " SHOPEE10 ", "horario": "19H", "confianca": 0.9},'
+                            ' {"indice": 0, "codigo": null, "confianca": 0.8}]\n```')
+    
+    results = _call_vision_api_batch(["a", "b", "c"])
+    
+    assert set(results) == {0, 1}
+    assert results[0]["no_coupon"]
+    assert results[1]["codigo"] == "SHOPEE10"
+    assert results[1]["horario"] == "19H"
+
+@pytest.mark.parametrize("content", [
+    '{"indice": 0, "codigo": "SHOPEE10"}',
+    '[{"indice": 0, "codigo": "A"}, {"indice": 0, "codigo": "B"}]',
+    '[{"indice": 5, "codigo": "SHOPEE10"}]',
+    'não é JSON',
+])
+def test_resposta_em_lote_invalida(monkeypatch, content):
+    _responder(monkeypatch, content)
+    assert _call_vision_api_batch(["a", "b"]) is None
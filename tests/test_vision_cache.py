@@ -0,0 +1,32 @@
+import pytest
+
+from coupon_extractor import VisionResultCache, compute_fingerprint
+
+@pytest.fixture
+def cache():
+    return VisionResultCache(max_items=16, ttl_seconds=3600, max_distance=24, max_block_diff=16)
+
+@pytest.mark.parametrize("altura_texto", [40, 60])
+def test_codigo_diferente_no_mesmo_template_nao_reaproveita_cupom(cache, story_image, altura_texto):
+    primeiro = compute_fingerprint(story_image("SHOPEE10", altura_texto=altura_texto))
+    segundo = compute_fingerprint(story_image("SHOPEE15", altura_texto=altura_texto))
+    cache.put(primeiro, {"success": True, "codigo": "SHOPEE10"})
+    
+    assert cache.get(segundo) is None
+
+def test_mesma_imagem_reaproveita_cupom(cache, story_image):
+    imagem = story_image("SHOPEE10")
+    cache.put(compute_fingerprint(imagem), {"success": True, "codigo": "SHOPEE10"})
+    
+    assert cache.get(compute_fingerprint(imagem))["codigo"] == "SHOPEE10"
+
+def test_imagem_parecida_reaproveita_resultado_sem_cupom(cache, story_image):
+    cache.put(compute_fingerprint(story_image()), {"success": False, "no_coupon": True})
+    # Mesma arte com outra compressão: bytes diferentes, imagem quase idêntica
+    from PIL import Image
+    import io
+    recomprimida = io.BytesIO()
+    Image.open(io.BytesIO(story_image())).save(recomprimida, "JPEG", quality=60)
+    
+    resultado = cache.get(compute_fingerprint(recomprimida.getvalue()))
+    assert resultado is not None and resultado["no_coupon"]
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+import coupon_extractor
+from coupon_extractor import _needs_escalation, get_vision_tier_stats
+
+@pytest.mark.parametrize("result, escalar", [
+    ({"success": False, "no_coupon": True}, False),
+    ({"success": False, "no_coupon": True, "confianca": 0.9}, False),
+    ({"success": False, "no_coupon": True, "confianca": 0.2}, True),
+    ({"success": True, "codigo": "SHOPEE10", "confianca": 0.95}, False),
+    ({"success": True, "codigo": "SHOPEE10"}, False),
+    ({"success": True, "codigo": "SHOPEE10", "confianca": 0.4}, True),
+    ({"success": True, "codigo": "S10", "confianca": 0.95}, True),
+    ({"success": False, "error": "timeout"}, False),
+])
+def test_needs_escalation(result, escalar):
+    assert _needs_escalation(result) is escalar
+
+def test_lote_divide_latencia_entre_as_imagens(monkeypatch):
+    modelo = "modelo-teste-lote"
+    monkeypatch.setattr(coupon_extractor, "VISION_TIERED", True)
+    monkeypatch.setattr(coupon_extractor, "VISION_CACHE_ENABLED", False)
+    monkeypatch.setattr(coupon_extractor, "VISION_INLINE_IMAGES", False)
+    monkeypatch.setattr(coupon_extractor, "VISION_TIER1_MODEL", modelo)
+    
+    def lote_lento(image_inputs, detail, model):
+        time.sleep(0.2)
+        return {indice: {"success": False, "no_coupon": True, "confianca": 0.9} for indice in range(len(image_inputs))}
+    monkeypatch.setattr(coupon_extractor, "_call_vision_api_batch", lote_lento)
+    
+    images = [(f"https://cdn.exemplo.com/{indice}.jpg", None) for indice in range(4)]
+    results = coupon_extractor.extract_with_vision_batch(images, batch_size=4)
+    
+    assert all(result["no_coupon"] for result in results)
+    stats = get_vision_tier_stats()["camadas"][f"{modelo}:{coupon_extractor.VISION_TIER1_DETAIL}"]
+    assert stats["chamadas"] == 4
+    assert stats["aceitas"] == 4
+    # 0,2s para o lote inteiro: cerca de 0,05s por imagem, e não 0,2s cada
+    assert stats["latencia_total"] < 0.4
@@ -0,0 +1,94 @@
+from concurrent.futures import Future
+
+import pytest
+
+import monitor
+import webhook
+from database import enqueue_webhook
+from webhook import WebhookOutboxDispatcher, WebhookSubscriber
+
+class _ExecutorImediato:
+    """Executa as entregas na hora, na thread do teste"""
+    
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+@pytest.fixture
+def posts(monkeypatch):
+    enviados = []
+    
+    def post(subscriber, payload, idempotency_key=None):
+        enviados.append(payload)
+        return True, None
+    monkeypatch.setattr(webhook, "_post_webhook", post)
+    return enviados
+
+def _dispatcher(nome):
+    subscriber = WebhookSubscriber(nome, "https://hook.exemplo.com", digest_janela=60, digest_max_itens=3)
+    dispatcher = WebhookOutboxDispatcher(subscriber, poll_seconds=5, lease_seconds=60)
+    dispatcher._executor = _ExecutorImediato()
+    return dispatcher
+
+def _enfileirar(destino, *codigos):
+    for codigo in codigos:
+        enqueue_webhook(codigo, destino, {"codigo": codigo}, f"{destino}:{codigo}")
+
+def _codigos(payload):
+    return [cupom["codigo"] for cupom in payload["cupons"]]
+
+def test_digest_fecha_ao_juntar_max_itens(posts):
+    dispatcher = _dispatcher("digest_max")
+    
+    # Fora de rajada o primeiro cupom sai na hora
+    _enfileirar("digest_max", "DIGMAX01")
+    dispatcher._dispatch_digest()
+    assert [_codigos(payload) for payload in posts] == [["DIGMAX01"]]
+    
+    # Dentro da janela os seguintes esperam...
+    _enfileirar("digest_max", "DIGMAX02", "DIGMAX03")
+    dispatcher._dispatch_digest()
+    assert len(posts) == 1
+    
+    # ...até juntar digest_max_itens
+    _enfileirar("digest_max", "DIGMAX04")
+    dispatcher._dispatch_digest()
+    assert _codigos(posts[-1]) == ["DIGMAX02", "DIGMAX03", "DIGMAX04"]
+    assert posts[-1]["total"] == 3
+
+def test_digest_fecha_quando_a_janela_termina(posts):
+    dispatcher = _dispatcher("digest_janela")
+    _enfileirar("digest_janela", "DIGJAN01")
+    dispatcher._dispatch_digest()
+    
+    _enfileirar("digest_janela", "DIGJAN02", "DIGJAN03")
+    dispatcher._dispatch_digest()
+    assert len(posts) == 1
+    
+    # Janela de 60s encerrada
+    dispatcher._ultimo_digest -= 61
+    dispatcher._dispatch_digest()
+    assert _codigos(posts[-1]) == ["DIGJAN02", "DIGJAN03"]
+
+def test_sem_fila_cupons_da_execucao_saem_juntos(monkeypatch):
+    lotes = []
+    
+    def enviar_lote(cupons):
+        lotes.append([cupom["codigo"] for cupom in cupons])
+        return []
+    monkeypatch.setattr(monitor, "WEBHOOK_OUTBOX_ENABLED", False)
+    monkeypatch.setattr(monitor, "has_digest_subscribers", lambda: True)
+    monkeypatch.setattr(monitor, "send_batch_to_webhook", enviar_lote)
+    monkeypatch.setattr(monitor, "send_to_webhook", lambda cupom: pytest.fail("POST individual"))
+    monkeypatch.setattr(monitor, "STORIES_BUDGET", "orcamento_digest")
+    monkeypatch.setattr(monitor, "MONITOR_MAX_WORKERS", 1)
+    monkeypatch.setattr(monitor, "VISION_BATCH_SIZE", 1)
+    monkeypatch.setattr(monitor, "_perfis_da_execucao", lambda: ["perfil_rajada"])
+    stories = [{"id": f"RAJADA0{indice}", "taken_at": 1700000000 + indice} for indice in range(3)]
+    monkeypatch.setattr(monitor, "fetch_profiles_stories", lambda usernames: [("perfil_rajada", stories)])
+    monkeypatch.setattr(monitor, "process_story_item", lambda item, perfil=None: {"codigo": item["id"]})
+    
+    monitor.monitor_stories()
+    
+    assert lotes == [["RAJADA00", "RAJADA01", "RAJADA02"]]
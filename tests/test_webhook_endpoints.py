@@ -0,0 +1,76 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+import database
+import webhook
+
+@pytest.fixture
+def client():
+    return TestClient(app_module.app)
+
+def test_send_cupom_marca_como_enviado(client, monkeypatch):
+    enviados = []
+    
+    async def webhook(cupom_data):
+        enviados.append(cupom_data)
+        return True
+    monkeypatch.setattr(app_module, "send_to_webhook_async", webhook)
+    database.save_cupom("ENVIO0001", horario="19H", origem="manual")
+    
+    response = client.post("/webhook/send-cupom", data={"codigo": "ENVIO0001"})
+    
+    assert response.json()["status"] == "success"
+    assert enviados == [{"codigo": "ENVIO0001", "horario": "19H", "imagem_url": None}]
+    assert database.get_cupom("ENVIO0001")["enviado"] is True
+
+def test_send_cupom_inexistente(client):
+    response = client.post("/webhook/send-cupom", data={"codigo": "NAOEXISTE1"})
+    assert response.json() == {"status": "error", "message": "Cupom não encontrado"}
+
+def test_send_all_envia_pendentes(client, monkeypatch):
+    async def webhook_lote(cupons_data):
+        return [cupom["codigo"] for cupom in cupons_data]
+    monkeypatch.setattr(app_module, "WEBHOOK_OUTBOX_ENABLED", False)
+    monkeypatch.setattr(app_module, "send_batch_to_webhook_async", webhook_lote)
+    database.save_cupom("PENDENTE01", origem="manual")
+    
+    response = client.post("/webhook/send-all")
+    
+    assert response.json()["status"] == "success"
+    assert "PENDENTE01" not in {cupom["codigo"] for cupom in database.list_unsent_cupons()}
+
+class _DispatcherFalso:
+    def wake(self):
+        pass
+
+@pytest.fixture
+def dois_destinos(monkeypatch):
+    destinos = [
+        webhook.WebhookSubscriber("destino_a", "https://a.exemplo.com"),
+        webhook.WebhookSubscriber("destino_b", "https://b.exemplo.com"),
+    ]
+    monkeypatch.setattr(webhook, "subscribers", destinos)
+    monkeypatch.setattr(webhook, "outbox_dispatchers", {destino.nome: _DispatcherFalso() for destino in destinos})
+    return destinos
+
+def test_send_all_conta_cupom_enfileirado_para_outro_destino(client, monkeypatch, dois_destinos):
+    monkeypatch.setattr(app_module, "WEBHOOK_OUTBOX_ENABLED", True)
+    cupom = database.save_cupom("PARCIAL01", origem="manual")
+    for destino in ("destino_a", "destino_b"):
+        chave = webhook.webhook_idempotency_key("PARCIAL01", destino)
+        database.enqueue_webhook("PARCIAL01", destino, {"codigo": "PARCIAL01"}, chave)
+    # O destino_a recebeu o cupom; o destino_b esgotou as tentativas
+    database.mark_webhook_delivered(database.claim_webhook_deliveries("destino_a", 1, 60)[0]["id"])
+    database.mark_webhook_failed(database.claim_webhook_deliveries("destino_b", 1, 60)[0]["id"], "fora do ar")
+    
+    # Só o destino_b volta para a fila, e isso conta como enfileirado
+    assert webhook.enqueue_cupom(cupom) == 1
+    
+    response = client.post("/webhook/send-all")
+    pendentes = len(database.list_unsent_cupons())
+    assert "PARCIAL01" in {cupom["codigo"] for cupom in database.list_unsent_cupons()}
+    assert response.json() == {
+        "status": "success",
+        "message": f"{pendentes} de {pendentes} cupons enfileirados para envio ao webhook"
+    }
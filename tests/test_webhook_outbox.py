@@ -0,0 +1,107 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import database
+import webhook
+from database import WebhookOutbox, claim_webhook_deliveries, enqueue_webhook, session_scope
+
+class _DispatcherFalso:
+    def wake(self):
+        pass
+
+@pytest.fixture
+def dois_destinos(monkeypatch):
+    destinos = [
+        webhook.WebhookSubscriber("fila_a", "https://a.exemplo.com"),
+        webhook.WebhookSubscriber("fila_b", "https://b.exemplo.com"),
+    ]
+    monkeypatch.setattr(webhook, "subscribers", destinos)
+    monkeypatch.setattr(webhook, "outbox_dispatchers", {destino.nome: _DispatcherFalso() for destino in destinos})
+    return destinos
+
+@pytest.fixture
+def respostas(monkeypatch):
+    """Resultado dos POSTs por destino (padrão: sucesso) e chaves de idempotência enviadas"""
+    estado = {"falhas": set(), "chaves": []}
+    
+    def post(subscriber, payload, idempotency_key=None):
+        estado["chaves"].append(idempotency_key)
+        if subscriber.nome in estado["falhas"]:
+            return False, "status 500"
+        return True, None
+    monkeypatch.setattr(webhook, "_post_webhook", post)
+    return estado
+
+def _entrega(idempotency_key):
+    with session_scope() as db:
+        entrega = db.query(WebhookOutbox).filter(WebhookOutbox.idempotency_key == idempotency_key).one()
+        return {
+            "status": entrega.status,
+            "tentativas": entrega.tentativas,
+            "proxima_tentativa": entrega.proxima_tentativa
+        }
+
+def test_mesma_chave_nao_duplica_entrega():
+    assert enqueue_webhook("IDEMP001", "fila_idemp", {"codigo": "IDEMP001"}, "fila_idemp:IDEMP001")
+    assert enqueue_webhook("IDEMP001", "fila_idemp", {"codigo": "IDEMP001"}, "fila_idemp:IDEMP001")
+    assert len(claim_webhook_deliveries("fila_idemp", 10, 60)) == 1
+
+def test_falha_reagenda_com_espera(respostas):
+    subscriber = webhook.WebhookSubscriber("fila_falha", "https://falha.exemplo.com")
+    respostas["falhas"].add("fila_falha")
+    chave = webhook.webhook_idempotency_key("FALHA001", "fila_falha")
+    enqueue_webhook("FALHA001", "fila_falha", {"codigo": "FALHA001"}, chave)
+    
+    entrega = claim_webhook_deliveries("fila_falha", 1, 60)[0]
+    assert not webhook._deliver(subscriber, entrega)
+    
+    registro = _entrega(chave)
+    assert registro["status"] == "pendente"
+    assert registro["tentativas"] == 1
+    assert registro["proxima_tentativa"] > datetime.now()
+    # Reenvio com a mesma chave de idempotência, e só depois da espera
+    assert respostas["chaves"] == [chave]
+    assert claim_webhook_deliveries("fila_falha", 1, 60) == []
+
+def test_reserva_expirada_pode_ser_retomada():
+    enqueue_webhook("LEASE001", "fila_lease", {"codigo": "LEASE001"}, "fila_lease:LEASE001")
+    assert len(claim_webhook_deliveries("fila_lease", 1, 60)) == 1
+    # Reservada e dentro do prazo: nenhum outro worker a pega
+    assert claim_webhook_deliveries("fila_lease", 1, 60) == []
+    
+    enqueue_webhook("LEASE002", "fila_lease", {"codigo": "LEASE002"}, "fila_lease:LEASE002")
+    reservada = claim_webhook_deliveries("fila_lease", 1, 0)
+    assert [entrega["codigo"] for entrega in reservada] == ["LEASE002"]
+    # Worker que reservou morreu: a reserva de 0s expira e outro worker retoma a entrega
+    time.sleep(0.01)
+    retomada = claim_webhook_deliveries("fila_lease", 1, 60)
+    assert [entrega["id"] for entrega in retomada] == [reservada[0]["id"]]
+
+def test_cupom_enviado_so_depois_de_todos_os_destinos(dois_destinos, respostas):
+    cupom = database.save_cupom("FANOUT01", origem="manual")
+    assert webhook.enqueue_cupom(cupom) == 2
+    a, b = dois_destinos
+    
+    assert webhook._deliver(a, claim_webhook_deliveries("fila_a", 1, 60)[0])
+    assert database.get_cupom("FANOUT01")["enviado"] is False
+    
+    respostas["falhas"].add("fila_b")
+    assert not webhook._deliver(b, claim_webhook_deliveries("fila_b", 1, 60)[0])
+    assert database.get_cupom("FANOUT01")["enviado"] is False
+    
+    # Nova tentativa do destino_b, já vencida a espera
+    with session_scope() as db:
+        db.query(WebhookOutbox).filter(WebhookOutbox.destino == "fila_b").update(
+            {"proxima_tentativa": datetime.now()}, synchronize_session=False
+        )
+    respostas["falhas"].clear()
+    assert webhook._deliver(b, claim_webhook_deliveries("fila_b", 1, 60)[0])
+    assert database.get_cupom("FANOUT01")["enviado"] is True
+
+def test_espera_exponencial_com_limite(monkeypatch):
+    monkeypatch.setattr(webhook.random, "uniform", lambda a, b: 1.0)
+    monkeypatch.setattr(webhook, "WEBHOOK_BACKOFF_BASE_SECONDS", 5)
+    monkeypatch.setattr(webhook, "WEBHOOK_BACKOFF_MAX_SECONDS", 30)
+    assert [webhook._backoff_delay(tentativa) for tentativa in range(1, 6)] == [5, 10, 20, 30, 30]
@@ -1,9 +1,21 @@
 import os
 import json
-import requests
+import time
+import asyncio
+import random
+import hashlib
+import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from database import (
+    session_scope, enqueue_webhook, claim_webhook_deliveries, count_ready_webhook_deliveries,
+    mark_webhook_delivered, mark_webhook_failed
+)
+from http_client import http_client, async_http_client
+
 # Configurar logging básico caso não esteja configurado
 logger = logging.getLogger("shopee_monitor")
 
@@ -16,43 +28,532 @@ except Exception as e:
 
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://webhook.zapgrana.online/webhook/82616fd6-e936-45fd-a2e3-ab7c5ef60629")
 
+# Timeouts (em segundos) de conexão e leitura das chamadas ao webhook
+WEBHOOK_CONNECT_TIMEOUT = float(os.getenv("WEBHOOK_CONNECT_TIMEOUT", "5"))
+WEBHOOK_READ_TIMEOUT = float(os.getenv("WEBHOOK_READ_TIMEOUT", "15"))
+
+# Fila persistente de entregas (outbox)
+WEBHOOK_OUTBOX_ENABLED = os.getenv("WEBHOOK_OUTBOX_ENABLED", "true").lower() == "true"
+# Máximo de entregas em andamento ao mesmo tempo
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "10"))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "5"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "900"))
+# Intervalo de verificação da fila quando não há novas entregas
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "5"))
+# Tempo de reserva de uma entrega; depois disso outro worker pode reenviá-la
+WEBHOOK_LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))
+
+# Modo digest: cupons que chegam em rajada são agrupados e enviados em um único POST
+# com uma lista. O primeiro cupom depois de um período calmo sai na hora; os que chegam
+# dentro da janela seguinte são acumulados até ela fechar ou até juntar MAX_ITEMS.
+# 0 desativa (um POST por cupom)
+WEBHOOK_DIGEST_WINDOW_SECONDS = float(os.getenv("WEBHOOK_DIGEST_WINDOW_SECONDS", "0"))
+WEBHOOK_DIGEST_MAX_ITEMS = int(os.getenv("WEBHOOK_DIGEST_MAX_ITEMS", "20"))
+
+# Destinos (assinantes) do webhook. Lista JSON de objetos com "nome", "url" e,
+# opcionalmente, "concorrencia", "template" (corpo com campos {codigo}, {horario},
+# {imagem_url}...), "headers", "digest_janela" e "digest_max_itens". Sem configuração, usa apenas o n8n em WEBHOOK_URL.
+WEBHOOK_SUBSCRIBERS = os.getenv("WEBHOOK_SUBSCRIBERS", "")
+
+class _TemplateValues(dict):
+    """Campos disponíveis nos templates; campos ausentes viram texto vazio"""
+    def __missing__(self, key):
+        return ""
+
+def _render_template(template, valores):
+    """Preenche recursivamente os textos do template com os dados do cupom"""
+    if isinstance(template, dict):
+        return {chave: _render_template(valor, valores) for chave, valor in template.items()}
+    if isinstance(template, list):
+        return [_render_template(valor, valores) for valor in template]
+    if isinstance(template, str):
+        try:
+            return template.format_map(valores)
+        except (ValueError, IndexError, AttributeError):
+            return template
+    return template
+
+class WebhookSubscriber:
+    """Destino do webhook com sua própria fila, limite de concorrência e formato de payload"""
+    
+    def __init__(self, nome, url, concorrencia=None, template=None, headers=None,
+                 digest_janela=None, digest_max_itens=None):
+        self.nome = nome
+        self.url = url
+        self.max_in_flight = max(1, int(concorrencia or WEBHOOK_MAX_IN_FLIGHT))
+        self.template = template
+        self.headers = headers or {}
+        self.digest_janela = float(WEBHOOK_DIGEST_WINDOW_SECONDS if digest_janela is None else digest_janela)
+        self.digest_max_itens = max(1, int(digest_max_itens or WEBHOOK_DIGEST_MAX_ITEMS))
+        
+    def build_payload(self, cupom_data):
+        """Monta o corpo enviado a este destino"""
+        if not self.template:
+            return build_webhook_payload(cupom_data)
+        valores = _TemplateValues({chave: "" if valor is None else valor for chave, valor in cupom_data.items()})
+        valores.update(build_webhook_payload(cupom_data))
+        return _render_template(self.template, valores)
+        
+    @property
+    def digest(self):
+        return self.digest_janela > 0
+
+def _load_subscribers():
+    """Lê a lista de destinos de WEBHOOK_SUBSCRIBERS"""
+    padrao = [WebhookSubscriber("n8n", WEBHOOK_URL)]
+    if not WEBHOOK_SUBSCRIBERS.strip():
+        return padrao
+        
+    try:
+        configs = json.loads(WEBHOOK_SUBSCRIBERS)
+    except ValueError as e:
+        logger.error(f"WEBHOOK_SUBSCRIBERS inválido, usando apenas o n8n: {str(e)}")
+        return padrao
+        
+    subscribers = []
+    nomes = set()
+    for config in configs:
+        nome = str(config.get("nome", "")).strip()
+        url = config.get("url")
+        if not nome or not url or nome in nomes:
+            logger.error(f"Destino de webhook ignorado (nome ausente/duplicado ou sem url): {config}")
+            continue
+        nomes.add(nome)
+        subscribers.append(WebhookSubscriber(
+            nome,
+            url,
+            concorrencia=config.get("concorrencia"),
+            template=config.get("template"),
+            headers=config.get("headers"),
+            digest_janela=config.get("digest_janela"),
+            digest_max_itens=config.get("digest_max_itens")
+        ))
+    return subscribers or padrao
+
+def build_webhook_payload(cupom_data):
+    """Monta o corpo padrão enviado ao webhook a partir dos dados do cupom"""
+    # Enviar apenas o código do cupom e horário se disponível
+    return {
+        "codigo": cupom_data["codigo"],
+        "horario": cupom_data.get("horario", ""),
+        "imagem_url": cupom_data.get("imagem_url", "")
+    }
+
+def build_digest_payload(payloads):
+    """Corpo do modo digest: os payloads individuais em uma lista"""
+    return {
+        "cupons": payloads,
+        "total": len(payloads)
+    }
+
+def webhook_idempotency_key(codigo, destino="n8n"):
+    """Chave de idempotência da entrega de um cupom a um destino, enviada no header Idempotency-Key"""
+    return hashlib.sha256(f"{destino}:cupom:{codigo}".encode("utf-8")).hexdigest()[:32]
+
+def digest_idempotency_key(chaves):
+    """Chave de idempotência de um digest, derivada das chaves dos cupons que ele agrupa"""
+    return hashlib.sha256("|".join(sorted(chaves)).encode("utf-8")).hexdigest()[:32]
+
+def _webhook_headers(subscriber, idempotency_key=None):
+    headers = {"Content-Type": "application/json"}
+    headers.update(subscriber.headers)
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    return headers
+
+def _webhook_result(subscriber, response):
+    # Verificar se houve sucesso (2xx)
+    if response.status_code >= 200 and response.status_code < 300:
+        logger.info(f"Webhook {subscriber.nome} enviado com sucesso: {response.status_code}")
+        return True, None
+    return False, f"{response.status_code} - {response.text[:500]}"
+
+def _post_webhook(subscriber, payload, idempotency_key=None):
+    """
+    Faz o POST para um destino do webhook
+    
+    Returns:
+        tuple: (sucesso, descrição do erro ou None)
+    """
+    try:
+        # Sem novas tentativas aqui: quem repete é a fila, com espera exponencial
+        response = http_client.post(
+            subscriber.url,
+            json=payload,
+            headers=_webhook_headers(subscriber, idempotency_key),
+            timeout=(WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT),
+            retries=0
+        )
+    except Exception as e:
+        return False, str(e) or type(e).__name__
+    return _webhook_result(subscriber, response)
+
+async def _post_webhook_async(subscriber, payload, idempotency_key=None):
+    """Versão assíncrona de _post_webhook"""
+    try:
+        response = await async_http_client.post(
+            subscriber.url,
+            json=payload,
+            headers=_webhook_headers(subscriber, idempotency_key),
+            timeout=(WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT),
+            retries=0
+        )
+    except Exception as e:
+        return False, str(e) or type(e).__name__
+    return _webhook_result(subscriber, response)
+
+def has_digest_subscribers():
+    """Indica se algum destino do webhook está em modo digest"""
+    return any(subscriber.digest for subscriber in subscribers)
+
 def send_to_webhook(cupom_data):
     """
-    Envia os dados do cupom para o webhook do n8n
+    Envia os dados do cupom diretamente para todos os destinos do webhook
     
     Args:
         cupom_data: Dicionário com dados do cupom
         
     Returns:
-        bool: True se o envio foi bem-sucedido, False caso contrário
+        bool: True se todos os destinos aceitaram o envio, False caso contrário
     """
-    try:
-        # Preparar dados para o webhook
-        # Enviar apenas o código do cupom e horário se disponível
-        payload = {
-            "codigo": cupom_data["codigo"],
-            "horario": cupom_data.get("horario", ""),
-            "imagem_url": cupom_data.get("imagem_url", "")
-        }
-        
-        # Log dos dados que serão enviados
-        logger.info(f"Enviando para webhook: {json.dumps(payload)}")
-        
-        # Fazer requisição POST para o webhook
-        response = requests.post(
-            WEBHOOK_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
+    sucesso = True
+    for subscriber in subscribers:
+        try:
+            # Preparar dados para o destino
+            payload = subscriber.build_payload(cupom_data)
+            
+            # Log dos dados que serão enviados
+            logger.info(f"Enviando para webhook {subscriber.nome}: {json.dumps(payload)}")
+            
+            ok, erro = _post_webhook(subscriber, payload, webhook_idempotency_key(cupom_data["codigo"], subscriber.nome))
+            if not ok:
+                logger.error(f"Erro no webhook {subscriber.nome}: {erro}")
+                sucesso = False
+                
+        except Exception as e:
+            logger.error(f"Exceção ao enviar webhook {subscriber.nome}: {str(e)}")
+            sucesso = False
+    return sucesso
+
+def send_batch_to_webhook(cupons_data):
+    """
+    Envia vários cupons diretamente para todos os destinos do webhook
+    
+    Destinos em modo digest recebem os cupons agrupados em POSTs com até
+    digest_max_itens itens; os demais recebem um POST por cupom.
+    
+    Returns:
+        list: Códigos aceitos por todos os destinos
+    """
+    falhas = set()
+    for subscriber in subscribers:
+        tamanho = subscriber.digest_max_itens if subscriber.digest else 1
+        for inicio in range(0, len(cupons_data), tamanho):
+            grupo = cupons_data[inicio:inicio + tamanho]
+            codigos = [cupom["codigo"] for cupom in grupo]
+            try:
+                payloads = [subscriber.build_payload(cupom) for cupom in grupo]
+                chaves = [webhook_idempotency_key(codigo, subscriber.nome) for codigo in codigos]
+                if subscriber.digest:
+                    ok, erro = _post_webhook(subscriber, build_digest_payload(payloads), digest_idempotency_key(chaves))
+                else:
+                    ok, erro = _post_webhook(subscriber, payloads[0], chaves[0])
+            except Exception as e:
+                ok, erro = False, str(e)
+                
+            if not ok:
+                logger.error(f"Erro no webhook {subscriber.nome} ao enviar {', '.join(codigos)}: {erro}")
+                falhas.update(codigos)
+    return [cupom["codigo"] for cupom in cupons_data if cupom["codigo"] not in falhas]
+
+async def send_to_webhook_async(cupom_data):
+    """
+    Versão assíncrona de send_to_webhook: os destinos recebem o cupom em paralelo
+    
+    Returns:
+        bool: True se todos os destinos aceitaram o envio, False caso contrário
+    """
+    async def enviar(subscriber):
+        try:
+            payload = subscriber.build_payload(cupom_data)
+            logger.info(f"Enviando para webhook {subscriber.nome}: {json.dumps(payload)}")
+            ok, erro = await _post_webhook_async(subscriber, payload, webhook_idempotency_key(cupom_data["codigo"], subscriber.nome))
+        except Exception as e:
+            ok, erro = False, str(e)
+        if not ok:
+            logger.error(f"Erro no webhook {subscriber.nome}: {erro}")
+        return ok
         
-        # Verificar se houve sucesso (2xx)
-        if response.status_code >= 200 and response.status_code < 300:
-            logger.info(f"Webhook enviado com sucesso: {response.status_code}")
-            return True
-        else:
-            logger.error(f"Erro no webhook: {response.status_code} - {response.text}")
-            return False
+    resultados = await asyncio.gather(*(enviar(subscriber) for subscriber in subscribers))
+    return all(resultados)
+
+async def send_batch_to_webhook_async(cupons_data):
+    """
+    Versão assíncrona de send_batch_to_webhook
+    
+    Os POSTs são feitos em paralelo, com até max_in_flight chamadas em andamento
+    por destino.
+    
+    Returns:
+        list: Códigos aceitos por todos os destinos
+    """
+    falhas = set()
+    
+    async def enviar(subscriber, limite, grupo):
+        codigos = [cupom["codigo"] for cupom in grupo]
+        async with limite:
+            try:
+                payloads = [subscriber.build_payload(cupom) for cupom in grupo]
+                chaves = [webhook_idempotency_key(codigo, subscriber.nome) for codigo in codigos]
+                if subscriber.digest:
+                    ok, erro = await _post_webhook_async(subscriber, build_digest_payload(payloads), digest_idempotency_key(chaves))
+                else:
+                    ok, erro = await _post_webhook_async(subscriber, payloads[0], chaves[0])
+            except Exception as e:
+                ok, erro = False, str(e)
+                
+        if not ok:
+            logger.error(f"Erro no webhook {subscriber.nome} ao enviar {', '.join(codigos)}: {erro}")
+            falhas.update(codigos)
             
-    except Exception as e:
-        logger.error(f"Exceção ao enviar webhook: {str(e)}")
-        return False 
+    envios = []
+    for subscriber in subscribers:
+        limite = asyncio.Semaphore(subscriber.max_in_flight)
+        tamanho = subscriber.digest_max_itens if subscriber.digest else 1
+        for inicio in range(0, len(cupons_data), tamanho):
+            envios.append(enviar(subscriber, limite, cupons_data[inicio:inicio + tamanho]))
+    await asyncio.gather(*envios)
+    return [cupom["codigo"] for cupom in cupons_data if cupom["codigo"] not in falhas]
+
+def enqueue_cupom(cupom_data):
+    """
+    Coloca o cupom na fila persistente de entregas de cada destino do webhook
+    
+    A entrega é feita em segundo plano pelo worker de cada destino, com novas
+    tentativas em caso de falha; o cupom é marcado como enviado quando todos os
+    destinos confirmarem.
+    
+    Returns:
+        int: Quantidade de destinos em cuja fila o cupom ficou pendente (0 se nenhum).
+        Destinos que já receberam o cupom não contam
+    """
+    enfileirados = 0
+    for subscriber in subscribers:
+        try:
+            queued = enqueue_webhook(
+                cupom_data["codigo"],
+                subscriber.nome,
+                subscriber.build_payload(cupom_data),
+                webhook_idempotency_key(cupom_data["codigo"], subscriber.nome)
+            )
+        except Exception as e:
+            logger.error(f"Erro ao enfileirar cupom {cupom_data.get('codigo')} para o webhook {subscriber.nome}: {str(e)}")
+            queued = False
+            
+        if queued:
+            outbox_dispatchers[subscriber.nome].wake()
+            enfileirados += 1
+    return enfileirados
+
+def _backoff_delay(tentativa):
+    """Espera exponencial com jitter antes da próxima tentativa"""
+    atraso = min(WEBHOOK_BACKOFF_BASE_SECONDS * (2 ** (tentativa - 1)), WEBHOOK_BACKOFF_MAX_SECONDS)
+    return atraso * random.uniform(0.5, 1.5)
+
+def _schedule_retry(subscriber, entrega, erro):
+    """Registra a falha de uma entrega e agenda a próxima tentativa"""
+    tentativa = entrega["tentativas"] + 1
+    if tentativa >= WEBHOOK_MAX_ATTEMPTS:
+        logger.error(f"Cupom {entrega['codigo']} não entregue ao webhook {subscriber.nome} após {tentativa} tentativas: {erro}")
+        mark_webhook_failed(entrega["id"], erro)
+    else:
+        atraso = _backoff_delay(tentativa)
+        logger.warning(f"Falha ao entregar cupom {entrega['codigo']} ao webhook {subscriber.nome} (tentativa {tentativa}), nova tentativa em {atraso:.0f}s: {erro}")
+        mark_webhook_failed(entrega["id"], erro, datetime.now() + timedelta(seconds=atraso))
+
+def _deliver(subscriber, entrega):
+    """Entrega um item da fila de um destino e registra o resultado"""
+    logger.info(f"Enviando para webhook {subscriber.nome} (fila): {json.dumps(entrega['payload'])}")
+    success, erro = _post_webhook(subscriber, entrega["payload"], entrega["idempotency_key"])
+    
+    if success:
+        mark_webhook_delivered(entrega["id"])
+        logger.info(f"Cupom {entrega['codigo']} entregue ao webhook {subscriber.nome}")
+        return True
+        
+    _schedule_retry(subscriber, entrega, erro)
+    return False
+
+def _deliver_digest(subscriber, entregas):
+    """Entrega um grupo de itens da fila em um único POST e registra o resultado de cada um"""
+    payload = build_digest_payload([entrega["payload"] for entrega in entregas])
+    codigos = ", ".join(entrega["codigo"] for entrega in entregas)
+    logger.info(f"Enviando digest com {len(entregas)} cupons para webhook {subscriber.nome}: {codigos}")
+    success, erro = _post_webhook(
+        subscriber,
+        payload,
+        digest_idempotency_key([entrega["idempotency_key"] for entrega in entregas])
+    )
+    
+    # Uma única transação para registrar o resultado de todo o grupo
+    with session_scope():
+        for entrega in entregas:
+            if success:
+                mark_webhook_delivered(entrega["id"])
+            else:
+                _schedule_retry(subscriber, entrega, erro)
+    if success:
+        logger.info(f"Digest entregue ao webhook {subscriber.nome}: {codigos}")
+        return len(entregas)
+    return 0
+
+class WebhookOutboxDispatcher:
+    """
+    Worker em segundo plano que consome a fila persistente de um destino do webhook
+    
+    Cada destino tem o seu worker, então um destino lento ou fora do ar não atrasa
+    os demais. Mantém no máximo max_in_flight entregas simultâneas. A entrega é "pelo menos uma
+    vez": se o processo cair após o POST e antes de registrar o sucesso, o item é
+    reenviado com a mesma chave de idempotência quando a reserva expirar.
+    """
+    
+    def __init__(self, subscriber, poll_seconds, lease_seconds):
+        self.subscriber = subscriber
+        self.max_in_flight = subscriber.max_in_flight
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._slots = threading.Semaphore(self.max_in_flight)
+        self._thread = None
+        self._executor = None
+        # Próxima espera do loop e horário do último digest enviado (modo digest)
+        self._espera = poll_seconds
+        self._ultimo_digest = 0.0
+        
+    def wake(self):
+        """Acorda o worker para processar entregas recém-enfileiradas"""
+        self._wake_event.set()
+        
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix=f"webhook-{self.subscriber.nome}")
+        self._thread = threading.Thread(target=self._run, name=f"webhook-outbox-{self.subscriber.nome}", daemon=True)
+        self._thread.start()
+        logger.info(f"Fila do webhook {self.subscriber.nome} iniciada ({self.max_in_flight} entregas simultâneas)")
+        
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        logger.info(f"Fila do webhook {self.subscriber.nome} encerrada")
+        
+    def _release_slot(self, future):
+        self._slots.release()
+        self._wake_event.set()
+        
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            self._espera = self.poll_seconds
+            try:
+                if self.subscriber.digest:
+                    self._dispatch_digest()
+                else:
+                    self._dispatch_available()
+            except Exception as e:
+                logger.error(f"Erro no worker da fila do webhook {self.subscriber.nome}: {str(e)}")
+            self._wake_event.wait(self._espera)
+            
+    def _dispatch_digest(self):
+        """
+        Envia os itens prontos agrupados em digests
+        
+        Fora de rajadas o item sai assim que chega. Se um digest foi enviado há menos
+        de digest_janela segundos, espera a janela fechar (ou juntar digest_max_itens
+        itens) antes de enviar o próximo.
+        """
+        janela = self.subscriber.digest_janela
+        max_itens = self.subscriber.digest_max_itens
+        while not self._stop_event.is_set():
+            restante = self._ultimo_digest + janela - time.monotonic()
+            if restante > 0 and count_ready_webhook_deliveries(self.subscriber.nome) < max_itens:
+                self._espera = min(restante, self.poll_seconds)
+                return
+            if not self._slots.acquire(blocking=False):
+                return
+                
+            entregas = claim_webhook_deliveries(self.subscriber.nome, max_itens, self.lease_seconds)
+            if not entregas:
+                self._slots.release()
+                return
+                
+            self._ultimo_digest = time.monotonic()
+            future = self._executor.submit(_deliver_digest, self.subscriber, entregas)
+            future.add_done_callback(self._release_slot)
+            
+    def _dispatch_available(self):
+        """Reserva e envia entregas enquanto houver itens prontos e vagas livres"""
+        while not self._stop_event.is_set():
+            livres = 0
+            while livres < self.max_in_flight and self._slots.acquire(blocking=False):
+                livres += 1
+            if not livres:
+                return
+                
+            entregas = claim_webhook_deliveries(self.subscriber.nome, livres, self.lease_seconds)
+            for _ in range(livres - len(entregas)):
+                self._slots.release()
+            if not entregas:
+                return
+                
+            for entrega in entregas:
+                future = self._executor.submit(_deliver, self.subscriber, entrega)
+                future.add_done_callback(self._release_slot)
+                
+    def drain(self):
+        """Entrega de forma síncrona tudo o que estiver pronto (uso fora do servidor)"""
+        total = 0
+        if self.subscriber.digest:
+            while True:
+                entregas = claim_webhook_deliveries(self.subscriber.nome, self.subscriber.digest_max_itens, self.lease_seconds)
+                if not entregas:
+                    return total
+                total += _deliver_digest(self.subscriber, entregas)
+                
+        while True:
+            entregas = claim_webhook_deliveries(self.subscriber.nome, self.max_in_flight, self.lease_seconds)
+            if not entregas:
+                return total
+            with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+                resultados = executor.map(lambda entrega: _deliver(self.subscriber, entrega), entregas)
+                total += sum(1 for ok in resultados if ok)
+
+subscribers = _load_subscribers()
+
+outbox_dispatchers = {
+    subscriber.nome: WebhookOutboxDispatcher(
+        subscriber,
+        poll_seconds=WEBHOOK_POLL_SECONDS,
+        lease_seconds=WEBHOOK_LEASE_SECONDS
+    )
+    for subscriber in subscribers
+}
+
+def start_outbox_dispatchers():
+    for dispatcher in outbox_dispatchers.values():
+        dispatcher.start()
+
+def stop_outbox_dispatchers():
+    for dispatcher in outbox_dispatchers.values():
+        dispatcher.stop()
+
+def drain_outbox():
+    """Entrega de forma síncrona o que estiver pronto em todos os destinos"""
+    return sum(dispatcher.drain() for dispatcher in outbox_dispatchers.values())